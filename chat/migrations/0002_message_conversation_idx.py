@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', 'date_created'], name='message_conversation_idx'),
+        ),
+    ]
@@ -13,3 +13,8 @@ class Message(models.Model):
     class Meta:
         # by default order by date_created (ASC)
         ordering = ('date_created',)
+        indexes = [
+            # the messages between two users are read from both directions of the conversation
+            models.Index(fields=['sender', 'receiver', 'date_created'],
+                         name='message_conversation_idx'),
+        ]
@@ -0,0 +1,41 @@
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from unittest import skipUnless
+
+from ..model_factories import *
+from social_media.tests.test_query_plans import QueryPlanTestMixin
+
+USER_PASSWORD = 'Asdf1234'
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the query plans are those of SQLite')
+class MessageQueryPlanTest(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+        Message.objects.create(sender=self.user1, receiver=self.user2)
+        Message.objects.create(sender=self.user2, receiver=self.user1)
+        Message.objects.create(sender=self.user1, receiver=self.user3)
+
+        # log user1 in
+        self.client.login(email=self.user1.email, password=USER_PASSWORD)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Message.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def test_messageHistoryUsesConversationIndex(self):
+        url = reverse('chat_room', kwargs={'chat_target_id': self.user2.pk})
+
+        # the messages are read from both directions of the conversation, so they are sorted after being merged
+        self.assertQueryPlan(lambda: self.client.get(url), Message, 'message_conversation_idx', allow_sort=True)
@@ -3,7 +3,9 @@ from django.http import HttpResponseBadRequest
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 
-from social_media.models import UserRelationship, AppUser
+from social_media.models import AppUser
+from social_media.graph import are_friends
+from social_media.images import get_derivative_url, AVATAR_SIZE
 from .models import Message
 
 
@@ -27,7 +29,7 @@ def chat_room(request, chat_target_id):
 
     context = {}
     # check if the app user and target user are friends
-    if UserRelationship.objects.filter(user1__pk=user1_pk, user2__pk=user2_pk, relation_type='friends').exists():
+    if are_friends(user1_pk, user2_pk):
         context['room_name'] = create_room_name(user1_pk, user2_pk)
 
         # get message history
@@ -39,11 +41,11 @@ def chat_room(request, chat_target_id):
             message_list.append({
                 'content': message.content,
                 'sender': {
-                    'profile_image_path': message.sender.profile_image.url,
+                    'profile_image_path': get_derivative_url(message.sender.profile_image, AVATAR_SIZE),
                     'username': message.sender.username
                 },
                 'receiver': {
-                    'profile_image_path': message.receiver.profile_image.url,
+                    'profile_image_path': get_derivative_url(message.receiver.profile_image, AVATAR_SIZE),
                     'username': message.receiver.username
                 },
                 'date_created': message.date_created
@@ -55,7 +57,7 @@ def chat_room(request, chat_target_id):
         target_user = AppUser.objects.get(pk=chat_target_id)
         context['target_user'] = {
             'username': target_user.username,
-            'profile_image_path': target_user.profile_image.url
+            'profile_image_path': get_derivative_url(target_user.profile_image, AVATAR_SIZE)
         }
 
     else:
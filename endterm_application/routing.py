@@ -1,7 +1,13 @@
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
+from django.core.asgi import get_asgi_application
+from social_media.media_server import StaticFilesApp
 import chat.routing
+import social_media.routing
 
 application = ProtocolTypeRouter({
-   'websocket': AuthMiddlewareStack(URLRouter(chat.routing.websocket_urlpatterns))
-})
\ No newline at end of file
+   # uploaded and static files are served without going through Django
+   'http': StaticFilesApp(get_asgi_application()),
+   # feed routes go first because the chat route matches any ws/<room_name>/
+   'websocket': AuthMiddlewareStack(URLRouter(social_media.routing.websocket_urlpatterns + chat.routing.websocket_urlpatterns))
+})
@@ -141,6 +141,9 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static_cdn')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media_cdn')
+# uploads are written here while they are received and then renamed into MEDIA_ROOT,
+# so it must be on the same file system as MEDIA_ROOT but must not be served
+MEDIA_TEMP_ROOT = os.path.join(BASE_DIR, 'media_tmp')
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
@@ -165,4 +168,66 @@ CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels.layers.InMemoryChannelLayer"
     }
-}
\ No newline at end of file
+}
+
+# number of posts in a page of the home feed
+FEED_PAGE_SIZE = 10
+
+# engine that assembles the home feed:
+# 'timeline' reads the materialized timelines, 'merge' merges the newest posts of each friend
+FEED_ENGINE = 'timeline'
+
+# number of posts read per friend at a time by the 'merge' feed engine
+FEED_AUTHOR_WINDOW = 5
+
+# number of posts in a page of a user's post list
+POST_LIST_PAGE_SIZE = 20
+
+# posts of users with more friends than this are pulled into the home feed at read time
+# instead of being pushed into the timelines of all of their friends
+FEED_HIGH_DEGREE_THRESHOLD = 1000
+
+# seconds during which the friend graph of a process may not see the friendships changed
+# by other processes, so the friendship events are not read on every lookup
+FRIEND_GRAPH_SYNC_INTERVAL = 0.5
+
+# seconds after which the friendship events are deleted by the prune_friendship_events command,
+# a friend graph that was not synced for that long is rebuilt instead
+FRIENDSHIP_EVENT_RETENTION = 24 * 60 * 60
+
+# number of users in a page of the friend list of a user
+FRIEND_LIST_PAGE_SIZE = 50
+
+# number of users in a page of the mutual friends of two users
+MUTUAL_FRIEND_PAGE_SIZE = 20
+
+# number of friend recommendations stored per user
+FRIEND_RECOMMENDATION_COUNT = 20
+
+# days after which a friendship counts half as much when scoring friend recommendations
+FRIEND_RECOMMENDATION_HALF_LIFE = 30
+
+# maximum number of users whose relationship with the app user is looked up in one request
+RELATIONSHIP_STATUS_MAX_USERS = 500
+
+# longest side (in pixels) of the resized copies generated for uploaded images
+IMAGE_DERIVATIVE_SIZES = [96, 320, 960]
+
+# widths (in pixels) of the copies of post images offered to browsers through srcset
+IMAGE_SRCSET_WIDTHS = [320, 640, 960, 1280, 1920]
+
+# uploaded images are shrunk to fit this size (in pixels) by the image job worker
+IMAGE_MAX_SIZE = 2048
+
+# seconds after which a running image job is considered abandoned and is run again
+IMAGE_JOB_TIMEOUT = 600
+
+# number of times an image job is tried before it is marked as failed
+IMAGE_JOB_MAX_ATTEMPTS = 3
+
+# uploaded images over these limits are rejected before they are decoded
+IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+IMAGE_MAX_PIXELS = 50000000
+
+# seconds that browsers may cache the uploaded files named by the hash of their content
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60
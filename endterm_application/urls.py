@@ -14,9 +14,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf.urls.static import static
 from django.conf import settings
+import re
+
+from social_media.views import serve_media
 
 urlpatterns = [
     path('', include('social_media.urls')),
@@ -24,7 +27,13 @@ urlpatterns = [
     path('admin/', admin.site.urls),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# uploaded files are only served by Django during development, in production they are
+# served by StaticFilesApp under ASGI or by the web server in front of the WSGI app
+media_urlpatterns = [re_path(r'^{}(?P<path>.*)$'.format(re.escape(settings.MEDIA_URL.lstrip('/'))),
+                             serve_media, name='media')]
+
+if settings.DEBUG:
+    urlpatterns += media_urlpatterns
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 urlpatterns += [path('api-auth/', include('rest_framework.urls'))]
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import AppUser, UserRelationship, Post
+from .models import AppUser, UserRelationship, Post, TimelineEntry, ImageJob
 
 # add new section to the interface
 UserAdmin.fieldsets += ('other fields', {'fields': ('profile_image',)}),
@@ -8,3 +8,5 @@ UserAdmin.fieldsets += ('other fields', {'fields': ('profile_image',)}),
 admin.site.register(AppUser, UserAdmin)
 admin.site.register(UserRelationship)
 admin.site.register(Post)
+admin.site.register(TimelineEntry)
+admin.site.register(ImageJob)
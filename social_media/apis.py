@@ -1,47 +1,231 @@
+from django.db import transaction
 from django.db.models import Q
-from django.http import Http404
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from urllib.parse import urlencode
+import bisect
+import json
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import generics, status, permissions
 
-from .models import UserRelationship, AppUser, Post
+from .models import AppUser, Post
 from .forms import PostForm
-from .serializers import AppUserSerializer, FriendListSerializer, PostSerializer
+from .uploads import HashingFileUploadHandler
+from .serializers import AppUserSerializer, FriendListSerializer, FriendRecommendationSerializer, UserPostSerializer
+from .consumers import push_post_to_friends
+from .images import get_derivative_url, get_srcset, get_image_sizes, AVATAR_SIZE, POST_IMAGE_SIZE
+from .feed import (InvalidCursor,
+                   encode_cursor,
+                   decode_cursor,
+                   filter_after_cursor,
+                   get_feed_page,
+                   get_new_feed_posts,
+                   get_post_data)
+from .graph import get_mutual_friend_ids
+from .recommendations import get_recommendations
+from .relationships import (send_friend_request,
+                            cancel_friend_request,
+                            accept_friend_request,
+                            decline_friend_request,
+                            remove_friend,
+                            get_relationship_statuses,
+                            get_friend_page)
+
+
+def get_requested_user_id(data):
+    '''
+    Return the user ID given in the request data, None if it is missing or not a number
+    '''
+    try:
+        return int(data.get('id', None))
+    except (TypeError, ValueError):
+        return None
 
 
-def determine_user1_and_user2_in_user_relationship(user1, user2):
-    '''Determine which user should be the user1 and which should be the user2.
+def get_feed_posts_data(posts):
+    '''
+    Return the data of a list of feed posts with the date formatted for display
+    '''
+    data = []
+    for post in posts:
+        post_data = get_post_data(post)
+        post_data['post_date_created'] = post.date_created.strftime(
+            "%Y-%m-%d %H:%M")
+        data.append(post_data)
 
-    Current logic:
+    return data
 
-    user1 = user with smaller pk
 
-    user2 = user with larger pk
+def stream_user_posts(posts, request):
     '''
-    if user1.pk < user2.pk:
-        return (user1, user2)
-    else:
-        return (user2, user1)
+    Yield a JSON array of posts one serialized post at a time
+    '''
+    yield '['
+    for index, post in enumerate(posts):
+        if index > 0:
+            yield ','
+        yield json.dumps(UserPostSerializer(post, context={'request': request}).data)
+    yield ']'
 
 
-class UserPostList(generics.ListAPIView):
+class UserPostList(APIView):
     '''
-    Return a list of posts that belongs to a user given username.
+    Return a page of posts that belongs to a user given username and an optional cursor.
+    The URL of the next page is in the Link header.
     '''
-    serializer_class = PostSerializer
-    lookup_field = 'username'
 
-    def get_queryset(self):
-        username = self.kwargs['username']
+    def get(self, request, username):
+        cursor = request.GET.get('cursor', None)
+        page_size = settings.POST_LIST_PAGE_SIZE
+
+        # only select the columns that are serialized
+        posts = Post.objects.filter(owner__username=username).only(
+            'image', 'image_state', 'image_width', 'image_height', 'image_color', 'image_placeholder',
+            'image_srcset_widths', 'image_derivative_sizes', 'text', 'date_created').order_by('-date_created', '-pk')
+
+        if cursor:
+            try:
+                posts = posts.filter(
+                    filter_after_cursor(decode_cursor(cursor), 'pk'))
+            except InvalidCursor:
+                return Response({'detail': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # fetch one extra post to find out if there is a next page
+        posts = list(posts[:page_size + 1])
+        next_cursor = None
+        if len(posts) > page_size:
+            posts = posts[:page_size]
+            next_cursor = encode_cursor(posts[-1].date_created, posts[-1].pk)
+
+        response = StreamingHttpResponse(stream_user_posts(
+            posts, request), content_type='application/json')
+        if next_cursor:
+            next_url = request.build_absolute_uri(
+                '?' + urlencode({'cursor': next_cursor}))
+            response['Link'] = '<{}>; rel="next"'.format(next_url)
+
+        return response
+
+
+class MutualFriendList(APIView):
+    '''
+    Return the number of friends the app user has in common with a user given username,
+    and a page of them ordered by id given an optional cursor (the id of the last user of the previous page)
+    '''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, username):
+        app_user = request.user
+
+        try:
+            requested_user = AppUser.objects.only('pk').get(username=username)
+        except AppUser.DoesNotExist:
+            raise Http404
+
+        try:
+            cursor = int(request.GET.get('cursor', 0))
+        except ValueError:
+            return Response({'detail': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        mutual_friend_ids = get_mutual_friend_ids(app_user.pk, requested_user.pk)
 
-        posts = Post.objects.filter(
-            owner__username=username).order_by('-date_created')
-        
-        # reformat the date_created field
-        for post in posts:
-            post.date_created = post.date_created.strftime("%Y-%m-%d %H:%M")
+        # the ids are sorted, so the page starts right after the cursor
+        start = bisect.bisect_right(mutual_friend_ids, cursor)
+        page_ids = mutual_friend_ids[start:start + settings.MUTUAL_FRIEND_PAGE_SIZE]
+        next_cursor = None
+        if start + len(page_ids) < len(mutual_friend_ids):
+            next_cursor = page_ids[-1]
 
-        return posts
+        friends = AppUser.objects.filter(pk__in=page_ids).only(
+            'username', 'profile_image', 'profile_image_derivative_sizes').order_by('pk')
+
+        return Response({
+            'count': len(mutual_friend_ids),
+            'data': FriendListSerializer(friends, many=True, context={'request': request}).data,
+            'next_cursor': next_cursor,
+        }, status=status.HTTP_200_OK)
+
+
+class RelationshipStatusList(APIView):
+    '''
+    Return the relationship of the app user with each of the users given a comma separated list of ids:
+    'friends', 'sender', 'receiver' or 'not_friend'
+    '''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        app_user = request.user
+
+        try:
+            user_ids = {int(user_id) for user_id in request.GET.get('ids', '').split(',') if user_id}
+        except ValueError:
+            return Response({'detail': 'Invalid ids.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(user_ids) > settings.RELATIONSHIP_STATUS_MAX_USERS:
+            return Response({'detail': 'Too many ids, the maximum is {}.'.format(settings.RELATIONSHIP_STATUS_MAX_USERS)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # the app user has no relationship with itself, ids of missing users are reported as 'not_friend'
+        user_ids.discard(app_user.pk)
+        statuses = get_relationship_statuses(app_user.pk, sorted(user_ids))
+
+        return Response({'data': statuses}, status=status.HTTP_200_OK)
+
+
+class FriendRecommendationList(APIView):
+    '''
+    Return the precomputed friend recommendations of the app user, best first
+    '''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        recommendations = get_recommendations(request.user)
+
+        return Response({'data': FriendRecommendationSerializer(
+            recommendations, many=True, context={'request': request}).data}, status=status.HTTP_200_OK)
+
+
+class FeedList(APIView):
+    '''
+    Return a page of posts from the home feed of the app user given an optional cursor
+    '''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        app_user = request.user
+        cursor = request.GET.get('cursor', None)
+
+        try:
+            posts, next_cursor = get_feed_page(app_user, cursor)
+        except InvalidCursor:
+            return Response({'detail': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'data': get_feed_posts_data(posts), 'next_cursor': next_cursor}, status=status.HTTP_200_OK)
+
+
+class NewFeedPostList(APIView):
+    '''
+    Return the posts from the home feed of the app user that are newer than the given cursor
+    together with the number of new posts
+    '''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        app_user = request.user
+        cursor = request.GET.get('since', None)
+
+        try:
+            posts, new_count, latest_cursor = get_new_feed_posts(
+                app_user, cursor)
+        except InvalidCursor:
+            return Response({'detail': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'data': get_feed_posts_data(posts),
+            'new_count': new_count,
+            'latest_cursor': latest_cursor
+        }, status=status.HTTP_200_OK)
 
 
 class CreatePost(APIView):
@@ -50,6 +234,11 @@ class CreatePost(APIView):
     '''
     permission_classes = [permissions.IsAuthenticated]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # the handler has to be installed before the authentication reads the body for the CSRF check
+        request.upload_handlers.insert(0, HashingFileUploadHandler(request))
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
         app_user = request.user
         payload = {}
@@ -58,17 +247,32 @@ class CreatePost(APIView):
             # create the instance if the input is valid
             post = post_form.save(commit=False)
             post.owner = app_user
-            post.save()
+            # the post and its timeline entries are inserted in one transaction
+            with transaction.atomic():
+                post.save()
 
             payload['response_msg'] = 'Post created.'
             # return post data
             payload['data'] = {
                 'owner_username': post.owner.username,
-                'owner_profile_image_path': post.owner.profile_image.url,
+                'owner_profile_image_path': get_derivative_url(post.owner.profile_image, AVATAR_SIZE),
                 'post_text': post.text,
-                'post_image_path': None if post_form.cleaned_data['image'] is None else post.image.url,
+                'post_image_path': get_derivative_url(post.image, POST_IMAGE_SIZE),
+                'post_image_width': post.image_width,
+                'post_image_height': post.image_height,
+                'post_image_color': post.image_color,
+                'post_image_placeholder': post.image_placeholder,
+                'post_image_srcset': get_srcset(post.image, post.image_srcset_widths),
+                'post_image_webp_srcset': get_srcset(post.image, post.image_srcset_widths, 'webp'),
+                'post_image_sizes': get_image_sizes(post.image_width, post.image_height),
+                # the image is resized in the background, 'pending' until it is done
+                'post_image_state': post.image_state,
                 'post_date_created': post.date_created.strftime("%Y-%m-%d %H:%M")
             }
+
+            # push the new post to the friends who have their feed open
+            push_post_to_friends(post, payload['data'])
+
             return Response(payload, status=status.HTTP_201_CREATED)
         else:
             payload['response_msg'] = post_form.errors
@@ -83,38 +287,18 @@ class SendFriendRequest(APIView):
 
     def post(self, request):
         app_user = request.user
-
-        data = request.data
-        requested_user_id = data.get('id', None)
+        requested_user_id = get_requested_user_id(request.data)
 
         # check if required data exists
-        if not requested_user_id:
+        if requested_user_id is None:
             return Response({'detail': 'Invalid request.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # check if the requested_user exist
-        requested_user = None
-        try:
-            # exclude the app_user because app_user cannot be the requested_user
-            requested_user = AppUser.objects.exclude(
-                pk=app_user.pk).get(pk=requested_user_id)
-        except AppUser.DoesNotExist:
-            # invalid requested_user_id
-            return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # determine user1 and user2 in UserRelationship
-        user1, user2 = determine_user1_and_user2_in_user_relationship(
-            app_user, requested_user)
-
-        # check if the relationship between user1 and user2 already exist
-        if not UserRelationship.objects.filter(user1=user1, user2=user2).exists():
-            new_relationship = UserRelationship(
-                user1=user1, user2=user2, relation_type='pending_user1_user2' if app_user.pk == user1.pk else 'pending_user2_user1')
-            new_relationship.save()
-
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        else:
+        # fails if the user does not exist or the users already have a relationship
+        if not send_friend_request(app_user.pk, requested_user_id):
             return Response({'detail': 'Invalid request.'}, status=status.HTTP_400_BAD_REQUEST)
 
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class CancelFriendRequest(APIView):
     '''
@@ -124,37 +308,17 @@ class CancelFriendRequest(APIView):
 
     def post(self, request):
         app_user = request.user
-        data = request.data
-        requested_user_id = data.get('id', None)
+        requested_user_id = get_requested_user_id(request.data)
 
         # check if required data exists
-        if not requested_user_id:
+        if requested_user_id is None:
             return Response({'detail': 'Invalid request.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # check if the requested_user exist
-        requested_user = None
-        try:
-            # exclude the app_user because app_user cannot be the requested_user
-            requested_user = AppUser.objects.exclude(
-                pk=app_user.pk).get(pk=requested_user_id)
-        except AppUser.DoesNotExist:
-            # invalid requested_user_id
+        # fails unless the app user sent the user a friend request that is still pending
+        if not cancel_friend_request(app_user.pk, requested_user_id):
             return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # determine user1 and user2 in UserRelationship
-        user1, user2 = determine_user1_and_user2_in_user_relationship(
-            app_user, requested_user)
-
-        try:
-            # if the relationship is valid (current user is the friend request sender)
-            relationship = UserRelationship.objects.get(
-                user1=user1, user2=user2, relation_type='pending_user1_user2' if app_user.pk == user1.pk else 'pending_user2_user1')
-            relationship.delete()
-
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except UserRelationship.DoesNotExist:
-            # if the relationship is not found
-            return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class AcceptFriendRequest(APIView):
@@ -165,38 +329,17 @@ class AcceptFriendRequest(APIView):
 
     def post(self, request):
         app_user = request.user
-        data = request.data
-        requested_user_id = data.get('id', None)
+        requested_user_id = get_requested_user_id(request.data)
 
         # check if required data exists
-        if not requested_user_id:
+        if requested_user_id is None:
             return Response({'detail': 'Invalid request.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # check if the requested_user exist
-        requested_user = None
-        try:
-            # exclude the app_user because app_user cannot be the requested_user
-            requested_user = AppUser.objects.exclude(
-                pk=app_user.pk).get(pk=requested_user_id)
-        except AppUser.DoesNotExist:
-            # invalid requested_user_id
+        # fails unless the user sent the app user a friend request that is still pending
+        if not accept_friend_request(app_user.pk, requested_user_id):
             return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # determine user1 and user2 in UserRelationship
-        user1, user2 = determine_user1_and_user2_in_user_relationship(
-            app_user, requested_user)
-
-        try:
-            # if the relationship is valid (current user is the friend request receiver)
-            relationship = UserRelationship.objects.get(
-                user1=user1, user2=user2, relation_type='pending_user2_user1' if app_user.pk == user1.pk else 'pending_user1_user2')
-            # accept the friend request
-            relationship.accept_friend_request()
-
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except UserRelationship.DoesNotExist:
-            # if the relationship is not found
-            return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class DeclineFriendRequest(APIView):
@@ -207,37 +350,17 @@ class DeclineFriendRequest(APIView):
 
     def post(self, request):
         app_user = request.user
-        data = request.data
-        requested_user_id = data.get('id', None)
+        requested_user_id = get_requested_user_id(request.data)
 
         # check if required data exists
-        if not requested_user_id:
+        if requested_user_id is None:
             return Response({'detail': 'Invalid request.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # check if the requested_user exist
-        requested_user = None
-        try:
-            # exclude the app_user because app_user cannot be the requested_user
-            requested_user = AppUser.objects.exclude(
-                pk=app_user.pk).get(pk=requested_user_id)
-        except AppUser.DoesNotExist:
-            # invalid requested_user_id
+        # fails unless the user sent the app user a friend request that is still pending
+        if not decline_friend_request(app_user.pk, requested_user_id):
             return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # determine user1 and user2 in UserRelationship
-        user1, user2 = determine_user1_and_user2_in_user_relationship(
-            app_user, requested_user)
-
-        try:
-            # if the relationship is valid (current user is the friend request receiver)
-            relationship = UserRelationship.objects.get(
-                user1=user1, user2=user2, relation_type='pending_user2_user1' if app_user.pk == user1.pk else 'pending_user1_user2')
-            relationship.delete()
-
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except UserRelationship.DoesNotExist:
-            # if the relationship is not found
-            return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class RemoveFriend(APIView):
@@ -248,37 +371,17 @@ class RemoveFriend(APIView):
 
     def post(self, request):
         app_user = request.user
-        data = request.data
-        requested_user_id = data.get('id', None)
+        requested_user_id = get_requested_user_id(request.data)
 
         # check if required data exists
-        if not requested_user_id:
+        if requested_user_id is None:
             return Response({'detail': 'Invalid request.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # check if the requested_user exist
-        requested_user = None
-        try:
-            # exclude the app_user because app_user cannot be the requested_user
-            requested_user = AppUser.objects.exclude(
-                pk=app_user.pk).get(pk=requested_user_id)
-        except AppUser.DoesNotExist:
-            # invalid requested_user_id
+        # fails unless the app user and the user are friends
+        if not remove_friend(app_user.pk, requested_user_id):
             return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # determine user1 and user2 in UserRelationship
-        user1, user2 = determine_user1_and_user2_in_user_relationship(
-            app_user, requested_user)
-
-        try:
-            # if the relationship is valid (current user and requested user are friends)
-            relationship = UserRelationship.objects.get(
-                user1=user1, user2=user2, relation_type='friends')
-            relationship.delete()
-
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except UserRelationship.DoesNotExist:
-            # if the relationship is not found
-            return Response({'detail': 'Invalid request Id.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 ############# NOT USED ######################
@@ -309,39 +412,29 @@ class UserSearchList(generics.ListAPIView):
             raise Http404
 
 
-class FriendList(generics.ListAPIView):
+class FriendList(APIView):
     '''
-    Return a list of users which has relationship with type 'friends' with the user given user ID
+    Return a page of the users which has relationship with type 'friends' with the user given username,
+    sorted by username. The page starts after the username given as cursor, or at the first username
+    that is not before the one given as from, and the link to the next page is in the Link header.
     '''
-    serializer_class = FriendListSerializer
     permission_classes = [permissions.IsAuthenticated]
-    lookup_field = 'username'
-
-    def get_queryset(self):
-        requested_username = self.kwargs['username']
-        app_user = self.request.user
 
-        requested_user = None
+    def get(self, request, username):
         # get the requested user
         try:
-            requested_user = AppUser.objects.get(username=requested_username)
+            requested_user = AppUser.objects.only('pk').get(username=username)
         except AppUser.DoesNotExist:
             raise Http404
 
-        friends = []
-
-        # get all relationships related to the requested user
-        relationships = UserRelationship.objects.filter(
-            Q(user1=requested_user) | Q(user2=requested_user), relation_type='friends')
-
-        # filter and get a list of requested user's friends
-        for relationship in relationships:
-            if requested_user.pk == relationship.user1.pk:
-                friends.append(relationship.user2)
-            else:
-                friends.append(relationship.user1)
+        friends, next_cursor = get_friend_page(
+            requested_user.pk, cursor=request.GET.get('cursor'), start=request.GET.get('from'))
 
-        # sort friends by username
-        friends.sort(key=lambda x: x.username)
+        response = Response(FriendListSerializer(friends, many=True, context={'request': request}).data,
+                            status=status.HTTP_200_OK)
+        if next_cursor:
+            next_url = request.build_absolute_uri(
+                '?' + urlencode({'cursor': next_cursor}))
+            response['Link'] = '<{}>; rel="next"'.format(next_url)
 
-        return friends
+        return response
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SocialMediaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'social_media'
+
+    def ready(self):
+        # register the signal handlers that keep the timelines in sync
+        from . import signals
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+
+from .feed import get_friend_ids, get_high_degree_friend_ids, is_high_degree, encode_cursor
+from .graph import are_friends
+
+logger = logging.getLogger(__name__)
+
+
+def get_feed_group_name(user_id):
+    return 'feed_{}'.format(user_id)
+
+
+def get_author_group_name(user_id):
+    # the feeds of the friends of a high degree user listen to the user's posts
+    return 'feed_author_{}'.format(user_id)
+
+
+def push_post_to_friends(post, post_data):
+    '''
+    Push a newly created post to the feed of the owner's friends who are online.
+    Return the number of groups the post was sent to.
+    '''
+    channel_layer = get_channel_layer()
+    event = {
+        'type': 'feed_post',
+        'data': post_data,
+        'cursor': encode_cursor(post.date_created, post.pk)
+    }
+
+    # the post of a high degree user is sent once to the group its friends listen to,
+    # which keeps the request from waiting on thousands of pushes
+    if is_high_degree(post.owner_id):
+        event.update(type='feed_author_post', owner_id=post.owner_id)
+        async_to_sync(channel_layer.group_send)(get_author_group_name(post.owner_id), event)
+
+        logger.info('Pushed post %s to the friends of %s', post.pk, post.owner_id)
+        return 1
+
+    # a group only has channels while the friend has the home page open
+    friend_ids = get_friend_ids(post.owner_id)
+
+    async def send_all():
+        # the sends run concurrently, in one switch to the event loop
+        await asyncio.gather(*(channel_layer.group_send(get_feed_group_name(friend_id), event)
+                               for friend_id in friend_ids))
+
+    async_to_sync(send_all)()
+
+    logger.info('Pushed post %s to the feed of %s friends',
+                post.pk, len(friend_ids))
+    return len(friend_ids)
+
+
+class FeedConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        user = self.scope.get('user')
+
+        # only logged in users have a feed
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.user_id = user.pk
+        self.feed_group_name = get_feed_group_name(user.pk)
+        self.author_group_names = [get_author_group_name(friend_id) for friend_id in
+                                   await database_sync_to_async(get_high_degree_friend_ids)(user.pk)]
+
+        for group_name in [self.feed_group_name] + self.author_group_names:
+            await self.channel_layer.group_add(
+                group_name,
+                self.channel_name
+            )
+
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'feed_group_name'):
+            for group_name in [self.feed_group_name] + self.author_group_names:
+                await self.channel_layer.group_discard(
+                    group_name,
+                    self.channel_name
+                )
+
+    async def feed_post(self, event):
+        # each delivered post is a full feed reload that the user does not need
+        logger.info('Delivered post to %s', self.feed_group_name)
+
+        await self.send(text_data=json.dumps({
+            'data': event['data'],
+            'cursor': event['cursor']
+        }))
+
+    async def feed_author_post(self, event):
+        # the friendship may have been removed since the feed was opened
+        if not await database_sync_to_async(are_friends)(self.user_id, event['owner_id']):
+            return
+
+        await self.feed_post(event)
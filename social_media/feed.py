@@ -0,0 +1,389 @@
+import base64
+import heapq
+import itertools
+
+from django.conf import settings
+from django.db.models import Q, Exists, OuterRef
+from django.utils.dateparse import parse_datetime
+
+from .models import AppUser, UserRelationship, Post, TimelineEntry
+from .graph import get_friend_ids
+from .images import get_derivative_url, get_srcset, get_image_sizes, AVATAR_SIZE, POST_IMAGE_SIZE
+
+# number of authors whose first window of posts is read by one query of the 'merge' feed engine,
+# SQLite allows at most 500 selects in a compound select
+FEED_AUTHORS_PER_QUERY = 100
+
+
+def get_high_degree_friend_ids(user_id):
+    '''
+    Return a list of ids of the user's friends whose number of friends is above
+    FEED_HIGH_DEGREE_THRESHOLD. Posts of these users are pulled at read time instead
+    of being pushed into the timelines of all of their friends.
+    '''
+    # the few high degree users are read from the friend_count index and each one is looked up
+    # in the unique index of the relationships, so the cost does not depend on the number of friends
+    friendships = UserRelationship.objects.filter(relation_type='friends')
+    return list(AppUser.objects.filter(friend_count__gt=settings.FEED_HIGH_DEGREE_THRESHOLD).filter(
+        Exists(friendships.filter(user1_id=user_id, user2_id=OuterRef('pk'))) |
+        Exists(friendships.filter(user1_id=OuterRef('pk'), user2_id=user_id))).values_list('pk', flat=True))
+
+
+def update_friend_count(user_id):
+    '''
+    Recount the number of friends of the given user ID
+    '''
+    friend_count = UserRelationship.objects.filter(
+        Q(user1_id=user_id) | Q(user2_id=user_id), relation_type='friends').count()
+    AppUser.objects.filter(pk=user_id).update(friend_count=friend_count)
+
+    return friend_count
+
+
+def is_high_degree(user_id):
+    friend_count = AppUser.objects.filter(
+        pk=user_id).values_list('friend_count', flat=True).first()
+
+    return (friend_count or 0) > settings.FEED_HIGH_DEGREE_THRESHOLD
+
+
+def push_posts(owner_id, viewer_ids):
+    '''
+    Copy all existing posts of a user into the timelines of the given viewers
+    '''
+    entries = []
+    posts = Post.objects.filter(
+        owner_id=owner_id).values_list('pk', 'date_created')
+    for post_id, date_created in posts:
+        for viewer_id in viewer_ids:
+            entries.append(TimelineEntry(
+                viewer_id=viewer_id, post_id=post_id, date_created=date_created))
+
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    '''
+    Append a newly created post to the timeline of its owner and all of the owner's friends.
+    The post of a high degree user is only added to the owner's timeline.
+    '''
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    '''
+    Append a list of newly created posts to the timelines of their owners and the owners' friends
+    '''
+    viewer_ids = {}
+    entries = []
+    for post in posts:
+        if post.owner_id not in viewer_ids:
+            viewer_ids[post.owner_id] = [post.owner_id]
+            if not is_high_degree(post.owner_id):
+                viewer_ids[post.owner_id] += get_friend_ids(post.owner_id)
+
+        for viewer_id in viewer_ids[post.owner_id]:
+            entries.append(TimelineEntry(
+                viewer_id=viewer_id, post_id=post.pk, date_created=post.date_created))
+
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def backfill_timelines(user1_id, user2_id):
+    '''
+    Copy the existing posts of two users who just became friends into each other's timeline
+    '''
+    for viewer_id, owner_id in ((user1_id, user2_id), (user2_id, user1_id)):
+        # posts of high degree users are pulled at read time instead
+        if not is_high_degree(owner_id):
+            push_posts(owner_id, [viewer_id])
+
+
+def prune_timelines(user1_id, user2_id):
+    '''
+    Remove the posts of two users who are no longer friends from each other's timeline
+    '''
+    TimelineEntry.objects.filter(
+        Q(viewer_id=user1_id, post__owner_id=user2_id) | Q(viewer_id=user2_id, post__owner_id=user1_id)).delete()
+
+
+def get_timeline(user):
+    '''
+    Return the materialized home feed of a user, newest first
+    '''
+    return TimelineEntry.objects.filter(viewer=user).select_related(
+        'post__owner').order_by('-date_created', '-post_id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(date_created, post_id):
+    '''
+    Encode the position of a post in the feed into an opaque cursor
+    '''
+    value = '{}|{}'.format(date_created.isoformat(), post_id)
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    '''
+    Decode a cursor into a (date_created, post_id) tuple, raise InvalidCursor if it is malformed
+    '''
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_created, post_id = value.split('|')
+        date_created = parse_datetime(date_created)
+        post_id = int(post_id)
+    except (ValueError, UnicodeError):
+        raise InvalidCursor('Invalid cursor.')
+
+    if date_created is None:
+        raise InvalidCursor('Invalid cursor.')
+
+    return (date_created, post_id)
+
+
+def filter_after_cursor(position, id_field):
+    '''
+    Return a Q object that selects the rows that come after the (date_created, id) position
+    '''
+    date_created, post_id = position
+    return Q(date_created__lt=date_created) | Q(date_created=date_created, **{id_field + '__lt': post_id})
+
+
+def filter_before_cursor(position, id_field):
+    '''
+    Return a Q object that selects the rows that come before (are newer than) the (date_created, id) position
+    '''
+    date_created, post_id = position
+    return Q(date_created__gt=date_created) | Q(date_created=date_created, **{id_field + '__gt': post_id})
+
+
+def get_post_sort_key(post):
+    return (post.date_created, post.pk)
+
+
+def get_author_posts(author_id, first_posts, window):
+    '''
+    Yield the posts of an author, newest first. The first window of posts is given,
+    the following windows are only fetched if the previous one is used up.
+    '''
+    posts = first_posts
+    while posts:
+        yield from posts
+        if len(posts) < window:
+            # the author has no more posts
+            return
+
+        last_post = posts[-1]
+        posts = list(Post.objects.filter(filter_after_cursor(
+            (last_post.date_created, last_post.pk), 'pk'), owner_id=author_id).order_by('-date_created', '-pk')[:window])
+
+
+class TimelineFeedEngine:
+    '''
+    Assemble the home feed from the posts pushed into the user's materialized timeline
+    and the posts pulled from the user's high degree friends
+    '''
+
+    def get_posts(self, user, position, limit):
+        '''
+        Return up to `limit` posts after the position, newest first
+        '''
+        entries = get_timeline(user)
+        if position:
+            entries = entries.filter(filter_after_cursor(position, 'post_id'))
+        pushed_posts = [entry.post for entry in entries[:limit]]
+
+        pulled_posts = []
+        high_degree_friend_ids = get_high_degree_friend_ids(user.pk)
+        if high_degree_friend_ids:
+            posts = Post.objects.filter(owner_id__in=high_degree_friend_ids).select_related(
+                'owner').order_by('-date_created', '-pk')
+            if position:
+                posts = posts.filter(filter_after_cursor(position, 'pk'))
+            pulled_posts = list(posts[:limit])
+
+        # merge the two sorted streams, a post can be in both if its owner became a high degree user
+        posts = []
+        post_ids = set()
+        for post in heapq.merge(pushed_posts, pulled_posts, key=get_post_sort_key, reverse=True):
+            if post.pk not in post_ids:
+                post_ids.add(post.pk)
+                posts.append(post)
+            if len(posts) == limit:
+                break
+
+        return posts
+
+    def get_new_posts(self, user, position):
+        '''
+        Return a queryset of the posts in the feed that are newer than the position
+        '''
+        entries = TimelineEntry.objects.filter(viewer=user)
+        posts = Post.objects.filter(owner_id__in=get_high_degree_friend_ids(user.pk))
+        if position:
+            entries = entries.filter(filter_before_cursor(position, 'post_id'))
+            posts = posts.filter(filter_before_cursor(position, 'pk'))
+
+        return Post.objects.filter(Q(pk__in=entries.values('post_id')) | Q(pk__in=posts.values('pk')))
+
+
+class MergeFeedEngine:
+    '''
+    Assemble the home feed by merging the newest posts of the user and of each friend with
+    a heap. Only a bounded window of posts is read per author and the merge stops as soon
+    as the page is full, so the cost depends on the page size rather than the total number
+    of posts by friends.
+    '''
+
+    def get_author_filter(self, user):
+        '''
+        Return a Q object that selects the posts of the user and the user's friends
+        '''
+        return Q(owner_id=user.pk) | Q(owner_id__in=get_friend_ids(user.pk))
+
+    def get_author_window(self, author_id, position, window):
+        '''
+        Return a queryset of the first window of posts of an author after the position, newest first
+        '''
+        posts = Post.objects.filter(owner_id=author_id)
+        if position:
+            posts = posts.filter(filter_after_cursor(position, 'pk'))
+        return posts.order_by('-date_created', '-pk')[:window]
+
+    def get_first_windows(self, author_ids, position, window):
+        '''
+        Return a dict of the first window of posts of each author after the position. Every
+        window is a LIMIT query that reads only its rows from the owner index, and the queries
+        of many authors are sent at once as a UNION ALL.
+        '''
+        first_windows = {}
+        for start in range(0, len(author_ids), FEED_AUTHORS_PER_QUERY):
+            selects = []
+            params = []
+            for author_id in author_ids[start:start + FEED_AUTHORS_PER_QUERY]:
+                sql, author_params = self.get_author_window(author_id, position, window).query.sql_with_params()
+                # SQLite only allows LIMIT in the selects of a compound select inside a subquery
+                selects.append('SELECT * FROM ({})'.format(sql))
+                params.extend(author_params)
+
+            for post in Post.objects.raw(' UNION ALL '.join(selects), params):
+                first_windows.setdefault(post.owner_id, []).append(post)
+
+        # the order of the rows of a compound select is not guaranteed
+        for posts in first_windows.values():
+            posts.sort(key=get_post_sort_key, reverse=True)
+
+        return first_windows
+
+    def get_posts(self, user, position, limit):
+        '''
+        Return up to `limit` posts after the position, newest first
+        '''
+        window = min(settings.FEED_AUTHOR_WINDOW, limit)
+        first_windows = self.get_first_windows([user.pk] + get_friend_ids(user.pk), position, window)
+
+        streams = [get_author_posts(author_id, first_posts, window)
+                   for author_id, first_posts in first_windows.items()]
+        posts = list(itertools.islice(heapq.merge(
+            *streams, key=get_post_sort_key, reverse=True), limit))
+
+        # load the owners of the posts in the page
+        owners = AppUser.objects.in_bulk({post.owner_id for post in posts})
+        for post in posts:
+            post.owner = owners[post.owner_id]
+
+        return posts
+
+    def get_new_posts(self, user, position):
+        '''
+        Return a queryset of the posts in the feed that are newer than the position
+        '''
+        posts = Post.objects.filter(self.get_author_filter(user))
+        if position:
+            posts = posts.filter(filter_before_cursor(position, 'pk'))
+
+        return posts
+
+
+# the engines that can assemble the home feed, selected by the FEED_ENGINE setting
+FEED_ENGINES = {
+    'timeline': TimelineFeedEngine(),
+    'merge': MergeFeedEngine(),
+}
+
+
+def get_feed_engine():
+    return FEED_ENGINES[settings.FEED_ENGINE]
+
+
+def get_feed_page(user, cursor=None, page_size=None):
+    '''
+    Return a page of posts from the home feed of a user that come after the cursor,
+    together with the cursor of the next page (None if it is the last page).
+
+    Posts are ordered by (date_created, id) descending, so every page starts from the
+    cursor no matter how deep the page is.
+    '''
+    page_size = page_size or settings.FEED_PAGE_SIZE
+    position = decode_cursor(cursor) if cursor else None
+
+    # fetch one extra post to find out if there is a next page
+    posts = get_feed_engine().get_posts(user, position, page_size + 1)
+
+    next_cursor = None
+    if len(posts) > page_size:
+        posts = posts[:page_size]
+        next_cursor = encode_cursor(posts[-1].date_created, posts[-1].pk)
+
+    return posts, next_cursor
+
+
+def get_new_feed_posts(user, cursor=None, page_size=None):
+    '''
+    Return the newest posts from the home feed of a user that are newer than the cursor
+    (all posts are new if there is no cursor), the number of new posts and the cursor of
+    the newest post, which is used to ask for new posts the next time.
+    '''
+    page_size = page_size or settings.FEED_PAGE_SIZE
+    position = decode_cursor(cursor) if cursor else None
+
+    new_posts = get_feed_engine().get_new_posts(user, position)
+    new_count = new_posts.count()
+    posts = list(new_posts.select_related(
+        'owner').order_by('-date_created', '-pk')[:page_size])
+
+    return posts, new_count, get_latest_cursor(posts) or cursor
+
+
+def get_latest_cursor(posts):
+    '''
+    Return the cursor of the newest post in a page of the feed (None if the page is empty)
+    '''
+    if not posts:
+        return None
+
+    return encode_cursor(posts[0].date_created, posts[0].pk)
+
+
+def get_post_data(post):
+    '''
+    Return the data of a post that is displayed in the home feed
+    '''
+    return {
+        'owner_username': post.owner.username,
+        'owner_profile_image_path': get_derivative_url(post.owner.profile_image, AVATAR_SIZE),
+        'post_text': post.text,
+        'post_image_path': get_derivative_url(post.image, POST_IMAGE_SIZE),
+        'post_image_width': post.image_width,
+        'post_image_height': post.image_height,
+        'post_image_color': post.image_color,
+        'post_image_placeholder': post.image_placeholder,
+        'post_image_srcset': get_srcset(post.image, post.image_srcset_widths),
+        'post_image_webp_srcset': get_srcset(post.image, post.image_srcset_widths, 'webp'),
+        'post_image_sizes': get_image_sizes(post.image_width, post.image_height),
+        'post_date_created': post.date_created
+    }
@@ -3,6 +3,21 @@ from django.contrib.auth import authenticate
 from django.contrib.auth.forms import UserCreationForm
 
 from .models import AppUser, Post
+from .images import get_image_limit_error
+
+
+def validate_image_limits(image):
+    '''
+    Reject uploaded images that are too large to be processed,
+    using the header that Django has already read instead of decoding the image
+    '''
+    # only newly uploaded files carry the image read by the form field
+    if image and hasattr(image, 'image'):
+        error = get_image_limit_error(image.image.size, image.size)
+        if error is not None:
+            raise forms.ValidationError(error)
+
+    return image
 
 
 class RegistrationForm(UserCreationForm):
@@ -69,6 +84,9 @@ class ProfileUpdateForm(forms.ModelForm):
         model = AppUser
         fields = ('profile_image', 'email', 'username')
 
+    def clean_profile_image(self):
+        return validate_image_limits(self.cleaned_data['profile_image'])
+
     def clean_email(self):
         # convert input email to lowercase
         email = self.cleaned_data['email'].lower()
@@ -99,6 +117,9 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('image', 'text')
 
+    def clean_image(self):
+        return validate_image_limits(self.cleaned_data['image'])
+
     def clean(self):
         if self.is_valid():
             image = self.cleaned_data['image']
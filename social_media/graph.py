@@ -0,0 +1,351 @@
+import bisect
+import threading
+import time
+from array import array
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import UserRelationship, FriendshipEvent
+
+# number of users whose neighbour lists may be changed since the last build before
+# the compact arrays are rebuilt
+COMPACT_THRESHOLD = 10000
+
+# seconds during which a missing event id is queried again, in case the transaction that
+# wrote it commits after the events that follow it
+EVENT_GAP_TIMEOUT = 60
+
+
+def record_friendship_event(user1_id, user2_id, added):
+    '''
+    Append a friendship being made or removed to the log replayed by the friend graphs
+    '''
+    event = FriendshipEvent.objects.create(user1_id=user1_id, user2_id=user2_id, added=added)
+    # the graph of this process reads the log on its next lookup, so the change is seen at once
+    transaction.on_commit(friend_graph.invalidate)
+    return event
+
+
+def prune_friendship_events():
+    '''
+    Delete the friendship events older than FRIENDSHIP_EVENT_RETENTION, which every friend graph
+    has either applied or will not need as it is rebuilt. Return the number of deleted events.
+    '''
+    cutoff = timezone.now() - timedelta(seconds=settings.FRIENDSHIP_EVENT_RETENTION)
+    deleted, _ = FriendshipEvent.objects.filter(date_created__lt=cutoff).delete()
+    return deleted
+
+
+def build_adjacency(edges):
+    '''
+    Build the compressed adjacency arrays of an undirected graph from its edges:
+    the neighbours of user u are neighbours[offsets[u]:offsets[u + 1]], in ascending order
+    '''
+    pairs = []
+    for user1_id, user2_id in edges:
+        pairs.append((user1_id, user2_id))
+        pairs.append((user2_id, user1_id))
+    pairs.sort()
+
+    size = pairs[-1][0] + 2 if pairs else 1
+    offsets = array('q', bytes(8 * size))
+    for user_id, _ in pairs:
+        offsets[user_id + 1] += 1
+    for i in range(1, size):
+        offsets[i] += offsets[i - 1]
+
+    return offsets, array('q', (neighbour_id for _, neighbour_id in pairs))
+
+
+def intersect_sorted(ids1, ids2):
+    '''
+    Return the ids that are in both ascending sequences, in ascending order
+    '''
+    if len(ids1) > len(ids2):
+        ids1, ids2 = ids2, ids1
+
+    # when one list is much shorter, its ids are binary searched in the longer one, each search
+    # starting where the previous one ended. Otherwise a set intersection, which runs in C,
+    # is faster than walking both lists side by side in Python.
+    if len(ids1) * max(1, len(ids2).bit_length()) >= len(ids1) + len(ids2):
+        return sorted(set(ids1).intersection(ids2))
+
+    common = []
+    i = 0
+    for user_id in ids1:
+        i = bisect.bisect_left(ids2, user_id, i)
+        if i == len(ids2):
+            break
+        if ids2[i] == user_id:
+            common.append(user_id)
+    return common
+
+
+class FriendGraph:
+    '''
+    Process-local index of the friendships, held in compact arrays of sorted neighbour ids.
+    It is built from UserRelationship on first use and then kept in sync by replaying
+    the FriendshipEvent log, so the changes made by other processes are seen as well,
+    at most FRIEND_GRAPH_SYNC_INTERVAL seconds late.
+    '''
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        # held while the friendships are read, so only one thread builds the arrays at a time
+        self.build_lock = threading.Lock()
+        self.version = 0
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.offsets = None
+            self.neighbour_ids = None
+            # sorted neighbour lists of the users changed since the arrays were built
+            self.changed = {}
+            self.last_event_id = 0
+            # ids of events that may still be committed, with the time they were found missing
+            self.gaps = {}
+            # time of the last read of the log and time before which it is not read again
+            self.synced = 0
+            self.next_sync = 0
+            # changed by every build and reset, so what was read before is not applied to the new arrays
+            self.version += 1
+
+    def invalidate(self):
+        '''
+        Read the log on the next lookup, without waiting for FRIEND_GRAPH_SYNC_INTERVAL
+        '''
+        with self.lock:
+            self.next_sync = 0
+
+    def build(self, wait=True):
+        '''
+        Read the friendships and replace the arrays. The reads run outside of the lock, so the
+        lookups of other threads go on with the current arrays. When another thread is building
+        already, wait for it to finish if wait is True, otherwise return at once.
+        '''
+        with self.lock:
+            version = self.version
+        if not self.build_lock.acquire(blocking=wait):
+            return
+
+        try:
+            with self.lock:
+                if self.version != version:
+                    # built by another thread while this one was waiting
+                    return
+
+            started = time.monotonic()
+            # events that were not committed yet when they are read were written at most
+            # EVENT_GAP_TIMEOUT ago, so they have a higher id than the events written before that
+            cutoff = timezone.now() - timedelta(seconds=EVENT_GAP_TIMEOUT)
+            first_event_id = FriendshipEvent.objects.filter(date_created__lt=cutoff).order_by(
+                '-pk').values_list('pk', flat=True).first() or 0
+            event_ids = set(FriendshipEvent.objects.filter(pk__gt=first_event_id).values_list('pk', flat=True))
+            last_event_id = max(event_ids, default=first_event_id)
+
+            # events written while the relationships are read are replayed, which is harmless
+            # as adding an existing friendship or removing a missing one does nothing
+            edges = UserRelationship.objects.filter(
+                relation_type='friends').values_list('user1_id', 'user2_id')
+            offsets, neighbour_ids = build_adjacency(edges)
+
+            with self.lock:
+                if self.version != version:
+                    # reset while the friendships were read
+                    return
+                self.version += 1
+                self.offsets, self.neighbour_ids = offsets, neighbour_ids
+                self.changed = {}
+                self.last_event_id = last_event_id
+                # the missing ids are events that may still be committed
+                self.gaps = {event_id: started for event_id in range(first_event_id + 1, last_event_id)
+                             if event_id not in event_ids}
+                self.synced = started
+                self.next_sync = started + settings.FRIEND_GRAPH_SYNC_INTERVAL
+        finally:
+            self.build_lock.release()
+
+    def compact(self):
+        '''
+        Merge the changed neighbour lists back into the compact arrays
+        '''
+        edges = []
+        for user_id in range(len(self.offsets) - 1):
+            if user_id not in self.changed:
+                edges.extend((user_id, neighbour_id) for neighbour_id in self.get_neighbours(user_id)
+                             if user_id < neighbour_id and neighbour_id not in self.changed)
+        # every edge is taken once, from a changed side when there is one
+        for user_id, neighbour_ids in self.changed.items():
+            edges.extend((user_id, neighbour_id) for neighbour_id in neighbour_ids
+                         if user_id < neighbour_id or neighbour_id not in self.changed)
+
+        self.offsets, self.neighbour_ids = build_adjacency(edges)
+        self.changed = {}
+
+    def get_neighbours(self, user_id):
+        if user_id in self.changed:
+            return self.changed[user_id]
+        if user_id + 1 >= len(self.offsets):
+            return array('q')
+        return self.neighbour_ids[self.offsets[user_id]:self.offsets[user_id + 1]]
+
+    def apply(self, user1_id, user2_id, added):
+        for user_id, neighbour_id in ((user1_id, user2_id), (user2_id, user1_id)):
+            neighbour_ids = array('q', self.get_neighbours(user_id))
+            i = bisect.bisect_left(neighbour_ids, neighbour_id)
+            exists = i < len(neighbour_ids) and neighbour_ids[i] == neighbour_id
+            if added and not exists:
+                neighbour_ids.insert(i, neighbour_id)
+            elif not added and exists:
+                del neighbour_ids[i]
+            self.changed[user_id] = neighbour_ids
+
+        if len(self.changed) > COMPACT_THRESHOLD:
+            self.compact()
+
+    def sync(self):
+        '''
+        Build the graph if needed, then apply the events logged since the last sync.
+        The log is read outside of the lock, so the lookups of other threads are not held up.
+        '''
+        with self.lock:
+            now = time.monotonic()
+            # events are pruned after FRIENDSHIP_EVENT_RETENTION, so a graph that was not synced for nearly
+            # that long may have missed some of them (late events are up to EVENT_GAP_TIMEOUT older)
+            expired = now - self.synced >= settings.FRIENDSHIP_EVENT_RETENTION - 2 * EVENT_GAP_TIMEOUT
+            rebuild = self.offsets is None or expired
+            # lookups wait for the first build, then they go on with the current arrays during a rebuild
+            wait = self.offsets is None
+
+            if not rebuild:
+                if now < self.next_sync:
+                    return
+                self.next_sync = now + settings.FRIEND_GRAPH_SYNC_INTERVAL
+
+                self.gaps = {event_id: found for event_id, found in self.gaps.items()
+                             if now - found < EVENT_GAP_TIMEOUT}
+                version = self.version
+                last_event_id = self.last_event_id
+                gap_ids = list(self.gaps)
+
+        if rebuild:
+            self.build(wait)
+            return
+
+        events = list(FriendshipEvent.objects.filter(
+            Q(pk__gt=last_event_id) | Q(pk__in=gap_ids)).order_by('pk').values_list(
+            'pk', 'user1_id', 'user2_id', 'added'))
+
+        with self.lock:
+            if self.version != version:
+                return
+            self.synced = now
+
+            for event_id, user1_id, user2_id, added in events:
+                if event_id in self.gaps:
+                    del self.gaps[event_id]
+                elif event_id > self.last_event_id:
+                    for missing_id in range(self.last_event_id + 1, event_id):
+                        self.gaps[missing_id] = now
+                    self.last_event_id = event_id
+                else:
+                    # applied by a sync of another thread
+                    continue
+                self.apply(user1_id, user2_id, added)
+
+    def neighbours(self, user_id):
+        '''
+        Return the ids of the friends of a user in ascending order
+        '''
+        self.sync()
+        with self.lock:
+            return list(self.get_neighbours(user_id))
+
+    def is_friend(self, user1_id, user2_id):
+        self.sync()
+        with self.lock:
+            neighbour_ids = self.get_neighbours(user1_id)
+            i = bisect.bisect_left(neighbour_ids, user2_id)
+            return i < len(neighbour_ids) and neighbour_ids[i] == user2_id
+
+    def degree(self, user_id):
+        self.sync()
+        with self.lock:
+            return len(self.get_neighbours(user_id))
+
+    def mutual(self, user_id, other_ids):
+        '''
+        Return the ids of the friends the user has in common with each of the other users
+        '''
+        self.sync()
+        with self.lock:
+            neighbour_ids = self.get_neighbours(user_id)
+            return {other_id: intersect_sorted(neighbour_ids, self.get_neighbours(other_id))
+                    for other_id in other_ids}
+
+
+friend_graph = FriendGraph()
+
+
+def use_friend_graph():
+    # inside a transaction the graph could pick up events that are rolled back later,
+    # and it would not see the uncommitted changes of other transactions anyway
+    return not connection.in_atomic_block
+
+
+def get_friend_ids(user_id):
+    '''
+    Return a list of ids of the users who are friends with the given user ID, in ascending order
+    '''
+    if use_friend_graph():
+        return friend_graph.neighbours(user_id)
+
+    relationships = UserRelationship.objects.filter(
+        Q(user1_id=user_id) | Q(user2_id=user_id), relation_type='friends').values_list('user1_id', 'user2_id')
+
+    return sorted(user2_id if user1_id == user_id else user1_id for user1_id, user2_id in relationships)
+
+
+def are_friends(user1_id, user2_id):
+    '''
+    Return whether the two users are friends
+    '''
+    if use_friend_graph():
+        return friend_graph.is_friend(user1_id, user2_id)
+
+    return UserRelationship.objects.filter(
+        user1_id=min(user1_id, user2_id), user2_id=max(user1_id, user2_id), relation_type='friends').exists()
+
+
+def get_degree(user_id):
+    '''
+    Return the number of friends of a user
+    '''
+    if use_friend_graph():
+        return friend_graph.degree(user_id)
+
+    return UserRelationship.objects.filter(
+        Q(user1_id=user_id) | Q(user2_id=user_id), relation_type='friends').count()
+
+
+def get_mutual_friend_ids(user1_id, user2_id):
+    '''
+    Return the ids of the friends two users have in common, in ascending order
+    '''
+    return get_mutual_friend_ids_by_user(user1_id, [user2_id])[user2_id]
+
+
+def get_mutual_friend_ids_by_user(user_id, other_ids):
+    '''
+    Return a dict of the ids of the friends the user has in common with each of the other users
+    '''
+    if use_friend_graph():
+        return friend_graph.mutual(user_id, other_ids)
+
+    friend_ids = get_friend_ids(user_id)
+    return {other_id: intersect_sorted(friend_ids, get_friend_ids(other_id)) for other_id in other_ids}
@@ -0,0 +1,293 @@
+import base64
+import io
+import math
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+from .storage import write_file_atomic
+
+# longest side of the images shown at each place, twice the css size for high density screens
+AVATAR_SIZE = 96
+AVATAR_BIG_SIZE = 320
+POST_IMAGE_SIZE = 960
+
+# longest side of the blurred preview shown while an image is loading
+PLACEHOLDER_SIZE = 8
+
+# css height of the post images in the feed and the post lists (h-72)
+POST_IMAGE_HEIGHT = 288
+
+# EXIF tag of the camera rotation, ExifTags.Base only exists from Pillow 9.3
+EXIF_ORIENTATION = 0x0112
+
+IMAGE_FORMATS = {
+    'jpeg': 'jpg',
+    'webp': 'webp',
+}
+
+
+def get_image_formats():
+    # WebP support depends on how Pillow was built
+    if features.check('webp'):
+        return list(IMAGE_FORMATS)
+    return ['jpeg']
+
+
+def get_derivative_name(name, size, image_format='jpeg'):
+    '''
+    Return the file name of the resized copy of an image,
+    e.g. images/profile_images/1/profile_image_96.webp
+    '''
+    root, _ = os.path.splitext(name)
+    return '{}_{}.{}'.format(root, size, IMAGE_FORMATS[image_format])
+
+
+def get_srcset_name(name, width, image_format='jpeg'):
+    '''
+    Return the file name of the copy of a post image at the given width,
+    e.g. images/cas/ab/abcdef_640w.webp
+    '''
+    root, _ = os.path.splitext(name)
+    return '{}_{}w.{}'.format(root, width, IMAGE_FORMATS[image_format])
+
+
+def parse_srcset_widths(value):
+    # the widths are stored on the post as a comma separated string
+    return [int(width) for width in value.split(',') if width]
+
+
+def get_derivative_sizes_field_name(field_name):
+    # e.g. the sizes of the copies of Post.image are stored in Post.image_derivative_sizes
+    return field_name + '_derivative_sizes'
+
+
+def get_stored_derivative_sizes(field_file):
+    '''
+    Return the sizes of the resized copies of an image, as recorded on its model instance
+    when they were generated
+    '''
+    return parse_srcset_widths(getattr(
+        field_file.instance, get_derivative_sizes_field_name(field_file.field.name), '') or '')
+
+
+def encode_image(image, image_format):
+    image_io = io.BytesIO()
+    if image_format == 'jpeg':
+        image.save(image_io, 'JPEG', quality=85, optimize=True, progressive=True)
+    else:
+        image.save(image_io, 'WEBP', quality=80, method=4)
+    return image_io.getvalue()
+
+
+def save_file(storage, name, content):
+    # written in place rather than through storage.save(), which would rename the file
+    write_file_atomic(storage.path(name), [content], storage.file_permissions_mode)
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def get_image_limit_error(size, byte_size):
+    '''
+    Return why an image is too large to be processed, or None if it is within the limits.
+    Only the header of the image is needed, so it is checked before the image is decoded.
+    '''
+    width, height = size
+    if byte_size > settings.IMAGE_MAX_UPLOAD_SIZE:
+        return 'The image must be smaller than {} MB.'.format(
+            settings.IMAGE_MAX_UPLOAD_SIZE // (1024 * 1024))
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        return 'The image must have fewer than {} megapixels.'.format(
+            settings.IMAGE_MAX_PIXELS // 1000000)
+    return None
+
+
+def load_image(image_file, max_size=None):
+    '''
+    Decode an image, at a reduced resolution that still covers max_size when one is given
+    '''
+    image = Image.open(image_file)
+    error = get_image_limit_error(image.size, image_file.size)
+    if error is not None:
+        raise ImageTooLarge(error)
+
+    width, height = image.size
+    if max_size is not None and max(width, height) > max_size:
+        # let the JPEG decoder scale the image down by up to 8 times while decoding,
+        # so the full resolution image is never held in memory
+        scale = max_size / max(width, height)
+        image.draft('RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+
+    # apply the camera rotation and drop the alpha channel, which JPEG cannot store
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return image
+
+
+def get_image_size(image_file):
+    '''
+    Return the size of an image as it is displayed, read from its header without decoding it
+    '''
+    header = Image.open(image_file)
+    width, height = header.size
+    if header.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+        # the image is displayed rotated by 90 degrees
+        width, height = height, width
+    image_file.seek(0)
+
+    return width, height
+
+
+def get_image_placeholder(image_file):
+    '''
+    Return the average colour and a tiny preview (as a data URI) of an image, so pages can show
+    something before the image is downloaded. The image is decoded, so it runs in the image job worker.
+    '''
+    # JPEG images are decoded at a fraction of their size
+    image = load_image(image_file, PLACEHOLDER_SIZE).convert('RGB')
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.LANCZOS)
+    color = '#{:02x}{:02x}{:02x}'.format(*image.resize((1, 1), Image.BOX).getpixel((0, 0)))
+
+    image_io = io.BytesIO()
+    image.save(image_io, 'PNG', optimize=True)
+    placeholder = 'data:image/png;base64,' + base64.b64encode(image_io.getvalue()).decode()
+
+    return {
+        'image_color': color,
+        'image_placeholder': placeholder,
+    }
+
+
+def get_image_preview(image_file):
+    '''
+    Return the size, the average colour and a tiny preview (as a data URI) of an image,
+    so pages can lay the image out and show something before it is downloaded
+    '''
+    width, height = get_image_size(image_file)
+
+    return dict(get_image_placeholder(image_file), image_width=width, image_height=height)
+
+
+def generate_derivatives(name, storage):
+    '''
+    Generate the resized JPEG and WebP copies of an uploaded image next to the original.
+    Return the sizes of the generated copies.
+    '''
+    with storage.open(name, 'rb') as image_file:
+        original = load_image(image_file, max(settings.IMAGE_DERIVATIVE_SIZES))
+
+    sizes = []
+    for size in sorted(settings.IMAGE_DERIVATIVE_SIZES):
+        for image_format in get_image_formats():
+            derivative_name = get_derivative_name(name, size, image_format)
+
+            # never upscale, the original is served for bigger sizes instead
+            if max(original.size) <= size:
+                # remove the copies of a previous, bigger image at the same path
+                if storage.exists(derivative_name):
+                    storage.delete(derivative_name)
+                continue
+
+            image = original.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+            save_file(storage, derivative_name, encode_image(image, image_format))
+
+        if max(original.size) > size:
+            sizes.append(size)
+
+    return sizes
+
+
+def generate_srcset(name, storage):
+    '''
+    Generate the JPEG and WebP copies of a post image at the widths of IMAGE_SRCSET_WIDTHS,
+    clamped to the width of the image so it is never upscaled. Return the generated widths.
+    '''
+    with storage.open(name, 'rb') as image_file:
+        original = load_image(image_file, settings.IMAGE_MAX_SIZE)
+
+    width, height = original.size
+    widths = sorted({min(srcset_width, width) for srcset_width in settings.IMAGE_SRCSET_WIDTHS})
+    for srcset_width in widths:
+        image = original.resize(
+            (srcset_width, max(1, round(height * srcset_width / width))), Image.LANCZOS)
+        for image_format in get_image_formats():
+            save_file(storage, get_srcset_name(name, srcset_width, image_format),
+                      encode_image(image, image_format))
+
+    return widths
+
+
+def process_image(name, storage):
+    '''
+    Shrink an uploaded image to IMAGE_MAX_SIZE, re-encode it as a JPEG without its metadata
+    and generate its resized copies. Return the name and the size of the processed image,
+    and the sizes of its resized copies.
+    '''
+    with storage.open(name, 'rb') as image_file:
+        image = load_image(image_file, settings.IMAGE_MAX_SIZE)
+
+    image.thumbnail((settings.IMAGE_MAX_SIZE, settings.IMAGE_MAX_SIZE), Image.LANCZOS)
+    # the original may be shared with other posts, so the processed image is stored as a new file
+    processed_name = storage.save(name, ContentFile(encode_image(image, 'jpeg')))
+
+    derivative_sizes = generate_derivatives(processed_name, storage)
+    return processed_name, image.size, derivative_sizes
+
+
+def get_derivative_url(field_file, size, image_format='jpeg'):
+    '''
+    Return the url of the smallest copy of an image that is at least the given size,
+    falling back to the original when there is no such copy. The sizes of the copies are read
+    from the model instance, so the storage is not queried.
+    '''
+    if not field_file:
+        return None
+
+    for derivative_size in sorted(get_stored_derivative_sizes(field_file)):
+        if derivative_size >= size:
+            if image_format not in get_image_formats():
+                break
+            return field_file.storage.url(get_derivative_name(field_file.name, derivative_size, image_format))
+
+    # WebP has no fallback of its own, the JPEG copy or the original is used instead
+    if image_format != 'jpeg':
+        return None
+
+    return field_file.url
+
+
+def get_srcset_urls(field_file, widths, image_format='jpeg'):
+    '''
+    Return the (url, width) pairs of the copies of a post image generated by generate_srcset
+    '''
+    if not field_file or image_format not in get_image_formats():
+        return []
+
+    return [(field_file.storage.url(get_srcset_name(field_file.name, width, image_format)), width)
+            for width in parse_srcset_widths(widths)]
+
+
+def get_srcset(field_file, widths, image_format='jpeg'):
+    '''
+    Return the srcset attribute of a post image, empty when its copies have not been generated yet
+    '''
+    return ', '.join('{} {}w'.format(url, width)
+                     for url, width in get_srcset_urls(field_file, widths, image_format))
+
+
+def get_image_sizes(width, height):
+    '''
+    Return the sizes attribute of a post image, which is shown POST_IMAGE_HEIGHT css pixels high
+    and at most as wide as the screen
+    '''
+    if not width or not height:
+        return '100vw'
+
+    display_width = math.ceil(POST_IMAGE_HEIGHT * width / height)
+    return '(max-width: {0}px) 100vw, {0}px'.format(display_width)
@@ -0,0 +1,130 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import AppUser, Post, ImageJob
+from .images import process_image, generate_srcset, get_image_placeholder, get_derivative_sizes_field_name
+
+# model and image field of each kind of image job
+IMAGE_JOB_FIELDS = {
+    'post_image': (Post, 'image'),
+    'profile_image': (AppUser, 'profile_image'),
+}
+
+
+def enqueue_image_job(kind, instance):
+    '''
+    Queue the processing of the image of a post or a user that was just uploaded
+    '''
+    _, field_name = IMAGE_JOB_FIELDS[kind]
+    return ImageJob.objects.create(
+        kind=kind, object_id=instance.pk, name=getattr(instance, field_name).name)
+
+
+def claim_image_jobs(limit):
+    '''
+    Mark up to the given number of queued jobs as running and return them.
+    Running jobs that have not finished within IMAGE_JOB_TIMEOUT seconds are claimed again,
+    as their worker has most likely died.
+    '''
+    stale_date = timezone.now() - datetime.timedelta(seconds=settings.IMAGE_JOB_TIMEOUT)
+    claimable = Q(state='pending') | Q(state='running', date_modified__lt=stale_date)
+
+    jobs = []
+    for job in ImageJob.objects.filter(claimable).order_by('id')[:limit]:
+        # another worker may have claimed the job in the meantime
+        claimed = ImageJob.objects.filter(claimable, pk=job.pk).update(
+            state='running', attempts=job.attempts + 1, date_modified=timezone.now())
+        if claimed:
+            job.state = 'running'
+            job.attempts += 1
+            jobs.append(job)
+
+    return jobs
+
+
+def run_image_job(kind, name):
+    '''
+    Process an image and return the name and the size of the processed image, the sizes of
+    its resized copies, and for a post image the widths of its srcset copies and its placeholder.
+    Runs in a worker process so it must not use the database.
+    '''
+    model, field_name = IMAGE_JOB_FIELDS[kind]
+    storage = model._meta.get_field(field_name).storage
+    processed_name, size, derivative_sizes = process_image(name, storage)
+
+    srcset_widths = []
+    placeholder = {}
+    if kind == 'post_image':
+        srcset_widths = generate_srcset(processed_name, storage)
+        # the processed image is a JPEG, so it is decoded at a fraction of its size
+        with storage.open(processed_name, 'rb') as image_file:
+            placeholder = get_image_placeholder(image_file)
+    return processed_name, size, derivative_sizes, srcset_widths, placeholder
+
+
+def finish_image_job(job, result=None, error=None):
+    '''
+    Record the result of a job, point the post or user to the processed image
+    and update the processing state of the post
+    '''
+    if error is None:
+        job.state = 'done'
+    elif job.attempts < settings.IMAGE_JOB_MAX_ATTEMPTS:
+        # try again later
+        job.state = 'pending'
+    else:
+        job.state = 'failed'
+    job.error = '' if error is None else str(error)
+
+    model, field_name = IMAGE_JOB_FIELDS[job.kind]
+    changes = {}
+    if job.state == 'done':
+        processed_name, (width, height), derivative_sizes, srcset_widths, placeholder = result
+        changes[field_name] = processed_name
+        # the pages build the urls of the copies from the sizes instead of checking the storage
+        changes[get_derivative_sizes_field_name(field_name)] = ','.join(map(str, derivative_sizes))
+        if job.kind == 'post_image':
+            changes['image_width'] = width
+            changes['image_height'] = height
+            changes['image_srcset_widths'] = ','.join(map(str, srcset_widths))
+            changes.update(placeholder)
+    if job.kind == 'post_image' and job.state in ('done', 'failed'):
+        changes['image_state'] = 'ready' if job.state == 'done' else 'failed'
+
+    with transaction.atomic():
+        job.save(update_fields=['state', 'error', 'date_modified'])
+
+        # the image may have been replaced by a newer upload in the meantime
+        if changes:
+            model.objects.filter(
+                pk=job.object_id, **{field_name: job.name}).update(**changes)
+
+
+def process_image_jobs(executor=None, limit=100):
+    '''
+    Process a batch of queued jobs, in the processes of the executor if one is given.
+    Return the number of processed jobs.
+    '''
+    jobs = claim_image_jobs(limit)
+
+    results = []
+    if executor is None:
+        for job in jobs:
+            try:
+                results.append((run_image_job(job.kind, job.name), None))
+            except Exception as error:
+                results.append((None, error))
+    else:
+        futures = [executor.submit(run_image_job, job.kind, job.name) for job in jobs]
+        for future in futures:
+            error = future.exception()
+            results.append((None if error else future.result(), error))
+
+    for job, (result, error) in zip(jobs, results):
+        finish_image_job(job, result, error)
+
+    return len(jobs)
@@ -0,0 +1,65 @@
+import io
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from PIL import Image
+
+from social_media.images import load_image
+
+
+def get_peak_memory():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def decode_image(content, max_size):
+    '''
+    Decode and shrink an image like the image job worker does and return the growth
+    of the peak memory of the process and the time taken
+    '''
+    start_memory = get_peak_memory()
+    start_time = time.monotonic()
+
+    image = load_image(File(io.BytesIO(content)), max_size)
+    image.thumbnail((settings.IMAGE_MAX_SIZE, settings.IMAGE_MAX_SIZE), Image.LANCZOS)
+
+    return get_peak_memory() - start_memory, time.monotonic() - start_time
+
+
+class Command(BaseCommand):
+    help = 'Measure the peak memory used to decode an uploaded photo, with and without reduced resolution decoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--megapixels', type=int, default=40,
+                            help='size of the generated test photo')
+        parser.add_argument('--runs', type=int, default=3)
+
+    def handle(self, *args, **options):
+        width = int((options['megapixels'] * 1000000 * 4 / 3) ** 0.5)
+        height = width * 3 // 4
+        image_io = io.BytesIO()
+        Image.effect_noise((width, height), 64).convert('RGB').save(image_io, 'JPEG', quality=90)
+        content = image_io.getvalue()
+        self.stdout.write('Test photo: {}x{} pixels, {:.1f} MB'.format(
+            width, height, len(content) / 1000000))
+
+        # limits are lifted so the full decode can be measured as well
+        with override_settings(IMAGE_MAX_PIXELS=width * height, IMAGE_MAX_UPLOAD_SIZE=len(content)):
+            for label, max_size in (('full decode', None), ('reduced decode', settings.IMAGE_MAX_SIZE)):
+                memory = []
+                durations = []
+                for _ in range(options['runs']):
+                    # a new process for every run, so each peak is measured from a clean start
+                    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as executor:
+                        used_memory, duration = executor.submit(decode_image, content, max_size).result()
+                    memory.append(used_memory)
+                    durations.append(duration)
+
+                self.stdout.write('{}: peak memory {:.0f} MB, {:.2f}s per upload'.format(
+                    label, max(memory) / 1000000, sum(durations) / len(durations)))
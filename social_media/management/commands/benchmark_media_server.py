@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from social_media.media_server import StaticFilesApp
+
+
+async def not_found(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of serving an uploaded file through Django and through StaticFilesApp'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1024,
+                            help='size of the served file in KB')
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            name = 'images/cas/00/benchmark.jpg'
+            os.makedirs(os.path.join(media_root, 'images/cas/00'))
+            with open(os.path.join(media_root, name), 'wb') as output_file:
+                output_file.write(os.urandom(options['size'] * 1024))
+
+            with override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['*']):
+                url = settings.MEDIA_URL + name
+                self.report('django view', options, self.benchmark_django, url)
+                self.report('StaticFilesApp', options, self.benchmark_asgi, url)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def report(self, label, options, benchmark, url):
+        start_time = time.monotonic()
+        received = benchmark(url, options['requests'])
+        elapsed = time.monotonic() - start_time
+
+        self.stdout.write('{}: {:.0f} requests/s, {:.0f} MB/s'.format(
+            label, options['requests'] / elapsed, received / elapsed / 1000000))
+
+    def benchmark_django(self, url, requests):
+        client = Client()
+        received = 0
+        for _ in range(requests):
+            response = client.get(url)
+            received += sum(len(chunk) for chunk in response.streaming_content)
+        return received
+
+    def benchmark_asgi(self, url, requests):
+        application = StaticFilesApp(not_found)
+        scope = {'type': 'http', 'method': 'GET', 'path': url, 'headers': []}
+        received = 0
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            nonlocal received
+            received += len(message.get('body', b''))
+
+        async def run():
+            for _ in range(requests):
+                await application(scope, receive, send)
+
+        async_to_sync(run)()
+        return received
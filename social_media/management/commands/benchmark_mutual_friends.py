@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from social_media.graph import FriendGraph, build_adjacency, intersect_sorted
+
+
+def set_intersection(ids1, ids2):
+    # what the views would do with the friend ids read from two relationship scans
+    return sorted(set(ids1) & set(ids2))
+
+
+class Command(BaseCommand):
+    help = 'Measure the time taken to find the mutual friends of users with many friends in the friend graph'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000,
+                            help='number of users in the generated graph')
+        parser.add_argument('--friends', type=int, default=5000,
+                            help='number of friends of the two measured users')
+        parser.add_argument('--small-friends', type=int, default=50,
+                            help='number of friends of a third user with few friends')
+        parser.add_argument('--runs', type=int, default=200)
+
+    def handle(self, *args, **options):
+        user_ids = range(4, options['users'])
+
+        # users 1 and 2 have many friends, user 3 has few
+        edges = set()
+        for user_id, friend_count in ((1, options['friends']), (2, options['friends']),
+                                      (3, options['small_friends'])):
+            edges.update((user_id, friend_id) for friend_id in random.sample(user_ids, friend_count))
+
+        # the graph is filled directly so the database is not needed
+        graph = FriendGraph()
+        graph.offsets, graph.neighbour_ids = build_adjacency(edges)
+        friend_ids1 = graph.get_neighbours(1)
+        friend_ids2 = graph.get_neighbours(2)
+        friend_ids3 = graph.get_neighbours(3)
+        self.stdout.write('Users with {}, {} and {} friends, {} mutual friends between the first two'.format(
+            len(friend_ids1), len(friend_ids2), len(friend_ids3),
+            len(intersect_sorted(friend_ids1, friend_ids2))))
+
+        for label, ids1, ids2 in (('large and large', friend_ids1, friend_ids2),
+                                  ('small and large', friend_ids3, friend_ids1)):
+            for method_label, method in (('set intersection', set_intersection),
+                                         ('sorted intersection', intersect_sorted)):
+                start_time = time.perf_counter()
+                for _ in range(options['runs']):
+                    method(ids1, ids2)
+                elapsed = time.perf_counter() - start_time
+
+                self.stdout.write('{}, {}: {:.1f} us per pair'.format(
+                    label, method_label, elapsed / options['runs'] * 1000000))
@@ -0,0 +1,36 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from social_media.models import AppUser
+from social_media.recommendations import (load_relationships,
+                                          init_worker,
+                                          update_recommendations)
+
+
+class Command(BaseCommand):
+    help = 'Precompute the friend of friend recommendations of every user with a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of users scored per task')
+
+    def handle(self, *args, **options):
+        start_time = time.monotonic()
+        snapshot = load_relationships()
+        user_ids = list(AppUser.objects.order_by('pk').values_list('pk', flat=True))
+
+        # the worker processes must not inherit the database connection
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker,
+                                 initargs=(snapshot,)) as executor:
+            stored = update_recommendations(user_ids, executor, options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS('Stored {} recommendations for {} users in {:.1f}s'.format(
+            stored, len(user_ids), time.monotonic() - start_time)))
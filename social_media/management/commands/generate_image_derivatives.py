@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from social_media.images import generate_derivatives, get_derivative_sizes_field_name, ImageTooLarge
+from social_media.models import AppUser, Post, DEFAULT_PROFILE_IMAGE_PATH
+
+
+def get_image_files():
+    '''
+    Yield the profile images (including the shared default one) and the post images,
+    each with the rows that use it
+    '''
+    profile_images = AppUser.objects.exclude(profile_image='').exclude(profile_image=None)
+    default_user = profile_images.filter(
+        profile_image=DEFAULT_PROFILE_IMAGE_PATH).only('profile_image').first()
+    if default_user is not None:
+        yield default_user.profile_image, AppUser.objects.filter(profile_image=DEFAULT_PROFILE_IMAGE_PATH)
+
+    for user in profile_images.exclude(profile_image=DEFAULT_PROFILE_IMAGE_PATH).only('profile_image').iterator():
+        yield user.profile_image, AppUser.objects.filter(pk=user.pk, profile_image=user.profile_image.name)
+
+    for post in Post.objects.exclude(image='').exclude(image=None).only('image').iterator():
+        yield post.image, Post.objects.filter(pk=post.pk, image=post.image.name)
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized copies of the existing profile and post images'
+
+    def handle(self, *args, **options):
+        generated = 0
+        failed = 0
+
+        for field_file, rows in get_image_files():
+            try:
+                sizes = generate_derivatives(field_file.name, field_file.storage)
+                generated += 1
+            except (OSError, ImageTooLarge) as error:
+                self.stderr.write('Failed to resize {}: {}'.format(field_file.name, error))
+                failed += 1
+                continue
+
+            # the pages build the urls of the copies from the recorded sizes
+            rows.update(**{get_derivative_sizes_field_name(field_file.field.name): ','.join(map(str, sizes))})
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated the copies of {} images, {} failed'.format(generated, failed)))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from social_media.images import generate_srcset, get_image_preview, ImageTooLarge
+from social_media.models import Post
+
+
+def backfill_post(post):
+    '''
+    Generate the srcset copies of the image of a post, and its size and preview if the post
+    was created before they were stored
+    '''
+    storage = post.image.storage
+    changes = {
+        'image_srcset_widths': ','.join(map(str, generate_srcset(post.image.name, storage))),
+    }
+    if post.image_width is None:
+        with storage.open(post.image.name, 'rb') as image_file:
+            changes.update(get_image_preview(image_file))
+
+    # the image may have been replaced by a newer upload in the meantime
+    return Post.objects.filter(pk=post.pk, image=post.image.name).update(**changes)
+
+
+class Command(BaseCommand):
+    help = 'Generate the srcset copies of the images of the existing posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='generate the copies again for the posts that already have them')
+
+    def handle(self, *args, **options):
+        # pending images get their copies from the image job worker
+        posts = Post.objects.exclude(image='').exclude(image=None).filter(image_state='ready')
+        if not options['force']:
+            posts = posts.filter(image_srcset_widths='')
+
+        generated = 0
+        failed = 0
+        for post in posts.only('image', 'image_width').iterator():
+            try:
+                generated += backfill_post(post)
+            except (OSError, ImageTooLarge) as error:
+                self.stderr.write('Failed to resize {}: {}'.format(post.image.name, error))
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated the srcset of {} posts, {} failed'.format(generated, failed)))
@@ -0,0 +1,197 @@
+import csv
+import itertools
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from social_media.feed import fan_out_posts
+from social_media.images import get_image_preview, ImageTooLarge
+from social_media.models import AppUser, Post, ImageJob
+
+
+class InvalidRow:
+    '''
+    Stands in for a line of the input file that is not a JSON object, so it can be skipped
+    with the other invalid rows instead of stopping the import
+    '''
+
+    def __init__(self, line_number, error):
+        self.line_number = line_number
+        self.error = error
+
+    def __str__(self):
+        return 'line {}: {}'.format(self.line_number, self.error)
+
+
+def read_rows(path, file_format):
+    '''
+    Yield the rows of a JSONL or CSV file one at a time
+    '''
+    with open(path, newline='') as input_file:
+        if file_format == 'csv':
+            yield from csv.DictReader(input_file)
+        else:
+            for line_number, line in enumerate(input_file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as error:
+                    yield InvalidRow(line_number, error)
+                    continue
+                yield row if isinstance(row, dict) else InvalidRow(line_number, 'not a JSON object')
+
+
+def parse_date_created(value):
+    '''
+    Return the datetime of a date_created value, None if it is not a valid datetime
+    '''
+    try:
+        return parse_datetime(value)
+    except (TypeError, ValueError):
+        # well formatted but out of range, such as a 13th month
+        return None
+
+
+def store_image(storage, source_path, link):
+    '''
+    Store an image and return its name and its preview
+    '''
+    name = storage.import_file(source_path, link)
+    with storage.open(name, 'rb') as image_file:
+        return name, get_image_preview(image_file)
+
+
+class Command(BaseCommand):
+    help = 'Import posts from a JSONL or CSV file with the fields: owner (username), text, image (path) and date_created'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSONL or CSV file to import')
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help='format of the file, guessed from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of posts inserted per transaction')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='number of workers copying images')
+        parser.add_argument('--image-root', default='',
+                            help='folder that relative image paths are resolved against')
+        parser.add_argument('--link', action='store_true',
+                            help='hard link images into the media folder instead of copying them when possible')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError('File "{}" does not exist.'.format(path))
+
+        file_format = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'jsonl')
+        rows = read_rows(path, file_format)
+
+        self.owner_ids = {}
+        self.imported = 0
+        self.skipped = 0
+        start_time = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                batch = list(itertools.islice(rows, options['batch_size']))
+                if not batch:
+                    break
+
+                self.import_batch(batch, executor, options)
+
+                elapsed = time.monotonic() - start_time
+                self.stdout.write('Imported {} posts ({:.0f} posts/s)'.format(
+                    self.imported, self.imported / elapsed if elapsed else 0))
+
+        elapsed = time.monotonic() - start_time
+        self.stdout.write(self.style.SUCCESS('Imported {} posts, skipped {} rows in {:.1f}s ({:.0f} posts/s)'.format(
+            self.imported, self.skipped, elapsed, self.imported / elapsed if elapsed else 0)))
+
+    def get_owner_ids(self, usernames):
+        # only look up the usernames that are not cached yet
+        missing_usernames = set(usernames) - set(self.owner_ids)
+        if missing_usernames:
+            self.owner_ids.update(AppUser.objects.filter(
+                username__in=missing_usernames).values_list('username', 'pk'))
+
+        return self.owner_ids
+
+    def import_batch(self, batch, executor, options):
+        rows = []
+        for row in batch:
+            if isinstance(row, InvalidRow):
+                self.stderr.write('Skipped invalid row: {}'.format(row))
+                self.skipped += 1
+            else:
+                rows.append(row)
+
+        owner_ids = self.get_owner_ids(row.get('owner') for row in rows)
+        storage = Post._meta.get_field('image').storage
+
+        posts = []
+        copies = []
+        for row in rows:
+            owner_id = owner_ids.get(row.get('owner'))
+            text = row.get('text') or None
+            image = row.get('image') or None
+            if owner_id is None or (text is None and image is None):
+                self.stderr.write('Skipped invalid row: {}'.format(row))
+                self.skipped += 1
+                continue
+
+            # the uid is generated here so the post can be found again after the insert
+            post = Post(uid=uuid.uuid4(), owner_id=owner_id, text=text)
+            if row.get('date_created'):
+                # checked before the image is copied, so a skipped row leaves no file behind
+                post.date_created = parse_date_created(row['date_created'])
+                if post.date_created is None:
+                    self.stderr.write('Skipped row with invalid date_created: {}'.format(row))
+                    self.skipped += 1
+                    continue
+
+            if image:
+                post.image_state = 'pending'
+                source_path = os.path.join(options['image_root'], image)
+                copies.append((post, executor.submit(
+                    store_image, storage, source_path, options['link'])))
+
+            posts.append(post)
+
+        # only insert the posts whose image is in place
+        failed_posts = set()
+        for post, copy in copies:
+            try:
+                post.image.name, preview = copy.result()
+                for name, value in preview.items():
+                    setattr(post, name, value)
+            except (OSError, ImageTooLarge) as error:
+                self.stderr.write('Skipped post with image error: {}'.format(error))
+                self.skipped += 1
+                failed_posts.add(post.uid)
+        posts = [post for post in posts if post.uid not in failed_posts]
+
+        with transaction.atomic():
+            Post.objects.bulk_create(posts)
+
+            # the primary keys are not returned by every database backend
+            if posts and posts[0].pk is None:
+                post_ids = dict(Post.objects.filter(uid__in=[post.uid for post in posts]).values_list('uid', 'pk'))
+                for post in posts:
+                    post.pk = post_ids[post.uid]
+
+            fan_out_posts(posts)
+
+            # the images are resized by the process_image_jobs worker
+            ImageJob.objects.bulk_create([
+                ImageJob(kind='post_image', object_id=post.pk, name=post.image.name)
+                for post in posts if post.image
+            ])
+
+        self.imported += len(posts)
@@ -0,0 +1,50 @@
+import gzip
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.json', '.svg', '.html', '.txt', '.xml')
+
+
+def compress_gzip(content):
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+class Command(BaseCommand):
+    help = 'Write .gz (and .br when brotli is installed) copies of the collected static files for StaticFilesApp'
+
+    def handle(self, *args, **options):
+        compressors = [('.gz', compress_gzip)]
+        if brotli is not None:
+            compressors.append(('.br', brotli.compress))
+
+        written = 0
+        for directory, _, file_names in os.walk(settings.STATIC_ROOT):
+            for file_name in file_names:
+                if not file_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                    continue
+
+                path = os.path.join(directory, file_name)
+                with open(path, 'rb') as source_file:
+                    content = source_file.read()
+
+                for extension, compress in compressors:
+                    compressed = compress(content)
+                    # small files can grow when compressed
+                    if len(compressed) >= len(content):
+                        continue
+
+                    with open(path + extension, 'wb') as compressed_file:
+                        compressed_file.write(compressed)
+                    shutil.copystat(path, path + extension)
+                    written += 1
+
+        self.stdout.write(self.style.SUCCESS('Wrote {} compressed files'.format(written)))
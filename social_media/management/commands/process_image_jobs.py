@@ -0,0 +1,40 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from social_media.jobs import process_image_jobs
+
+
+class Command(BaseCommand):
+    help = 'Process the queued image jobs (resizing, re-encoding and resized copies) with a pool of processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='number of jobs claimed at a time')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='exit when the queue is empty instead of waiting for new jobs')
+
+    def handle(self, *args, **options):
+        # the worker processes must not inherit the database connection
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            while True:
+                start_time = time.monotonic()
+                processed = process_image_jobs(executor, options['batch_size'])
+
+                if processed:
+                    elapsed = time.monotonic() - start_time
+                    self.stdout.write('Processed {} image jobs ({:.1f} jobs/s)'.format(
+                        processed, processed / elapsed if elapsed else 0))
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
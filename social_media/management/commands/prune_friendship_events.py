@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from social_media.graph import prune_friendship_events
+
+
+class Command(BaseCommand):
+    help = 'Delete the friendship events that are older than FRIENDSHIP_EVENT_RETENTION'
+
+    def handle(self, *args, **options):
+        deleted = prune_friendship_events()
+
+        self.stdout.write(self.style.SUCCESS('Deleted {} friendship events'.format(deleted)))
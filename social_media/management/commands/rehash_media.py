@@ -0,0 +1,129 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from social_media.images import get_derivative_name, IMAGE_FORMATS
+from social_media.models import AppUser, Post, ImageJob, DEFAULT_PROFILE_IMAGE_PATH
+from social_media.storage import CONTENT_ADDRESSED_ROOT, link_file_atomic
+
+# files changed (or linked) more recently than this (in seconds) may belong to an upload whose row is not committed yet
+PRUNE_MIN_AGE = 60 * 60
+
+IMAGE_FIELDS = (
+    (AppUser, 'profile_image'),
+    (Post, 'image'),
+)
+
+
+def get_derivative_names(name):
+    for size in settings.IMAGE_DERIVATIVE_SIZES:
+        for image_format in IMAGE_FORMATS:
+            yield get_derivative_name(name, size, image_format)
+
+
+def get_digest(file_name):
+    # <digest>.jpg and its resized copies <digest>_96.webp share the digest
+    return os.path.splitext(file_name)[0].split('_')[0]
+
+
+class Command(BaseCommand):
+    help = 'Move the existing profile and post images into the content addressed storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='number of rows updated per transaction')
+        parser.add_argument('--delete-originals', action='store_true',
+                            help='remove the files at the old paths once the rows point to the new ones')
+        parser.add_argument('--prune', action='store_true',
+                            help='remove the stored files that no row refers to anymore')
+
+    def handle(self, *args, **options):
+        for model, field_name in IMAGE_FIELDS:
+            self.rehash_field(model, field_name, options)
+
+        if options['prune']:
+            self.prune()
+
+    def rehash_field(self, model, field_name, options):
+        storage = model._meta.get_field(field_name).storage
+        # the default profile image is shared by every new user, so it stays where it is
+        rows = model.objects.exclude(**{field_name: ''}).exclude(**{field_name: None}).exclude(
+            **{field_name: DEFAULT_PROFILE_IMAGE_PATH}).exclude(
+            **{field_name + '__startswith': CONTENT_ADDRESSED_ROOT + '/'}).only('pk', field_name)
+
+        renamed_count = 0
+        missing_count = 0
+        content_names = set()
+        rows = rows.iterator(chunk_size=options['batch_size'])
+        while True:
+            batch = [row for _, row in zip(range(options['batch_size']), rows)]
+            if not batch:
+                break
+
+            renamed = {}
+            for row in batch:
+                name = getattr(row, field_name).name
+                if name in renamed:
+                    continue
+                if not storage.exists(name):
+                    self.stderr.write('Missing file {}'.format(name))
+                    missing_count += 1
+                    continue
+
+                # the file is linked, so the old path keeps working until the rows are updated
+                renamed[name] = storage.import_file(storage.path(name), link=True)
+                for old_name, new_name in zip(get_derivative_names(name), get_derivative_names(renamed[name])):
+                    if storage.exists(old_name):
+                        link_file_atomic(storage.path(old_name), storage.path(new_name))
+
+            updated_rows = []
+            for row in batch:
+                name = getattr(row, field_name).name
+                if name in renamed:
+                    setattr(row, field_name, renamed[name])
+                    updated_rows.append(row)
+
+            with transaction.atomic():
+                model.objects.bulk_update(updated_rows, [field_name])
+                for old_name, new_name in renamed.items():
+                    ImageJob.objects.filter(name=old_name, state__in=('pending', 'running')).update(
+                        name=new_name)
+
+            if options['delete_originals']:
+                for name in renamed:
+                    for old_name in (name, *get_derivative_names(name)):
+                        if storage.exists(old_name):
+                            storage.delete(old_name)
+
+            renamed_count += len(updated_rows)
+            content_names.update(renamed.values())
+
+        self.stdout.write('{}.{}: moved {} images into {} files, {} missing'.format(
+            model.__name__, field_name, renamed_count, len(content_names), missing_count))
+
+    def prune(self):
+        referenced_digests = set()
+        for model, field_name in IMAGE_FIELDS:
+            names = model.objects.filter(**{field_name + '__startswith': CONTENT_ADDRESSED_ROOT + '/'}).values_list(
+                field_name, flat=True)
+            referenced_digests.update(get_digest(os.path.basename(name)) for name in names.iterator())
+        # images waiting for their job are still in use
+        referenced_digests.update(get_digest(os.path.basename(name)) for name in ImageJob.objects.filter(
+            state__in=('pending', 'running')).values_list('name', flat=True))
+
+        storage = Post._meta.get_field('image').storage
+        root = storage.path(CONTENT_ADDRESSED_ROOT)
+        min_date = time.time() - PRUNE_MIN_AGE
+        removed_count = 0
+        for directory, _, file_names in os.walk(root):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                if get_digest(file_name) in referenced_digests or os.path.getctime(path) > min_date:
+                    continue
+                os.remove(path)
+                removed_count += 1
+
+        self.stdout.write('Removed {} unused files'.format(removed_count))
@@ -0,0 +1,238 @@
+import asyncio
+import mimetypes
+import os
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+
+from .storage import CONTENT_ADDRESSED_ROOT
+
+CHUNK_SIZE = 256 * 1024
+
+# compressed copies (e.g. style.css.br) that are sent instead of the file when the client accepts them
+PRECOMPRESSED_ENCODINGS = (
+    ('br', '.br'),
+    ('gzip', '.gz'),
+)
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def get_cache_control(relative_path):
+    '''
+    Return the Cache-Control header of a served file. Files stored under the hash
+    of their content never change, so browsers may cache them for good.
+    '''
+    if relative_path.startswith(CONTENT_ADDRESSED_ROOT + '/'):
+        return 'public, max-age={}, immutable'.format(settings.MEDIA_CACHE_MAX_AGE)
+    # the file may be replaced at the same path, so it has to be revalidated
+    return 'public, no-cache'
+
+
+def get_etag(stat_result, encoding=None):
+    etag = '{:x}-{:x}'.format(stat_result.st_mtime_ns, stat_result.st_size)
+    if encoding is not None:
+        etag += '-' + encoding
+    return '"{}"'.format(etag)
+
+
+def parse_range(header, size):
+    '''
+    Return the first and last byte of the range asked for by a Range header,
+    or None when the header should be ignored and the whole file sent
+    '''
+    if not header.startswith('bytes='):
+        return None
+    spec = header[len('bytes='):].strip()
+    # several ranges would need a multipart response, the whole file is sent instead
+    if ',' in spec:
+        return None
+
+    first, _, last = spec.partition('-')
+    try:
+        if first == '':
+            # the last n bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable
+            return max(size - length, 0), size - 1
+
+        first = int(first)
+        last = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if first >= size:
+        raise RangeNotSatisfiable
+    if first > last:
+        return None
+    return first, min(last, size - 1)
+
+
+def is_not_modified(headers, etag, modified_time):
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [
+            tag.strip() for tag in if_none_match.split(',')]
+
+    if_modified_since = parse_http_date_safe(headers.get('if-modified-since', ''))
+    return if_modified_since is not None and int(modified_time) <= if_modified_since
+
+
+def is_range_current(headers, etag, modified_time):
+    # a Range with an If-Range that no longer matches gets the whole, new file
+    if_range = headers.get('if-range')
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(modified_time) <= date
+
+
+class StaticFilesApp:
+    '''
+    ASGI application that serves the uploaded and the collected static files before
+    the requests reach Django, with sendfile when the server supports it, Range requests,
+    conditional requests and precompressed copies. Other requests, and files that do not
+    exist, are passed to the wrapped application.
+    '''
+
+    def __init__(self, application):
+        self.application = application
+
+    def get_mounts(self):
+        # read on every request so that the settings can be overridden
+        return (
+            (settings.MEDIA_URL, settings.MEDIA_ROOT),
+            (settings.STATIC_URL, settings.STATIC_ROOT),
+        )
+
+    def find_file(self, url_path):
+        for url_prefix, root in self.get_mounts():
+            if not root or not url_path.startswith(url_prefix):
+                continue
+
+            relative_path = url_path[len(url_prefix):]
+            try:
+                path = safe_join(root, relative_path)
+                stat_result = os.stat(path)
+            except (SuspiciousFileOperation, OSError, ValueError):
+                continue
+            if stat.S_ISREG(stat_result.st_mode):
+                return relative_path, path, stat_result
+
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            found = self.find_file(scope['path'])
+            if found is not None:
+                await self.serve(scope, send, *found)
+                return
+
+        await self.application(scope, receive, send)
+
+    def get_precompressed(self, headers, path, stat_result):
+        accept_encoding = headers.get('accept-encoding', '')
+        accepted = [value.split(';')[0].strip() for value in accept_encoding.split(',')]
+        for encoding, extension in PRECOMPRESSED_ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                compressed_stat = os.stat(path + extension)
+            except OSError:
+                continue
+            # a copy older than the file is stale
+            if compressed_stat.st_mtime_ns >= stat_result.st_mtime_ns:
+                return encoding, path + extension, compressed_stat
+        return None
+
+    async def serve(self, scope, send, relative_path, path, stat_result):
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                   for name, value in scope.get('headers', [])}
+        content_type, _ = mimetypes.guess_type(path)
+        response_headers = [
+            (b'content-type', (content_type or 'application/octet-stream').encode()),
+            (b'cache-control', get_cache_control(relative_path).encode()),
+            (b'accept-ranges', b'bytes'),
+        ]
+
+        # caches must keep the compressed and the plain responses apart
+        if any(os.path.exists(path + extension) for _, extension in PRECOMPRESSED_ENCODINGS):
+            response_headers.append((b'vary', b'Accept-Encoding'))
+
+        # byte ranges are taken from the file itself, never from a compressed copy
+        encoding = None
+        range_header = headers.get('range')
+        if range_header is None:
+            precompressed = self.get_precompressed(headers, path, stat_result)
+            if precompressed is not None:
+                encoding, path, stat_result = precompressed
+                response_headers.append((b'content-encoding', encoding.encode()))
+
+        etag = get_etag(stat_result, encoding)
+        modified_time = stat_result.st_mtime
+        response_headers += [
+            (b'etag', etag.encode()),
+            (b'last-modified', http_date(modified_time).encode()),
+        ]
+
+        if is_not_modified(headers, etag, modified_time):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': response_headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        size = stat_result.st_size
+        status = 200
+        first, last = 0, size - 1
+        if range_header is not None and is_range_current(headers, etag, modified_time):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                response_headers.append((b'content-range', 'bytes */{}'.format(size).encode()))
+                await send({'type': 'http.response.start', 'status': 416, 'headers': response_headers})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            if byte_range is not None:
+                status = 206
+                first, last = byte_range
+                response_headers.append((b'content-range', 'bytes {}-{}/{}'.format(
+                    first, last, size).encode()))
+
+        length = last - first + 1
+        response_headers.append((b'content-length', str(length).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+
+        if scope['method'] == 'HEAD' or length == 0:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        with open(path, 'rb') as served_file:
+            if 'http.response.zerocopysend' in scope.get('extensions', {}):
+                # the server copies the file to the socket in the kernel (sendfile)
+                await send({'type': 'http.response.zerocopysend', 'file': served_file,
+                            'offset': first, 'count': length})
+                return
+
+            await self.send_chunks(send, served_file, first, length)
+
+    async def send_chunks(self, send, served_file, first, length):
+        loop = asyncio.get_running_loop()
+        served_file.seek(first)
+        while length > 0:
+            # the file is read in a thread so the event loop is never blocked on the disk
+            chunk = await loop.run_in_executor(None, served_file.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': length > 0})
+
+        if length > 0:
+            # the file was truncated while being sent
+            await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,53 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_timelines(apps, schema_editor):
+    # materialize the timelines for the posts that already exist
+    Post = apps.get_model('social_media', 'Post')
+    UserRelationship = apps.get_model('social_media', 'UserRelationship')
+    TimelineEntry = apps.get_model('social_media', 'TimelineEntry')
+
+    viewers = {}
+    for user1_id, user2_id in UserRelationship.objects.filter(relation_type='friends').values_list('user1_id', 'user2_id'):
+        viewers.setdefault(user1_id, []).append(user2_id)
+        viewers.setdefault(user2_id, []).append(user1_id)
+
+    entries = []
+    for post_id, owner_id, date_created in Post.objects.values_list('pk', 'owner_id', 'date_created').iterator():
+        for viewer_id in [owner_id] + viewers.get(owner_id, []):
+            entries.append(TimelineEntry(
+                viewer_id=viewer_id, post_id=post_id, date_created=date_created))
+
+    TimelineEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0009_post'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_created', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='social_media.post')),
+                ('viewer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['viewer', '-date_created', '-post'], name='timeline_viewer_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('viewer', 'post')},
+        ),
+        migrations.RunPython(populate_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+def count_friends(apps, schema_editor):
+    AppUser = apps.get_model('social_media', 'AppUser')
+    UserRelationship = apps.get_model('social_media', 'UserRelationship')
+
+    friend_counts = {}
+    for user1_id, user2_id in UserRelationship.objects.filter(relation_type='friends').values_list('user1_id', 'user2_id'):
+        friend_counts[user1_id] = friend_counts.get(user1_id, 0) + 1
+        friend_counts[user2_id] = friend_counts.get(user2_id, 0) + 1
+
+    for user_id, friend_count in friend_counts.items():
+        AppUser.objects.filter(pk=user_id).update(friend_count=friend_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appuser',
+            name='friend_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(count_friends, migrations.RunPython.noop),
+    ]
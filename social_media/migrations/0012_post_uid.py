@@ -0,0 +1,34 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:19
+
+from django.db import migrations, models
+import uuid
+
+
+def generate_uids(apps, schema_editor):
+    # existing posts keep their image name (images/post_images/<owner>/<pk>/post_image.jpg),
+    # the uid is only used to lay out the images of new posts
+    Post = apps.get_model('social_media', 'Post')
+    for post in Post.objects.all().only('pk'):
+        post.uid = uuid.uuid4()
+        post.save(update_fields=['uid'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0011_appuser_friend_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, null=True),
+        ),
+        migrations.RunPython(generate_uids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='post',
+            name='uid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+    ]
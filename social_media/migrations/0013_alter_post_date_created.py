@@ -0,0 +1,19 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:24
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0012_post_uid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='date_created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0013_alter_post_date_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post_image', 'post_image'), ('profile_image', 'profile_image')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('name', models.CharField(max_length=256)),
+                ('state', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_state',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='ready', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(fields=['state', 'id'], name='image_job_state_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.2 on 2026-10-18 18:38
+
+from django.db import migrations, models
+import social_media.models
+import social_media.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0014_image_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='appuser',
+            name='profile_image',
+            field=models.ImageField(blank=True, default='images/default_images/default_profile.png', max_length=256, null=True, storage=social_media.storage.ContentAddressedStorage(), upload_to=social_media.models.get_profile_image_path),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, max_length=256, null=True, storage=social_media.storage.ContentAddressedStorage(), upload_to=social_media.models.get_post_image_path),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0016_post_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_srcset_widths',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0017_post_image_srcset_widths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendshipEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user1_id', models.BigIntegerField()),
+                ('user2_id', models.BigIntegerField()),
+                ('added', models.BooleanField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
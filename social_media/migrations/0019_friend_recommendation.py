@@ -0,0 +1,34 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0018_friendship_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('mutual_friend_count', models.PositiveIntegerField()),
+                ('recommended_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='friendrecommendation',
+            index=models.Index(fields=['user', 'rank'], name='friend_recommendation_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='friendrecommendation',
+            unique_together={('user', 'recommended_user')},
+        ),
+    ]
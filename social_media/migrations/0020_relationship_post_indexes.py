@@ -0,0 +1,25 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0019_friend_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['owner', '-date_created', '-id'], name='post_owner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrelationship',
+            index=models.Index(fields=['user1', 'relation_type', 'date_modified'], name='relationship_user1_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrelationship',
+            index=models.Index(fields=['user2', 'relation_type', 'date_modified'], name='relationship_user2_type_idx'),
+        ),
+    ]
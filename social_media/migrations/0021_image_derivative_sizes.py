@@ -0,0 +1,43 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+from social_media.images import get_derivative_name
+
+
+def record_derivative_sizes(apps, schema_editor):
+    # the existing copies are looked up once here, so the pages do not have to check the storage
+    for model_name, field_name in (('AppUser', 'profile_image'), ('Post', 'image')):
+        model = apps.get_model('social_media', model_name)
+        storage = model._meta.get_field(field_name).storage
+        names = model.objects.exclude(**{field_name: ''}).exclude(**{field_name: None}).values_list(
+            field_name, flat=True).distinct()
+
+        for name in names.iterator():
+            sizes = [size for size in sorted(settings.IMAGE_DERIVATIVE_SIZES)
+                     if storage.exists(get_derivative_name(name, size))]
+            if sizes:
+                model.objects.filter(**{field_name: name}).update(
+                    **{field_name + '_derivative_sizes': ','.join(map(str, sizes))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0020_relationship_post_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appuser',
+            name='profile_image_derivative_sizes',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_derivative_sizes',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(record_derivative_sizes, migrations.RunPython.noop),
+    ]
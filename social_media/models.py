@@ -1,17 +1,22 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
-from .storage import OverwriteFileStorage
+from .storage import ContentAddressedStorage
 
 DEFAULT_PROFILE_IMAGE_PATH = 'images/default_images/default_profile.png'
 
 
+# ContentAddressedStorage renames the files after the hash of their content,
+# only the extension of these paths is kept
 def get_profile_image_path(instance, _):
     return 'images/profile_images/{}/profile_image.jpg'.format(str(instance.pk))
 
 
 def get_post_image_path(instance, _):
-    return 'images/post_images/{}/{}/post_image.jpg'.format(str(instance.owner.pk), str(instance.pk))
+    return 'images/post_images/{}/{}/post_image.jpg'.format(str(instance.owner_id), instance.uid.hex)
 
 
 class AppUserManager(BaseUserManager):
@@ -53,8 +58,12 @@ class AppUser(AbstractUser):
     email = models.EmailField(
         max_length=256, null=False, blank=False, unique=True)
     profile_image = models.ImageField(max_length=256, null=True, blank=True,
-                                      upload_to=get_profile_image_path, storage=OverwriteFileStorage(),
+                                      upload_to=get_profile_image_path, storage=ContentAddressedStorage(),
                                       default=DEFAULT_PROFILE_IMAGE_PATH)
+    # comma separated sizes of the resized copies of the profile image, empty until generated
+    profile_image_derivative_sizes = models.CharField(max_length=100, blank=True, default='', editable=False)
+    # number of friends, used to decide whether the posts are pushed or pulled in the home feed
+    friend_count = models.PositiveIntegerField(default=0, db_index=True)
 
     # set email field as username
     USERNAME_FIELD = 'email'
@@ -82,6 +91,14 @@ class UserRelationship(models.Model):
 
     class Meta:
         unique_together = ('user1', 'user2')
+        indexes = [
+            # the friends and the pending requests of a user are looked up from both sides
+            # of the relationship, the pending requests newest first
+            models.Index(fields=['user1', 'relation_type', 'date_modified'],
+                         name='relationship_user1_type_idx'),
+            models.Index(fields=['user2', 'relation_type', 'date_modified'],
+                         name='relationship_user2_type_idx'),
+        ]
 
     def __str__(self):
         return '{} -- {}  type: {}'.format(self.user1.username, self.user2.username, self.relation_type)
@@ -98,21 +115,126 @@ class UserRelationship(models.Model):
         super(UserRelationship, self).save(*args, **kwargs)
 
 
+class FriendshipEvent(models.Model):
+    # append-only log of friendships being made and removed, replayed by the in-memory
+    # friend graph of every process to stay in sync with the UserRelationship table
+    user1_id = models.BigIntegerField()
+    user2_id = models.BigIntegerField()
+    # False when the friendship was removed
+    added = models.BooleanField()
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '{} {} -- {}'.format('added' if self.added else 'removed', self.user1_id, self.user2_id)
+
+
+class FriendRecommendation(models.Model):
+    # a friend of friends suggested to the user, precomputed by the
+    # compute_friend_recommendations command
+    user = models.ForeignKey(
+        AppUser, on_delete=models.CASCADE, related_name='friend_recommendations')
+    recommended_user = models.ForeignKey(
+        AppUser, on_delete=models.CASCADE, related_name='+')
+    # position in the user's list of recommendations, 0 being the best
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    mutual_friend_count = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('user', 'recommended_user')
+        indexes = [
+            models.Index(fields=['user', 'rank'], name='friend_recommendation_idx'),
+        ]
+
+    def __str__(self):
+        return '{} -- {}  rank: {}'.format(self.user.username, self.recommended_user.username, self.rank)
+
+
+IMAGE_STATE = (
+    ('pending', 'pending'),
+    ('ready', 'ready'),
+    ('failed', 'failed'),
+)
+
+
 class Post(models.Model):
-    image = models.ImageField(
-        max_length=256, blank=True, null=True, upload_to=get_post_image_path)
+    uid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    image = models.ImageField(max_length=256, blank=True, null=True,
+                              upload_to=get_post_image_path, storage=ContentAddressedStorage())
     text = models.CharField(max_length=500, blank=True, null=True)
-    date_created = models.DateTimeField(auto_now_add=True)
+    # not auto_now_add so that imported posts can keep their original date
+    date_created = models.DateTimeField(default=timezone.now, editable=False)
     owner = models.ForeignKey(AppUser, on_delete=models.CASCADE)
+    # whether the uploaded image has been processed by the image job worker
+    image_state = models.CharField(
+        max_length=20, choices=IMAGE_STATE, default='ready')
+    # computed when the image is uploaded, so pages can lay the image out before it is downloaded
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_color = models.CharField(max_length=7, blank=True, default='', editable=False)
+    image_placeholder = models.TextField(blank=True, default='', editable=False)
+    # comma separated widths of the copies used in the srcset of the image, empty until generated
+    image_srcset_widths = models.CharField(max_length=100, blank=True, default='', editable=False)
+    # comma separated sizes of the resized copies of the image, empty until generated
+    image_derivative_sizes = models.CharField(max_length=100, blank=True, default='', editable=False)
 
-    def save(self, *args, **kwargs):
-        if self.pk is None:
-            # make instance pk retrievable when storing image
-            temp = self.image
-            self.image = None
-            super(Post, self).save(*args, **kwargs)
-            self.image = temp
-            if 'force_insert' in kwargs:
-                kwargs.pop('force_insert')
-
-        super(Post, self).save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            # the posts of a user are listed newest first without sorting them
+            models.Index(fields=['owner', '-date_created', '-id'],
+                         name='post_owner_date_idx'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    # a post materialized into the home feed of a viewer (fan-out on write)
+    viewer = models.ForeignKey(
+        AppUser, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    # copied from the post so the feed can be read with a single index range scan
+    date_created = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('viewer', 'post')
+        indexes = [
+            models.Index(fields=['viewer', '-date_created', '-post'],
+                         name='timeline_viewer_date_idx'),
+        ]
+
+    def __str__(self):
+        return '{} -- post {}'.format(self.viewer.username, self.post.pk)
+
+
+IMAGE_JOB_KIND = (
+    ('post_image', 'post_image'),
+    ('profile_image', 'profile_image'),
+)
+
+IMAGE_JOB_STATE = (
+    ('pending', 'pending'),
+    ('running', 'running'),
+    ('done', 'done'),
+    ('failed', 'failed'),
+)
+
+
+class ImageJob(models.Model):
+    # an uploaded image waiting to be processed by the process_image_jobs command
+    kind = models.CharField(max_length=20, choices=IMAGE_JOB_KIND)
+    # pk of the post or the user the image belongs to
+    object_id = models.BigIntegerField()
+    name = models.CharField(max_length=256)
+    state = models.CharField(
+        max_length=20, choices=IMAGE_JOB_STATE, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'id'], name='image_job_state_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {} -- {}'.format(self.kind, self.object_id, self.state)
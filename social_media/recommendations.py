@@ -0,0 +1,144 @@
+import heapq
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import UserRelationship, FriendRecommendation
+from .images import get_derivative_url, AVATAR_SIZE
+
+# number of recommendations shown on the home and profile pages
+WIDGET_SIZE = 5
+
+# relationships read once by the command and shared with the worker processes
+_snapshot = None
+
+
+def load_relationships():
+    '''
+    Read all relationships in one scan. Return the friends of every user with the time
+    each friendship was made, the users every user has a relationship of any type with,
+    and the time the relationships were read.
+    '''
+    friends = defaultdict(list)
+    related = defaultdict(set)
+    relationships = UserRelationship.objects.values_list(
+        'user1_id', 'user2_id', 'relation_type', 'date_modified')
+
+    for user1_id, user2_id, relation_type, date_modified in relationships.iterator():
+        related[user1_id].add(user2_id)
+        related[user2_id].add(user1_id)
+        if relation_type == 'friends':
+            timestamp = date_modified.timestamp()
+            friends[user1_id].append((user2_id, timestamp))
+            friends[user2_id].append((user1_id, timestamp))
+
+    return dict(friends), dict(related), time.time()
+
+
+def init_worker(snapshot):
+    global _snapshot
+    _snapshot = snapshot
+
+
+def score_candidates(user_id, friends, related, now):
+    '''
+    Return the best friends of friends of a user as (user id, score, mutual friend count),
+    best first. Every mutual friend adds 1 to the score of a candidate, plus up to 1 more
+    the more recently the candidate became friends with the mutual friend.
+    '''
+    half_life = settings.FRIEND_RECOMMENDATION_HALF_LIFE * 24 * 60 * 60
+    excluded = related.get(user_id, set())
+    scores = defaultdict(float)
+    mutual_friend_counts = defaultdict(int)
+
+    for friend_id, _ in friends.get(user_id, ()):
+        for candidate_id, timestamp in friends.get(friend_id, ()):
+            # the user already knows the candidate or has a pending friend request with them
+            if candidate_id == user_id or candidate_id in excluded:
+                continue
+            scores[candidate_id] += 1 + 0.5 ** (max(0, now - timestamp) / half_life)
+            mutual_friend_counts[candidate_id] += 1
+
+    # ties go to the user with the smaller id so the results are stable
+    best = heapq.nsmallest(settings.FRIEND_RECOMMENDATION_COUNT, scores.items(),
+                           key=lambda item: (-item[1], item[0]))
+    return [(candidate_id, score, mutual_friend_counts[candidate_id]) for candidate_id, score in best]
+
+
+def compute_recommendations(user_ids):
+    '''
+    Score the recommendations of a batch of users, runs in a worker process so it must not use the database
+    '''
+    friends, related, now = _snapshot
+    return [(user_id, score_candidates(user_id, friends, related, now)) for user_id in user_ids]
+
+
+def store_recommendations(results):
+    '''
+    Replace the stored recommendations of a batch of users
+    '''
+    recommendations = []
+    for user_id, candidates in results:
+        for rank, (candidate_id, score, mutual_friend_count) in enumerate(candidates):
+            recommendations.append(FriendRecommendation(
+                user_id=user_id, recommended_user_id=candidate_id, rank=rank,
+                score=score, mutual_friend_count=mutual_friend_count))
+
+    with transaction.atomic():
+        FriendRecommendation.objects.filter(
+            user_id__in=[user_id for user_id, _ in results]).delete()
+        FriendRecommendation.objects.bulk_create(recommendations)
+
+
+def update_recommendations(user_ids, executor=None, batch_size=1000):
+    '''
+    Recompute and store the recommendations of the given users, in the processes of the
+    executor if one is given. The executor must have been created with init_worker as
+    its initializer. Return the number of stored recommendations.
+    '''
+    batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+    if executor is None:
+        init_worker(load_relationships())
+        results = map(compute_recommendations, batches)
+    else:
+        results = executor.map(compute_recommendations, batches)
+
+    stored = 0
+    for batch_results in results:
+        store_recommendations(batch_results)
+        stored += sum(len(candidates) for _, candidates in batch_results)
+
+    return stored
+
+
+def remove_recommendation(user1_id, user2_id):
+    '''
+    Remove the recommendations between two users who now have a relationship
+    '''
+    FriendRecommendation.objects.filter(
+        Q(user_id=user1_id, recommended_user_id=user2_id) | Q(user_id=user2_id, recommended_user_id=user1_id)).delete()
+
+
+def get_recommendations(user, limit=None):
+    '''
+    Return the stored recommendations of a user, best first
+    '''
+    recommendations = FriendRecommendation.objects.filter(user=user).select_related(
+        'recommended_user').order_by('rank')
+
+    return list(recommendations[:limit or settings.FRIEND_RECOMMENDATION_COUNT])
+
+
+def get_recommendation_data(recommendation):
+    '''
+    Return the data of a recommendation that is displayed on the home and profile pages
+    '''
+    return {
+        'id': recommendation.recommended_user.pk,
+        'profile_image_url': get_derivative_url(recommendation.recommended_user.profile_image, AVATAR_SIZE),
+        'username': recommendation.recommended_user.username,
+        'mutual_friend_count': recommendation.mutual_friend_count,
+    }
@@ -0,0 +1,208 @@
+'''
+Friend request state machine. Each transition is a single conditional INSERT, UPDATE or
+DELETE whose row count tells whether the relationship was in the expected state, so
+concurrent clicks cannot both succeed:
+
+    (none) --send--> pending --accept--> friends --remove--> (none)
+                     pending --cancel/decline--> (none)
+
+The statements bypass save() and delete(), so the side effects of a friendship being made
+or removed are run explicitly, in the same transaction as the transition.
+'''
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, Count
+from django.db.models.functions import Substr
+from django.utils import timezone
+
+from .models import AppUser, UserRelationship
+from .feed import (backfill_timelines,
+                   prune_timelines,
+                   update_friend_count,
+                   get_friend_ids,
+                   push_posts)
+from .graph import record_friendship_event
+from .recommendations import remove_recommendation
+
+
+def get_request_key(sender_id, receiver_id):
+    '''
+    Return user1_id, user2_id and the relation type of a friend request sent by the sender
+    '''
+    if sender_id < receiver_id:
+        return sender_id, receiver_id, 'pending_user1_user2'
+    return receiver_id, sender_id, 'pending_user2_user1'
+
+
+def get_relationship_statuses(user_id, other_ids):
+    '''
+    Return a dict of the status of the relationship between the user and each of the other users
+    in one query: 'friends', 'sender' (the user sent a friend request), 'receiver' (the user received
+    a friend request) or 'not_friend'
+    '''
+    other_ids = list(other_ids)
+    statuses = dict.fromkeys(other_ids, 'not_friend')
+    relationships = UserRelationship.objects.filter(
+        Q(user1_id=user_id, user2_id__in=other_ids) | Q(user2_id=user_id, user1_id__in=other_ids)).values_list(
+        'user1_id', 'user2_id', 'relation_type')
+
+    for user1_id, user2_id, relation_type in relationships:
+        if relation_type == 'friends':
+            status = 'friends'
+        elif (relation_type == 'pending_user1_user2') == (user1_id == user_id):
+            status = 'sender'
+        else:
+            status = 'receiver'
+        statuses[user2_id if user1_id == user_id else user1_id] = status
+
+    return statuses
+
+
+def get_relationship_status(user_id, other_id):
+    return get_relationship_statuses(user_id, [other_id])[other_id]
+
+
+def get_friends(user_id):
+    '''
+    Return a queryset of the friends of a user. The friends are found from both sides of
+    their relationships with the user through the relationship indexes, in the same query.
+    '''
+    return AppUser.objects.filter(
+        Q(pk__in=UserRelationship.objects.filter(user1_id=user_id, relation_type='friends').values('user2_id')) |
+        Q(pk__in=UserRelationship.objects.filter(user2_id=user_id, relation_type='friends').values('user1_id')))
+
+
+def get_friend_page(user_id, cursor=None, start=None, page_size=None):
+    '''
+    Return a page of the friends of a user ordered by username and the cursor of the next page
+    (None on the last page). The page starts after the username given as cursor, or else at the
+    first username that is not before start.
+    '''
+    page_size = page_size or settings.FRIEND_LIST_PAGE_SIZE
+    friends = get_friends(user_id).only('username', 'profile_image', 'profile_image_derivative_sizes').order_by('username')
+
+    # usernames are unique, so the last one of a page tells where the next page starts
+    if cursor:
+        friends = friends.filter(username__gt=cursor)
+    elif start:
+        friends = friends.filter(username__gte=start)
+
+    # fetch one extra friend to find out if there is a next page
+    friends = list(friends[:page_size + 1])
+    next_cursor = None
+    if len(friends) > page_size:
+        friends = friends[:page_size]
+        next_cursor = friends[-1].username
+
+    return friends, next_cursor
+
+
+def get_friend_initials(user_id):
+    '''
+    Return the first characters of the usernames of the friends of a user in username order,
+    each with the number of friends whose username starts with it
+    '''
+    return list(get_friends(user_id).annotate(initial=Substr('username', 1, 1)).values_list(
+        'initial').annotate(count=Count('pk')).order_by('initial'))
+
+
+def friendship_made(user1_id, user2_id):
+    # the users become friends, so they can see each other's posts
+    record_friendship_event(user1_id, user2_id, True)
+    update_friend_count(user1_id)
+    update_friend_count(user2_id)
+    backfill_timelines(user1_id, user2_id)
+
+
+def friendship_removed(user1_id, user2_id):
+    # the users are no longer friends, so remove each other's posts from their timelines
+    record_friendship_event(user1_id, user2_id, False)
+    prune_timelines(user1_id, user2_id)
+
+    for user_id in (user1_id, user2_id):
+        # the user is no longer a high degree user, so the user's posts are no longer
+        # pulled at read time and have to be pushed to its friends instead
+        if update_friend_count(user_id) == settings.FEED_HIGH_DEGREE_THRESHOLD:
+            push_posts(user_id, get_friend_ids(user_id))
+
+
+def delete_relationship(user1_id, user2_id, relation_type):
+    '''
+    Delete a relationship if it has the given type and return whether it was deleted.
+    QuerySet.delete() would select the rows before deleting them because of the signal handlers.
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {} WHERE user1_id = %s AND user2_id = %s AND relation_type = %s'.format(
+            connection.ops.quote_name(UserRelationship._meta.db_table)), [user1_id, user2_id, relation_type])
+        return cursor.rowcount == 1
+
+
+def send_friend_request(sender_id, receiver_id):
+    '''
+    Create a friend request if the receiver exists and the users have no relationship yet.
+    Return whether the request was created.
+    '''
+    if sender_id == receiver_id:
+        return False
+
+    user1_id, user2_id, relation_type = get_request_key(sender_id, receiver_id)
+    with connection.cursor() as cursor:
+        # the unique constraint on (user1, user2) rejects a second request, even one sent at the same time
+        cursor.execute(
+            'INSERT INTO {} (user1_id, user2_id, relation_type, date_modified) '
+            'SELECT %s, %s, %s, %s WHERE EXISTS (SELECT 1 FROM {} WHERE id = %s) '
+            'ON CONFLICT (user1_id, user2_id) DO NOTHING'.format(
+                connection.ops.quote_name(UserRelationship._meta.db_table),
+                connection.ops.quote_name(AppUser._meta.db_table)),
+            [user1_id, user2_id, relation_type, connection.ops.adapt_datetimefield_value(timezone.now()),
+             receiver_id])
+        created = cursor.rowcount == 1
+
+    if created:
+        # the users know each other now, so they are no longer recommended to each other
+        remove_recommendation(user1_id, user2_id)
+    return created
+
+
+def cancel_friend_request(sender_id, receiver_id):
+    '''
+    Delete a friend request sent by the sender, return whether it was still pending
+    '''
+    return delete_relationship(*get_request_key(sender_id, receiver_id))
+
+
+def decline_friend_request(receiver_id, sender_id):
+    '''
+    Delete a friend request received by the receiver, return whether it was still pending
+    '''
+    return delete_relationship(*get_request_key(sender_id, receiver_id))
+
+
+def accept_friend_request(receiver_id, sender_id):
+    '''
+    Turn a friend request received by the receiver into a friendship,
+    return whether it was still pending
+    '''
+    user1_id, user2_id, relation_type = get_request_key(sender_id, receiver_id)
+    with transaction.atomic():
+        accepted = UserRelationship.objects.filter(
+            user1_id=user1_id, user2_id=user2_id, relation_type=relation_type).update(
+            relation_type='friends', date_modified=timezone.now())
+        if accepted:
+            friendship_made(user1_id, user2_id)
+
+    return accepted == 1
+
+
+def remove_friend(user_id, friend_id):
+    '''
+    End the friendship of two users, return whether they were friends
+    '''
+    user1_id, user2_id = min(user_id, friend_id), max(user_id, friend_id)
+    with transaction.atomic():
+        removed = delete_relationship(user1_id, user2_id, 'friends')
+        if removed:
+            friendship_removed(user1_id, user2_id)
+
+    return removed
@@ -1,7 +1,50 @@
 from django.forms import ImageField
 from rest_framework import serializers
 
-from .models import Post, AppUser
+from .models import Post, AppUser, FriendRecommendation
+from .images import get_derivative_url, get_srcset_urls, get_image_sizes, AVATAR_SIZE, POST_IMAGE_SIZE
+
+
+class DerivativeImageField(serializers.ImageField):
+    '''
+    Image field that is serialized as the url of the resized copy of the given size
+    '''
+
+    def __init__(self, size, **kwargs):
+        self.size = size
+        kwargs.setdefault('read_only', True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        url = get_derivative_url(value, self.size)
+        if url is None:
+            return None
+
+        request = self.context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class SrcsetField(serializers.Field):
+    '''
+    Post field that is serialized as the srcset of the copies of the post image in the given format
+    '''
+
+    def __init__(self, image_format='jpeg', **kwargs):
+        self.image_format = image_format
+        kwargs['source'] = '*'
+        kwargs.setdefault('read_only', True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, post):
+        request = self.context.get('request', None)
+        candidates = []
+        for url, width in get_srcset_urls(post.image, post.image_srcset_widths, self.image_format):
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            candidates.append('{} {}w'.format(url, width))
+        return ', '.join(candidates)
 
 
 class AppUserSerializer(serializers.ModelSerializer):
@@ -16,6 +59,8 @@ class AppUserSerializer(serializers.ModelSerializer):
 
 
 class FriendListSerializer(serializers.ModelSerializer):
+    profile_image = DerivativeImageField(size=AVATAR_SIZE)
+
     class Meta:
         model = AppUser
         fields = [
@@ -25,11 +70,47 @@ class FriendListSerializer(serializers.ModelSerializer):
         ]
 
 
+class FriendRecommendationSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='recommended_user.pk', read_only=True)
+    profile_image = DerivativeImageField(size=AVATAR_SIZE, source='recommended_user.profile_image')
+    username = serializers.CharField(source='recommended_user.username', read_only=True)
+
+    class Meta:
+        model = FriendRecommendation
+        fields = [
+            'id',
+            'profile_image',
+            'username',
+            'mutual_friend_count'
+        ]
+
+
 class PostSerializer(serializers.ModelSerializer):
+    image = DerivativeImageField(size=POST_IMAGE_SIZE)
+    image_srcset = SrcsetField()
+    image_webp_srcset = SrcsetField('webp')
+    image_sizes = serializers.SerializerMethodField()
+
     class Meta:
         model = Post
         fields = [
             'image',
+            'image_state',
+            'image_width',
+            'image_height',
+            'image_color',
+            'image_placeholder',
+            'image_srcset',
+            'image_webp_srcset',
+            'image_sizes',
             'text',
             'date_created'
         ]
+
+    def get_image_sizes(self, post):
+        return get_image_sizes(post.image_width, post.image_height)
+
+
+class UserPostSerializer(PostSerializer):
+    # format the date while serializing instead of rewriting every post beforehand
+    date_created = serializers.DateTimeField(format='%Y-%m-%d %H:%M')
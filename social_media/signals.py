@@ -0,0 +1,77 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import AppUser, UserRelationship, Post
+from .jobs import enqueue_image_job, IMAGE_JOB_FIELDS
+from .images import get_image_size, get_derivative_sizes_field_name
+from .recommendations import remove_recommendation
+from .relationships import friendship_made, friendship_removed
+from .feed import fan_out_post
+
+
+# kind of the image job queued when an image of the model is uploaded
+IMAGE_JOB_KINDS = {
+    AppUser: 'profile_image',
+    Post: 'post_image',
+}
+
+
+@receiver(pre_save, sender=AppUser)
+@receiver(pre_save, sender=Post)
+def image_model_saving(sender, instance, raw=False, **kwargs):
+    # the file is not committed to the storage yet when a new image is uploaded
+    _, field_name = IMAGE_JOB_FIELDS[IMAGE_JOB_KINDS[sender]]
+    field_file = getattr(instance, field_name)
+    instance._image_uploaded = not raw and bool(
+        field_file) and not field_file._committed
+
+    if instance._image_uploaded:
+        # the new image has no resized copies until its image job is done
+        setattr(instance, get_derivative_sizes_field_name(field_name), '')
+
+    if instance._image_uploaded and sender is Post:
+        instance.image_state = 'pending'
+        # the copies of the previous image do not match the new one
+        instance.image_srcset_widths = ''
+        # the colour and the preview of the previous image do not match the new one either,
+        # they are computed by the image job as they need the image to be decoded
+        instance.image_color = ''
+        instance.image_placeholder = ''
+        try:
+            # only the header is read in the request, so pages can lay the image out
+            instance.image_width, instance.image_height = get_image_size(field_file.file)
+        except OSError:
+            # the image job reports the broken image
+            pass
+
+
+@receiver(post_save, sender=AppUser)
+@receiver(post_save, sender=Post)
+def image_model_saved(sender, instance, **kwargs):
+    # the image is resized by the process_image_jobs worker instead of in the request
+    if getattr(instance, '_image_uploaded', False):
+        instance._image_uploaded = False
+        enqueue_image_job(IMAGE_JOB_KINDS[sender], instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    # push the new post into the timelines of the owner and the owner's friends
+    if created and not raw:
+        fan_out_post(instance)
+
+
+@receiver(post_save, sender=UserRelationship)
+def relationship_saved(sender, instance, created=False, raw=False, **kwargs):
+    # the users know each other now, so they are no longer recommended to each other
+    if created and not raw:
+        remove_recommendation(instance.user1_id, instance.user2_id)
+
+    if instance.relation_type == 'friends' and not raw:
+        friendship_made(instance.user1_id, instance.user2_id)
+
+
+@receiver(post_delete, sender=UserRelationship)
+def relationship_deleted(sender, instance, **kwargs):
+    if instance.relation_type == 'friends':
+        friendship_removed(instance.user1_id, instance.user2_id)
@@ -1,11 +1,159 @@
 from django.core.files.storage import FileSystemStorage
 from django.conf import settings
+import errno
+import hashlib
 import os
+import shutil
+import tempfile
+
+# folder (relative to MEDIA_ROOT) that holds the files named by the hash of their content
+CONTENT_ADDRESSED_ROOT = 'images/cas'
+
+HASH_CHUNK_SIZE = 64 * 1024
 
 
 class OverwriteFileStorage(FileSystemStorage):
+    # no longer used by the models, kept because the old migrations reference it
     def get_available_name(self, name, max_length):
         # If the file name is used, remove it (so that the new one can overwrite)
         if self.exists(name):
             os.remove(os.path.join(settings.MEDIA_ROOT, name))
         return name
+
+
+def get_content_name(digest, extension):
+    '''
+    Return the name of a file from the hash of its content,
+    e.g. images/cas/3f/3f0c...e1.jpg
+    '''
+    return '{}/{}/{}{}'.format(CONTENT_ADDRESSED_ROOT, digest[:2], digest, extension.lower())
+
+
+def write_file_atomic(path, chunks, permissions_mode=None):
+    '''
+    Write a file through a temporary file in the same folder that is renamed into place,
+    so readers never see a partially written file
+    '''
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            for chunk in chunks:
+                temp_file.write(chunk)
+        os.chmod(temp_path, permissions_mode or 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def link_file_atomic(source_path, path, link=True, permissions_mode=None):
+    '''
+    Hard link (or copy when linking is not possible or not asked for) a file to a new path,
+    replacing the file at that path atomically
+    '''
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, '.tmp-{}'.format(os.urandom(8).hex()))
+    try:
+        linked = False
+        if link:
+            try:
+                os.link(source_path, temp_path)
+                linked = True
+            except OSError:
+                # not on the same file system, copy the file instead
+                pass
+        if not linked:
+            shutil.copyfile(source_path, temp_path)
+            os.chmod(temp_path, permissions_mode or 0o644)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    '''
+    Storage that names files by the SHA-256 hash of their content, so a file never changes
+    once written and identical uploads are stored once.
+    The name passed to save() is only used for its extension.
+    '''
+
+    def get_available_name(self, name, max_length=None):
+        # the final name is only known once the content has been hashed
+        return name
+
+    def get_temp_directory(self):
+        # temporary files are kept out of the served folder, preferably on the same file system
+        # as the stored files so they can be renamed into place
+        temp_directory = settings.MEDIA_TEMP_ROOT
+        os.makedirs(temp_directory, exist_ok=True)
+        return temp_directory
+
+    def _save(self, name, content):
+        _, extension = os.path.splitext(name)
+
+        # files received by HashingFileUploadHandler are already hashed, so they are moved into place
+        if hasattr(content, 'sha256') and hasattr(content, 'temporary_file_path'):
+            content_name = get_content_name(content.sha256, extension)
+            self.move_into_place(content.temporary_file_path(), content_name)
+            return content_name
+
+        temp_directory = self.get_temp_directory()
+
+        # hash the content while writing it to a temporary file
+        digest = hashlib.sha256()
+        file_descriptor, temp_path = tempfile.mkstemp(dir=temp_directory, prefix='.tmp-')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+
+            content_name = get_content_name(digest.hexdigest(), extension)
+            self.move_into_place(temp_path, content_name)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return content_name
+
+    def move_into_place(self, temp_path, content_name):
+        path = self.path(content_name)
+        # the same content is already stored, so the temporary file is dropped
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(temp_path, self.file_permissions_mode or 0o644)
+        try:
+            os.replace(temp_path, path)
+        except OSError as error:
+            if error.errno != errno.EXDEV:
+                raise
+            # MEDIA_TEMP_ROOT is on another file system, so the file is copied next to its
+            # destination and renamed there instead
+            link_file_atomic(temp_path, path, link=False, permissions_mode=self.file_permissions_mode)
+            os.remove(temp_path)
+
+    def import_file(self, source_path, link=False):
+        '''
+        Store an existing file (hard linked when possible and asked for) and return its name
+        '''
+        _, extension = os.path.splitext(source_path)
+        content_name = get_content_name(hash_file(source_path), extension)
+        if not self.exists(content_name):
+            link_file_atomic(source_path, self.path(content_name), link,
+                             self.file_permissions_mode)
+
+        return content_name
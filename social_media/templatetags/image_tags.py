@@ -0,0 +1,26 @@
+from django import template
+
+from ..images import get_derivative_url
+
+register = template.Library()
+
+
+@register.filter
+def derivative_url(field_file, size):
+    '''
+    Usage: {{ user.profile_image|derivative_url:96 }}
+    '''
+    return get_derivative_url(field_file, int(size))
+
+
+@register.inclusion_tag('social_media/picture.html')
+def picture(field_file, size, css_class='', alt=''):
+    '''
+    Render an image as a <picture> that prefers the WebP copy of the given size
+    '''
+    return {
+        'webp_url': get_derivative_url(field_file, size, 'webp'),
+        'url': get_derivative_url(field_file, size),
+        'css_class': css_class,
+        'alt': alt,
+    }
@@ -1,19 +1,40 @@
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
 import shutil
 import tempfile
 from rest_framework.test import APITestCase
 from django.urls import reverse
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from PIL import Image
 import json
+import hashlib
+import io
 
 from ..model_factories import *
+from ..consumers import get_feed_group_name
+from ..images import get_image_sizes
 
 MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
 TEST_SERVER_DOMAIN = 'http://testserver'
 USER_PASSWORD = 'Asdf1234'
 INVALID_USER_PK = 999999
 
 
-@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+def get_streamed_json(response):
+    return json.loads(b''.join(response.streaming_content))
+
+
+def make_image_file(name='image.jpg', size=(10, 10)):
+    image_io = io.BytesIO()
+    Image.new('RGB', size).save(image_io, 'JPEG')
+    return SimpleUploadedFile(name, image_io.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
 class UserPostListTest(APITestCase):
     def setUp(self):
         super().setUp()
@@ -34,6 +55,7 @@ class UserPostListTest(APITestCase):
 
         # remove test image temp folder
         shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
 
     def test_validUsernameReturnSuccess(self):
         response = self.client.get(self.good_url)
@@ -42,11 +64,19 @@ class UserPostListTest(APITestCase):
 
     def test_validUsernameReturnCorrectResult(self):
         response = self.client.get(self.good_url)
-        data = json.loads(response.content)
+        data = get_streamed_json(response)
 
         self.assertEqual(len(data), 1)
         self.assertEqual(data, [{
             'image': TEST_SERVER_DOMAIN + self.post1.image.url,
+            'image_state': self.post1.image_state,
+            'image_width': self.post1.image_width,
+            'image_height': self.post1.image_height,
+            'image_color': self.post1.image_color,
+            'image_placeholder': self.post1.image_placeholder,
+            'image_srcset': '',
+            'image_webp_srcset': '',
+            'image_sizes': get_image_sizes(self.post1.image_width, self.post1.image_height),
             'text': self.post1.text,
             'date_created': self.post1.date_created.strftime("%Y-%m-%d %H:%M")
         }, ])
@@ -64,19 +94,236 @@ class UserPostListTest(APITestCase):
         Post.objects.all().delete()
 
         response = self.client.get(self.good_url)
-        data = json.loads(response.content)
+        data = get_streamed_json(response)
 
         self.assertEqual(len(data), 0)
         self.assertEqual(data, [])
 
+    @override_settings(POST_LIST_PAGE_SIZE=2)
+    def test_firstPageHasNextLink(self):
+        post2 = PostFactory.create(owner=self.user1)
+        post3 = PostFactory.create(owner=self.user1)
+
+        response = self.client.get(self.good_url)
+        data = get_streamed_json(response)
+
+        self.assertEqual([post['text'] for post in data], [
+                         post3.text, post2.text])
+        self.assertTrue(response.has_header('Link'))
+
+    @override_settings(POST_LIST_PAGE_SIZE=2)
+    def test_nextLinkReturnNextPage(self):
+        PostFactory.create_batch(2, owner=self.user1)
+
+        response = self.client.get(self.good_url)
+        next_url = response['Link'].split(';')[0].strip('<>')
+        response = self.client.get(next_url)
+        data = get_streamed_json(response)
+
+        self.assertEqual(data, [{
+            'image': TEST_SERVER_DOMAIN + self.post1.image.url,
+            'image_state': self.post1.image_state,
+            'image_width': self.post1.image_width,
+            'image_height': self.post1.image_height,
+            'image_color': self.post1.image_color,
+            'image_placeholder': self.post1.image_placeholder,
+            'image_srcset': '',
+            'image_webp_srcset': '',
+            'image_sizes': get_image_sizes(self.post1.image_width, self.post1.image_height),
+            'text': self.post1.text,
+            'date_created': self.post1.date_created.strftime("%Y-%m-%d %H:%M")
+        }, ])
+        self.assertFalse(response.has_header('Link'))
+
+    def test_validUsernameReadPostsInOneQuery(self):
+        PostFactory.create_batch(2, owner=self.user1)
+
+        with CaptureQueriesContext(connection) as queries:
+            get_streamed_json(self.client.get(self.good_url))
+
+        self.assertEqual(len([query for query in queries.captured_queries
+                              if 'FROM "social_media_post"' in query['sql']]), 1)
+
+    def test_invalidCursorReturn400(self):
+        response = self.client.get(self.good_url, {'cursor': 'INVALID_CURSOR'})
+
+        self.assertEqual(response.status_code, 400)
+
     def test_invalidUsernameReturnCorrectResult(self):
         response = self.client.get(self.bad_url)
-        data = json.loads(response.content)
+        data = get_streamed_json(response)
 
         self.assertEqual(data, [])
 
 
-@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, FEED_PAGE_SIZE=2)
+class FeedListTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+
+        # make user1 and user2 friends
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+
+        self.post1 = PostFactory.create(owner=self.user1)
+        self.post2 = PostFactory.create(owner=self.user2)
+        self.post3 = PostFactory.create(owner=self.user2)
+
+        self.url = reverse('feed')
+
+        # log user1 in
+        self.client.login(email=self.user1.email, password=USER_PASSWORD)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Post.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_unauthenticatedRequestReturn403(self):
+        # log user1 out
+        self.client.logout()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_validRequestReturnFirstPage(self):
+        response = self.client.get(self.url)
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['data']), 2)
+        self.assertEqual(data['data'][0], {
+            'owner_username': self.user2.username,
+            'owner_profile_image_path': self.user2.profile_image.url,
+            'post_text': self.post3.text,
+            'post_image_path': self.post3.image.url,
+            'post_image_width': self.post3.image_width,
+            'post_image_height': self.post3.image_height,
+            'post_image_color': self.post3.image_color,
+            'post_image_placeholder': self.post3.image_placeholder,
+            'post_image_srcset': '',
+            'post_image_webp_srcset': '',
+            'post_image_sizes': get_image_sizes(self.post3.image_width, self.post3.image_height),
+            'post_date_created': self.post3.date_created.strftime("%Y-%m-%d %H:%M")
+        })
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_validCursorReturnNextPage(self):
+        response = self.client.get(self.url)
+        next_cursor = json.loads(response.content)['next_cursor']
+
+        response = self.client.get(self.url, {'cursor': next_cursor})
+        data = json.loads(response.content)
+
+        self.assertEqual(len(data['data']), 1)
+        self.assertEqual(data['data'][0]['owner_username'],
+                         self.user1.username)
+        self.assertIsNone(data['next_cursor'])
+
+    def test_invalidCursorReturn400(self):
+        response = self.client.get(self.url, {'cursor': 'INVALID_CURSOR'})
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue('detail' in data.keys())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
+class NewFeedPostListTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+
+        # make user1 and user2 friends
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+
+        self.post1 = PostFactory.create(owner=self.user2)
+
+        self.url = reverse('new_feed_posts')
+
+        # log user1 in
+        self.client.login(email=self.user1.email, password=USER_PASSWORD)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Post.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_unauthenticatedRequestReturn403(self):
+        # log user1 out
+        self.client.logout()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_validRequestReturnNewPosts(self):
+        latest_cursor = self.client.get(
+            reverse('index')).context['latest_cursor']
+        post2 = PostFactory.create(owner=self.user2)
+
+        response = self.client.get(self.url, {'since': latest_cursor})
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['new_count'], 1)
+        self.assertEqual(data['data'], [{
+            'owner_username': self.user2.username,
+            'owner_profile_image_path': self.user2.profile_image.url,
+            'post_text': post2.text,
+            'post_image_path': post2.image.url,
+            'post_image_width': post2.image_width,
+            'post_image_height': post2.image_height,
+            'post_image_color': post2.image_color,
+            'post_image_placeholder': post2.image_placeholder,
+            'post_image_srcset': '',
+            'post_image_webp_srcset': '',
+            'post_image_sizes': get_image_sizes(post2.image_width, post2.image_height),
+            'post_date_created': post2.date_created.strftime("%Y-%m-%d %H:%M")
+        }])
+        self.assertNotEqual(data['latest_cursor'], latest_cursor)
+
+    def test_latestCursorReturnNoNewPosts(self):
+        latest_cursor = self.client.get(
+            reverse('index')).context['latest_cursor']
+
+        response = self.client.get(self.url, {'since': latest_cursor})
+        data = json.loads(response.content)
+
+        self.assertEqual(data['new_count'], 0)
+        self.assertEqual(data['data'], [])
+        self.assertEqual(data['latest_cursor'], latest_cursor)
+
+    def test_invalidCursorReturn400(self):
+        response = self.client.get(self.url, {'since': 'INVALID_CURSOR'})
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue('detail' in data.keys())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
 class CreatePostTest(APITestCase):
     def setUp(self):
         super().setUp()
@@ -96,6 +343,7 @@ class CreatePostTest(APITestCase):
 
         # remove test image temp folder
         shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
 
     def test_unauthenticatedRequestReturn403(self):
         # log user1 out
@@ -129,10 +377,71 @@ class CreatePostTest(APITestCase):
                 'owner_profile_image_path': self.user1.profile_image.url,
                 'post_text': self.text,
                 'post_image_path': None,
+                'post_image_width': None,
+                'post_image_height': None,
+                'post_image_color': '',
+                'post_image_placeholder': '',
+                'post_image_srcset': '',
+                'post_image_webp_srcset': '',
+                'post_image_sizes': '100vw',
+                'post_image_state': 'ready',
                 'post_date_created': data['data']['post_date_created']
             }
         })
 
+    def test_validRequestWithImageInsertPostOnce(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url, {'text': self.text, 'image': make_image_file()})
+
+        queries = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(
+            [sql for sql in queries if sql.startswith('INSERT INTO "social_media_post"')]), 1)
+        self.assertEqual(len(
+            [sql for sql in queries if sql.startswith('UPDATE "social_media_post"')]), 0)
+
+    def test_validRequestWithImageStoreImageUnderContentHash(self):
+        image_file = make_image_file()
+        digest = hashlib.sha256(image_file.read()).hexdigest()
+        image_file.seek(0)
+
+        self.client.post(self.url, {'text': self.text, 'image': image_file})
+        post = Post.objects.get(owner=self.user1)
+
+        self.assertEqual(post.image.name, 'images/cas/{}/{}.jpg'.format(digest[:2], digest))
+
+    def test_validRequestWithImageQueueImageJob(self):
+        response = self.client.post(
+            self.url, {'text': self.text, 'image': make_image_file()})
+        post = Post.objects.get(owner=self.user1)
+
+        self.assertEqual(json.loads(response.content)[
+                         'data']['post_image_state'], 'pending')
+        self.assertEqual(post.image_state, 'pending')
+        self.assertEqual(list(ImageJob.objects.values_list('kind', 'object_id', 'name', 'state')), [
+            ('post_image', post.pk, post.image.name, 'pending')])
+
+    def test_validRequestPushPostToFriends(self):
+        user2 = AppUserFactory.create()
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=user2, relation_type='friends')
+
+        # listen to the feed of user2
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(
+            get_feed_group_name(user2.pk), channel_name)
+
+        response = self.client.post(self.url, {'text': self.text})
+        event = async_to_sync(channel_layer.receive)(channel_name)
+
+        self.assertEqual(event['type'], 'feed_post')
+        self.assertEqual(event['data'], json.loads(response.content)['data'])
+
+        async_to_sync(channel_layer.group_discard)(
+            get_feed_group_name(user2.pk), channel_name)
+
     def test_invalidRequestWithNoTextAndImageReturn400(self):
         response = self.client.post(self.url)
 
@@ -778,6 +1087,32 @@ class FriendListTest(APITestCase):
             'profile_image': TEST_SERVER_DOMAIN + self.user2.profile_image.url,
             'username': self.user2.username
         }])
+        self.assertFalse(response.has_header('Link'))
+
+    @override_settings(FRIEND_LIST_PAGE_SIZE=1)
+    def test_linkHeaderReturnNextPage(self):
+        user3 = AppUserFactory.create()
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=user3, relation_type='friends')
+
+        response = self.client.get(self.good_url)
+
+        self.assertEqual([user['id'] for user in json.loads(response.content)], [self.user2.pk])
+        next_url = response['Link'][1:-len('>; rel="next"')]
+
+        response = self.client.get(next_url)
+
+        self.assertEqual([user['id'] for user in json.loads(response.content)], [user3.pk])
+        self.assertFalse(response.has_header('Link'))
+
+    def test_fromReturnFriendsFromUsername(self):
+        user3 = AppUserFactory.create(username='zoe')
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=user3, relation_type='friends')
+
+        response = self.client.get(self.good_url, {'from': 'z'})
+
+        self.assertEqual([user['id'] for user in json.loads(response.content)], [user3.pk])
 
     def test_invalidUsernameReturn404(self):
         response = self.client.get(self.bad_url)
@@ -789,3 +1124,136 @@ class FriendListTest(APITestCase):
         data = json.loads(response.content)
 
         self.assertTrue('detail' in data.keys())
+
+
+class MutualFriendListTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+        self.user4 = AppUserFactory.create()
+        self.user5 = AppUserFactory.create()
+
+        # user3 and user4 are friends of both user1 and user5, user2 only of user1
+        for user in (self.user2, self.user3, self.user4):
+            UserRelationshipFactory.create(
+                user1=self.user1, user2=user, relation_type='friends')
+        for user in (self.user3, self.user4):
+            UserRelationshipFactory.create(
+                user1=user, user2=self.user5, relation_type='friends')
+
+        self.good_url = reverse('mutual_friends', kwargs={
+                                'username': self.user5.username})
+        self.bad_url = reverse('mutual_friends', kwargs={
+                               'username': 'NON_EXISTING_USERNAME'})
+
+        # log user1 in
+        self.client.login(email=self.user1.email, password=USER_PASSWORD)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def test_unauthenticatedRequestReturn403(self):
+        # log user1 out
+        self.client.logout()
+
+        response = self.client.get(self.good_url)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalidUsernameReturn404(self):
+        response = self.client.get(self.bad_url)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_validRequestReturnCorrectResult(self):
+        response = self.client.get(self.good_url)
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data, {
+            'count': 2,
+            'data': [{
+                'id': user.pk,
+                'profile_image': TEST_SERVER_DOMAIN + user.profile_image.url,
+                'username': user.username
+            } for user in (self.user3, self.user4)],
+            'next_cursor': None,
+        })
+
+    @override_settings(MUTUAL_FRIEND_PAGE_SIZE=1)
+    def test_validCursorReturnNextPage(self):
+        data = json.loads(self.client.get(self.good_url).content)
+
+        self.assertEqual([user['id'] for user in data['data']], [self.user3.pk])
+        self.assertEqual(data['next_cursor'], self.user3.pk)
+
+        data = json.loads(self.client.get(self.good_url, {'cursor': data['next_cursor']}).content)
+
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([user['id'] for user in data['data']], [self.user4.pk])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_invalidCursorReturn400(self):
+        response = self.client.get(self.good_url, {'cursor': 'INVALID_CURSOR'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class RelationshipStatusListTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='pending_user2_user1')
+
+        self.url = reverse('relationship_statuses')
+
+        # log user1 in
+        self.client.login(email=self.user1.email, password=USER_PASSWORD)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def test_unauthenticatedRequestReturn403(self):
+        # log user1 out
+        self.client.logout()
+
+        response = self.client.get(self.url, {'ids': self.user2.pk})
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_validRequestReturnCorrectResult(self):
+        response = self.client.get(self.url, {'ids': '{},{},{}'.format(
+            self.user1.pk, self.user2.pk, self.user3.pk)})
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data, {'data': {
+            str(self.user2.pk): 'receiver',
+            str(self.user3.pk): 'not_friend',
+        }})
+
+    def test_invalidIdsReturn400(self):
+        response = self.client.get(self.url, {'ids': '1,INVALID_ID'})
+
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(RELATIONSHIP_STATUS_MAX_USERS=2)
+    def test_tooManyIdsReturn400(self):
+        response = self.client.get(self.url, {'ids': '{},{},{}'.format(
+            self.user1.pk, self.user2.pk, self.user3.pk)})
+
+        self.assertEqual(response.status_code, 400)
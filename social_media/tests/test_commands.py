@@ -0,0 +1,208 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils.dateparse import parse_datetime
+from io import StringIO
+from PIL import Image
+import tempfile
+import shutil
+import json
+import csv
+import os
+
+from ..model_factories import *
+from ..storage import get_content_name, hash_file
+
+MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
+class ImportPostsTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+
+        # make user1 and user2 friends
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+
+        self.import_dir = tempfile.mkdtemp()
+        Image.new('RGB', (10, 10)).save(
+            os.path.join(self.import_dir, 'image.jpg'))
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        ImageJob.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+        # remove test image temp folders
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+        shutil.rmtree(self.import_dir, ignore_errors=True)
+
+    def write_jsonl(self, rows):
+        path = os.path.join(self.import_dir, 'posts.jsonl')
+        with open(path, 'w') as output_file:
+            for row in rows:
+                output_file.write(json.dumps(row) + '\n')
+        return path
+
+    def write_csv(self, rows):
+        path = os.path.join(self.import_dir, 'posts.csv')
+        with open(path, 'w', newline='') as output_file:
+            writer = csv.DictWriter(output_file, fieldnames=[
+                                    'owner', 'text', 'image', 'date_created'])
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def import_posts(self, path, *args):
+        call_command('import_posts', path, '--image-root',
+                     self.import_dir, *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_importJsonlCreatesPosts(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'text': 'first'},
+            {'owner': self.user2.username, 'text': 'second'},
+        ])
+
+        self.import_posts(path)
+
+        self.assertEqual(
+            sorted(Post.objects.values_list('owner__username', 'text')),
+            [(self.user1.username, 'first'), (self.user2.username, 'second')])
+
+    def test_importCsvCreatesPosts(self):
+        path = self.write_csv([
+            {'owner': self.user1.username, 'text': 'first',
+                'image': '', 'date_created': ''},
+        ])
+
+        self.import_posts(path)
+
+        self.assertEqual(Post.objects.get().text, 'first')
+
+    def test_importKeepsDateCreated(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'text': 'old',
+                'date_created': '2020-01-01T10:00:00+00:00'},
+        ])
+
+        self.import_posts(path)
+
+        self.assertEqual(Post.objects.get().date_created,
+                         parse_datetime('2020-01-01T10:00:00+00:00'))
+
+    def test_importCopiesImageUnderContentHash(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'image': 'image.jpg'},
+        ])
+
+        self.import_posts(path)
+
+        post = Post.objects.get()
+        self.assertEqual(post.image.name, get_content_name(
+            hash_file(os.path.join(self.import_dir, 'image.jpg')), '.jpg'))
+        self.assertTrue(os.path.isfile(post.image.path))
+
+    def test_importQueuesImageJobs(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'image': 'image.jpg'},
+            {'owner': self.user1.username, 'text': 'no image'},
+        ])
+
+        self.import_posts(path)
+
+        post = Post.objects.get(image_state='pending')
+        self.assertEqual(list(ImageJob.objects.values_list('object_id', 'name')), [
+            (post.pk, post.image.name)])
+
+    def test_importLinksImage(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'image': 'image.jpg'},
+        ])
+
+        self.import_posts(path, '--link')
+
+        post = Post.objects.get()
+        self.assertTrue(os.path.isfile(post.image.path))
+
+    def test_importSkipsMissingImage(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'image': 'missing.jpg'},
+            {'owner': self.user1.username, 'text': 'kept'},
+        ])
+
+        self.import_posts(path)
+
+        self.assertEqual(list(Post.objects.values_list('text', flat=True)), ['kept'])
+
+    def test_importSkipsUnknownOwner(self):
+        path = self.write_jsonl([
+            {'owner': 'unknown', 'text': 'skipped'},
+            {'owner': self.user1.username, 'text': 'kept'},
+        ])
+
+        self.import_posts(path)
+
+        self.assertEqual(list(Post.objects.values_list('text', flat=True)), ['kept'])
+
+    def test_importSkipsInvalidDate(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'image': 'image.jpg', 'date_created': 'yesterday'},
+            {'owner': self.user1.username, 'text': 'bad month', 'date_created': '2020-13-01T10:00:00'},
+            {'owner': self.user1.username, 'text': 'kept'},
+        ])
+
+        self.import_posts(path)
+
+        self.assertEqual(list(Post.objects.values_list('text', flat=True)), ['kept'])
+        # the image of the skipped row is not copied
+        self.assertFalse(os.path.isdir(os.path.join(MEDIA_ROOT, 'images')))
+
+    def test_importSkipsCorruptLine(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'text': 'first'},
+        ])
+        with open(path, 'a') as output_file:
+            output_file.write('{"owner": "user0", "text": \n')
+            output_file.write('["not", "an", "object"]\n')
+            output_file.write(json.dumps({'owner': self.user1.username, 'text': 'last'}) + '\n')
+        stderr = StringIO()
+
+        call_command('import_posts', path, stdout=StringIO(), stderr=stderr)
+
+        self.assertEqual(sorted(Post.objects.values_list('text', flat=True)), ['first', 'last'])
+        self.assertIn('line 2', stderr.getvalue())
+        self.assertIn('line 3', stderr.getvalue())
+
+    def test_importFansOutToFriendTimelines(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'text': 'first'},
+        ])
+
+        self.import_posts(path)
+
+        post = Post.objects.get()
+        self.assertEqual(
+            sorted(TimelineEntry.objects.filter(
+                post=post).values_list('viewer_id', flat=True)),
+            [self.user1.id, self.user2.id])
+
+    def test_importInBatches(self):
+        path = self.write_jsonl([
+            {'owner': self.user1.username, 'text': str(i)} for i in range(5)
+        ])
+
+        self.import_posts(path, '--batch-size', '2')
+
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(TimelineEntry.objects.filter(
+            viewer=self.user2).count(), 5)
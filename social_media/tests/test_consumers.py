@@ -0,0 +1,115 @@
+from channels.testing import WebsocketCommunicator
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from django.contrib.auth.models import AnonymousUser
+from django.test import TransactionTestCase, override_settings
+import social_media.routing
+from asgiref.sync import sync_to_async
+from unittest import mock
+
+from ..model_factories import *
+from ..consumers import push_post_to_friends
+from ..feed import update_friend_count
+from ..graph import friend_graph
+
+
+class FeedWebSocketTest(TransactionTestCase):
+    def setUp(self):
+        friend_graph.reset()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+
+        # make user1 and user2 friends
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+
+        self.post = PostFactory.create(owner=self.user1, image=None)
+        self.post_data = {'post_text': self.post.text}
+
+    def tearDown(self):
+        Post.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        AppUser.objects.all().delete()
+        friend_graph.reset()
+
+    def get_communicator(self, user):
+        application = URLRouter(social_media.routing.websocket_urlpatterns)
+        communicator = WebsocketCommunicator(application, 'ws/feed/')
+        communicator.scope['user'] = user
+
+        return communicator
+
+    async def test_canConnect(self):
+        communicator = self.get_communicator(self.user2)
+
+        # connect the websocket
+        connected, _ = await communicator.connect()
+
+        self.assertTrue(connected)
+
+        await communicator.disconnect()
+
+    async def test_anonymousUserCannotConnect(self):
+        communicator = self.get_communicator(AnonymousUser())
+
+        connected, _ = await communicator.connect()
+
+        self.assertFalse(connected)
+
+    async def test_friendReceivesNewPost(self):
+        communicator = self.get_communicator(self.user2)
+        await communicator.connect()
+
+        await sync_to_async(push_post_to_friends)(self.post, self.post_data)
+        response = await communicator.receive_json_from()
+
+        self.assertEqual(response['data'], self.post_data)
+        self.assertTrue('cursor' in response.keys())
+
+        await communicator.disconnect()
+
+    async def test_nonFriendDoesNotReceiveNewPost(self):
+        communicator = self.get_communicator(self.user3)
+        await communicator.connect()
+
+        await sync_to_async(push_post_to_friends)(self.post, self.post_data)
+
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
+
+    @override_settings(FEED_HIGH_DEGREE_THRESHOLD=0)
+    async def test_highDegreeUserPostIsSentOnce(self):
+        await sync_to_async(update_friend_count)(self.user1.pk)
+        friend_communicator = self.get_communicator(self.user2)
+        await friend_communicator.connect()
+        other_communicator = self.get_communicator(self.user3)
+        await other_communicator.connect()
+
+        # the post is sent to the group of the author instead of the group of every friend
+        with mock.patch.object(InMemoryChannelLayer, 'group_send', autospec=True,
+                               side_effect=InMemoryChannelLayer.group_send) as group_send:
+            pushed = await sync_to_async(push_post_to_friends)(self.post, self.post_data)
+        response = await friend_communicator.receive_json_from()
+
+        self.assertEqual(pushed, 1)
+        self.assertEqual(group_send.call_count, 1)
+        self.assertEqual(response['data'], self.post_data)
+        self.assertTrue(await other_communicator.receive_nothing())
+
+        await friend_communicator.disconnect()
+        await other_communicator.disconnect()
+
+    @override_settings(FEED_HIGH_DEGREE_THRESHOLD=0)
+    async def test_removedFriendDoesNotReceiveHighDegreeUserPost(self):
+        await sync_to_async(update_friend_count)(self.user1.pk)
+        communicator = self.get_communicator(self.user2)
+        await communicator.connect()
+
+        await sync_to_async(lambda: UserRelationship.objects.get(user1=self.user1, user2=self.user2).delete())()
+        await sync_to_async(push_post_to_friends)(self.post, self.post_data)
+
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.disconnect()
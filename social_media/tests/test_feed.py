@@ -0,0 +1,379 @@
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from unittest import mock
+import tempfile
+import shutil
+
+from ..model_factories import *
+from ..feed import (get_timeline,
+                    get_feed_page,
+                    get_new_feed_posts,
+                    get_latest_cursor,
+                    encode_cursor,
+                    decode_cursor,
+                    InvalidCursor)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
+class TimelineTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+
+        # make user1 and user2 friends
+        self.relationship = UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def get_timeline_posts(self, user):
+        return [entry.post for entry in get_timeline(user)]
+
+    def test_newPostIsAddedToOwnerTimeline(self):
+        post = PostFactory.create(owner=self.user1)
+
+        self.assertEqual(self.get_timeline_posts(self.user1), [post])
+
+    def test_newPostIsAddedToFriendTimeline(self):
+        post = PostFactory.create(owner=self.user1)
+
+        self.assertEqual(self.get_timeline_posts(self.user2), [post])
+
+    def test_newPostIsNotAddedToNonFriendTimeline(self):
+        PostFactory.create(owner=self.user1)
+
+        self.assertEqual(self.get_timeline_posts(self.user3), [])
+
+    def test_timelineIsOrderedByNewestFirst(self):
+        post1 = PostFactory.create(owner=self.user1)
+        post2 = PostFactory.create(owner=self.user2)
+
+        self.assertEqual(self.get_timeline_posts(self.user1), [post2, post1])
+
+    def test_acceptingFriendRequestBackfillsTimelines(self):
+        post1 = PostFactory.create(owner=self.user1)
+        post3 = PostFactory.create(owner=self.user3)
+
+        relationship = UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user3, relation_type='pending_user1_user2')
+        relationship.accept_friend_request()
+
+        self.assertEqual(self.get_timeline_posts(self.user1), [post3, post1])
+        self.assertEqual(self.get_timeline_posts(self.user3), [post3, post1])
+
+    def test_pendingFriendRequestDoesNotBackfillTimelines(self):
+        PostFactory.create(owner=self.user3)
+
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user3, relation_type='pending_user1_user2')
+
+        self.assertEqual(self.get_timeline_posts(self.user1), [])
+
+    def test_removingFriendPrunesTimelines(self):
+        post1 = PostFactory.create(owner=self.user1)
+        post2 = PostFactory.create(owner=self.user2)
+
+        self.relationship.delete()
+
+        self.assertEqual(self.get_timeline_posts(self.user1), [post1])
+        self.assertEqual(self.get_timeline_posts(self.user2), [post2])
+
+
+class CursorTest(TestCase):
+    def test_cursorRoundTrip(self):
+        date_created = timezone.now()
+        cursor = encode_cursor(date_created, 42)
+
+        self.assertEqual(decode_cursor(cursor), (date_created, 42))
+
+    def test_invalidCursorRaiseInvalidCursor(self):
+        with self.assertRaises(InvalidCursor):
+            decode_cursor('INVALID_CURSOR')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
+class FeedPageTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        # newest post first
+        self.posts = PostFactory.create_batch(5, owner=self.user1)[::-1]
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_firstPageReturnNewestPosts(self):
+        posts, next_cursor = get_feed_page(self.user1, page_size=2)
+
+        self.assertEqual(posts, self.posts[:2])
+        self.assertIsNotNone(next_cursor)
+
+    def test_cursorReturnNextPage(self):
+        _, next_cursor = get_feed_page(self.user1, page_size=2)
+        posts, _ = get_feed_page(self.user1, next_cursor, page_size=2)
+
+        self.assertEqual(posts, self.posts[2:4])
+
+    def test_lastPageHasNoNextCursor(self):
+        _, next_cursor = get_feed_page(self.user1, page_size=3)
+        posts, next_cursor = get_feed_page(
+            self.user1, next_cursor, page_size=3)
+
+        self.assertEqual(posts, self.posts[3:])
+        self.assertIsNone(next_cursor)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, FEED_HIGH_DEGREE_THRESHOLD=1)
+class HybridFeedTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+
+        # user1 has 2 friends so user1 is a high degree user
+        self.relationship12 = UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+        self.relationship13 = UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user3, relation_type='friends')
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_friendCountIsUpdated(self):
+        self.user1.refresh_from_db()
+        self.user2.refresh_from_db()
+
+        self.assertEqual(self.user1.friend_count, 2)
+        self.assertEqual(self.user2.friend_count, 1)
+
+    def test_highDegreeUserPostIsNotPushedToFriends(self):
+        post = PostFactory.create(owner=self.user1)
+
+        self.assertFalse(TimelineEntry.objects.filter(
+            viewer=self.user2, post=post).exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            viewer=self.user1, post=post).exists())
+
+    def test_highDegreeUserPostIsPulledIntoFeed(self):
+        post1 = PostFactory.create(owner=self.user1)
+        post2 = PostFactory.create(owner=self.user2)
+        post3 = PostFactory.create(owner=self.user1)
+
+        posts, _ = get_feed_page(self.user2)
+
+        self.assertEqual(posts, [post3, post2, post1])
+
+    def test_mergedFeedIsPaginated(self):
+        post1 = PostFactory.create(owner=self.user1)
+        post2 = PostFactory.create(owner=self.user2)
+        post3 = PostFactory.create(owner=self.user1)
+
+        posts, next_cursor = get_feed_page(self.user2, page_size=2)
+        self.assertEqual(posts, [post3, post2])
+
+        posts, next_cursor = get_feed_page(
+            self.user2, next_cursor, page_size=2)
+        self.assertEqual(posts, [post1])
+        self.assertIsNone(next_cursor)
+
+    def test_userNoLongerHighDegreePushesPosts(self):
+        post = PostFactory.create(owner=self.user1)
+
+        # user1 now only has 1 friend
+        self.relationship13.delete()
+
+        self.assertTrue(TimelineEntry.objects.filter(
+            viewer=self.user2, post=post).exists())
+        self.assertEqual(get_feed_page(self.user2)[0], [post])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, FEED_ENGINE='merge', FEED_AUTHOR_WINDOW=1)
+class MergedFeedTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+        self.user4 = AppUserFactory.create()
+
+        # user1 is friend with user2 and user3 but not user4
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user3, relation_type='friends')
+
+        self.post1 = PostFactory.create(owner=self.user2)
+        self.post2 = PostFactory.create(owner=self.user2)
+        self.post3 = PostFactory.create(owner=self.user3)
+        self.post4 = PostFactory.create(owner=self.user4)
+        self.post5 = PostFactory.create(owner=self.user1)
+        self.post6 = PostFactory.create(owner=self.user2)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_feedMergesPostsOfUserAndFriends(self):
+        posts, next_cursor = get_feed_page(self.user1)
+
+        self.assertEqual(
+            posts, [self.post6, self.post5, self.post3, self.post2, self.post1])
+        self.assertIsNone(next_cursor)
+
+    def test_feedIsPaginated(self):
+        posts, next_cursor = get_feed_page(self.user1, page_size=3)
+        self.assertEqual(posts, [self.post6, self.post5, self.post3])
+
+        posts, next_cursor = get_feed_page(
+            self.user1, next_cursor, page_size=3)
+        self.assertEqual(posts, [self.post2, self.post1])
+        self.assertIsNone(next_cursor)
+
+    def test_feedLoadsPostOwners(self):
+        posts, _ = get_feed_page(self.user1, page_size=1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(posts[0].owner.username, self.user2.username)
+
+    def test_feedReadsFirstWindowsInBatches(self):
+        with mock.patch('social_media.feed.FEED_AUTHORS_PER_QUERY', 2):
+            posts, _ = get_feed_page(self.user1, page_size=3)
+
+        self.assertEqual(posts, [self.post6, self.post5, self.post3])
+
+    def test_feedReadsNextWindowOnlyWhenAuthorIsDrained(self):
+        # friends, first windows of the 3 authors, next window of user2, owners
+        with self.assertNumQueries(4):
+            get_feed_page(self.user1, page_size=1)
+
+        # the next windows of user1 and user3 are read once their only post is merged
+        with self.assertNumQueries(6):
+            get_feed_page(self.user1, page_size=3)
+
+    def test_feedMatchesTimelineEngine(self):
+        with self.settings(FEED_ENGINE='timeline'):
+            timeline_posts, _ = get_feed_page(self.user1)
+
+        self.assertEqual(get_feed_page(self.user1)[0], timeline_posts)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, FEED_HIGH_DEGREE_THRESHOLD=1)
+class NewFeedPostsTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+        self.user4 = AppUserFactory.create()
+
+        # user1 is a high degree user
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user3, relation_type='friends')
+        UserRelationshipFactory.create(
+            user1=self.user2, user2=self.user4, relation_type='friends')
+
+        self.post1 = PostFactory.create(owner=self.user2)
+        posts, _ = get_feed_page(self.user2)
+        self.cursor = get_latest_cursor(posts)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_noNewPosts(self):
+        posts, new_count, latest_cursor = get_new_feed_posts(
+            self.user2, self.cursor)
+
+        self.assertEqual(posts, [])
+        self.assertEqual(new_count, 0)
+        self.assertEqual(latest_cursor, self.cursor)
+
+    def test_returnPushedAndPulledNewPosts(self):
+        post2 = PostFactory.create(owner=self.user4)
+        post3 = PostFactory.create(owner=self.user1)
+        PostFactory.create(owner=self.user3)
+
+        posts, new_count, latest_cursor = get_new_feed_posts(
+            self.user2, self.cursor)
+
+        self.assertEqual(posts, [post3, post2])
+        self.assertEqual(new_count, 2)
+        self.assertEqual(latest_cursor, get_latest_cursor(posts))
+
+    def test_newPostsAreLimitedToPageSize(self):
+        PostFactory.create_batch(3, owner=self.user4)
+
+        posts, new_count, _ = get_new_feed_posts(
+            self.user2, self.cursor, page_size=2)
+
+        self.assertEqual(len(posts), 2)
+        self.assertEqual(new_count, 3)
+
+    def test_mergeEngineReturnSameNewPosts(self):
+        PostFactory.create(owner=self.user4)
+        PostFactory.create(owner=self.user1)
+
+        timeline_posts = get_new_feed_posts(self.user2, self.cursor)
+        with self.settings(FEED_ENGINE='merge'):
+            self.assertEqual(get_new_feed_posts(
+                self.user2, self.cursor), timeline_posts)
@@ -1,9 +1,18 @@
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+import io
 
 from ..forms import *
 from ..model_factories import *
 
 
+def make_image_file(size=(100, 100)):
+    image_io = io.BytesIO()
+    Image.new('RGB', size).save(image_io, 'JPEG')
+    return SimpleUploadedFile('image.jpg', image_io.getvalue(), content_type='image/jpeg')
+
+
 class RegistrationFormTest(TestCase):
     def setUp(self):
         super().setUp()
@@ -134,6 +143,14 @@ class ProfileUpdateFormTest(TestCase):
 
         self.assertTrue(form.is_valid())
 
+    @override_settings(IMAGE_MAX_PIXELS=100 * 99)
+    def test_profileUpdateFormWithTooManyPixelsReturnInvalid(self):
+        form = ProfileUpdateForm(data={'username': self.user1.username, 'email': self.user1.email},
+                                 files={'profile_image': make_image_file()}, instance=self.user1)
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('profile_image', form.errors)
+
     def test_profileUpdateFormWithExistingEmailReturnInvalid(self):
         form = ProfileUpdateForm(
             data={'email': self.user2.email}, instance=self.user1)
@@ -185,6 +202,25 @@ class PostFormTest(TestCase):
 
         self.assertTrue(form.is_valid())
 
+    def test_postFormWithImageReturnValid(self):
+        form = PostForm(data={}, files={'image': make_image_file()})
+
+        self.assertTrue(form.is_valid())
+
+    @override_settings(IMAGE_MAX_PIXELS=100 * 99)
+    def test_postFormWithTooManyPixelsReturnInvalid(self):
+        form = PostForm(data={}, files={'image': make_image_file()})
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('megapixels', form.errors['image'][0])
+
+    @override_settings(IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_postFormWithTooLargeFileReturnInvalid(self):
+        form = PostForm(data={}, files={'image': make_image_file()})
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('MB', form.errors['image'][0])
+
     def test_postFormWithNoTextAndImageReturnInvalid(self):
         form = PostForm(data={})
 
@@ -0,0 +1,315 @@
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
+from io import StringIO
+import threading
+import time
+
+from ..model_factories import *
+from ..graph import (FriendGraph,
+                     friend_graph,
+                     build_adjacency,
+                     intersect_sorted,
+                     record_friendship_event,
+                     prune_friendship_events,
+                     get_friend_ids,
+                     are_friends,
+                     get_degree,
+                     get_mutual_friend_ids,
+                     get_mutual_friend_ids_by_user)
+
+
+# the graphs of these tests read the log on every lookup
+@override_settings(FRIEND_GRAPH_SYNC_INTERVAL=0)
+class FriendGraphTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+        self.user4 = AppUserFactory.create()
+
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user3, relation_type='friends')
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+        UserRelationshipFactory.create(
+            user1=self.user2, user2=self.user4, relation_type='pending_user1_user2')
+
+        self.graph = FriendGraph()
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        FriendshipEvent.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def test_adjacencyIsSortedPerUser(self):
+        offsets, neighbour_ids = build_adjacency([(1, 3), (1, 2), (2, 3)])
+
+        self.assertEqual(list(offsets), [0, 0, 2, 4, 6])
+        self.assertEqual(list(neighbour_ids), [2, 3, 1, 3, 1, 2])
+
+    def test_intersectListsOfSimilarLength(self):
+        self.assertEqual(intersect_sorted([1, 3, 5, 7], [2, 3, 4, 7, 9]), [3, 7])
+        self.assertEqual(intersect_sorted([], [1, 2]), [])
+
+    def test_intersectSearchesShortListInLongList(self):
+        self.assertEqual(intersect_sorted(list(range(0, 10000, 2)), [3, 4, 5000, 9998, 20000]),
+                         [4, 5000, 9998])
+
+    def test_mutualFriendsAreSorted(self):
+        UserRelationshipFactory.create(
+            user1=self.user3, user2=self.user4, relation_type='friends')
+        UserRelationship.objects.get(user1=self.user2, user2=self.user4).accept_friend_request()
+
+        self.assertEqual(self.graph.mutual(self.user4.pk, [self.user1.pk, self.user2.pk]), {
+            self.user1.pk: [self.user2.pk, self.user3.pk],
+            self.user2.pk: [],
+        })
+        self.assertEqual(get_mutual_friend_ids(self.user4.pk, self.user1.pk),
+                         [self.user2.pk, self.user3.pk])
+        self.assertEqual(get_mutual_friend_ids_by_user(self.user2.pk, [self.user3.pk]),
+                         {self.user3.pk: [self.user1.pk, self.user4.pk]})
+
+    def test_neighboursAreSortedFriendIds(self):
+        self.assertEqual(self.graph.neighbours(self.user1.pk), [self.user2.pk, self.user3.pk])
+        self.assertEqual(self.graph.neighbours(self.user3.pk), [self.user1.pk])
+
+    def test_pendingRequestIsNotFriendship(self):
+        self.assertFalse(self.graph.is_friend(self.user2.pk, self.user4.pk))
+        self.assertEqual(self.graph.neighbours(self.user4.pk), [])
+
+    def test_isFriendWorksInBothDirections(self):
+        self.assertTrue(self.graph.is_friend(self.user1.pk, self.user2.pk))
+        self.assertTrue(self.graph.is_friend(self.user2.pk, self.user1.pk))
+        self.assertFalse(self.graph.is_friend(self.user2.pk, self.user3.pk))
+
+    def test_degreeCountsFriends(self):
+        self.assertEqual(self.graph.degree(self.user1.pk), 2)
+        self.assertEqual(self.graph.degree(self.user4.pk), 0)
+
+    def test_unknownUserHasNoFriends(self):
+        self.assertEqual(self.graph.neighbours(self.user4.pk + 100), [])
+
+    def test_acceptedRequestIsApplied(self):
+        self.graph.neighbours(self.user2.pk)
+
+        UserRelationship.objects.get(user1=self.user2, user2=self.user4).accept_friend_request()
+
+        self.assertTrue(self.graph.is_friend(self.user4.pk, self.user2.pk))
+        self.assertEqual(self.graph.neighbours(self.user2.pk), [self.user1.pk, self.user4.pk])
+
+    def test_removedFriendshipIsApplied(self):
+        self.graph.neighbours(self.user1.pk)
+
+        UserRelationship.objects.get(user1=self.user1, user2=self.user3).delete()
+
+        self.assertEqual(self.graph.neighbours(self.user1.pk), [self.user2.pk])
+        self.assertEqual(self.graph.neighbours(self.user3.pk), [])
+
+    def test_eventCommittedLateIsApplied(self):
+        self.graph.neighbours(self.user1.pk)
+        last_event_id = FriendshipEvent.objects.order_by('-pk').first().pk
+
+        # the event with the next id is not visible yet when the graph syncs
+        FriendshipEvent.objects.create(
+            pk=last_event_id + 2, user1_id=self.user3.pk, user2_id=self.user4.pk, added=True)
+        self.graph.neighbours(self.user1.pk)
+        FriendshipEvent.objects.create(
+            pk=last_event_id + 1, user1_id=self.user2.pk, user2_id=self.user3.pk, added=True)
+
+        self.assertTrue(self.graph.is_friend(self.user2.pk, self.user3.pk))
+        self.assertTrue(self.graph.is_friend(self.user3.pk, self.user4.pk))
+
+    def test_eventCommittedLateAfterBuildIsApplied(self):
+        last_event_id = FriendshipEvent.objects.order_by('-pk').first().pk
+
+        # the event with the next id is not visible yet when the graph is built
+        FriendshipEvent.objects.create(
+            pk=last_event_id + 2, user1_id=self.user3.pk, user2_id=self.user4.pk, added=True)
+        self.graph.neighbours(self.user1.pk)
+        FriendshipEvent.objects.create(
+            pk=last_event_id + 1, user1_id=self.user2.pk, user2_id=self.user4.pk, added=True)
+
+        self.assertEqual(self.graph.gaps.keys(), {last_event_id + 1})
+        self.assertTrue(self.graph.is_friend(self.user2.pk, self.user4.pk))
+        self.assertEqual(self.graph.gaps, {})
+
+    def test_friendshipsAreReadOutsideLock(self):
+        acquired = []
+
+        def try_lock():
+            acquired.append(self.graph.lock.acquire(blocking=False))
+            if acquired[0]:
+                self.graph.lock.release()
+
+        def read_friendships(*args, **kwargs):
+            # lookups of other threads go on while the friendships are read
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            return filter_relationships(*args, **kwargs)
+
+        filter_relationships = UserRelationship.objects.filter
+        with mock.patch.object(UserRelationship.objects, 'filter', side_effect=read_friendships):
+            self.assertEqual(self.graph.neighbours(self.user1.pk), [self.user2.pk, self.user3.pk])
+
+        self.assertEqual(acquired, [True])
+
+    @override_settings(FRIENDSHIP_EVENT_RETENTION=3600)
+    def test_lookupDoesNotWaitForRebuild(self):
+        self.graph.neighbours(self.user1.pk)
+        UserRelationship.objects.filter(user1=self.user1, user2=self.user3).delete()
+
+        # another thread is rebuilding the graph, the lookup uses the current arrays meanwhile
+        with self.graph.build_lock, \
+                mock.patch('social_media.graph.time.monotonic', return_value=time.monotonic() + 3600), \
+                self.assertNumQueries(0):
+            self.assertEqual(self.graph.neighbours(self.user1.pk), [self.user2.pk, self.user3.pk])
+
+    def test_compactKeepsFriendships(self):
+        self.graph.neighbours(self.user1.pk)
+
+        with mock.patch('social_media.graph.COMPACT_THRESHOLD', 1):
+            record_friendship_event(self.user3.pk, self.user4.pk, True)
+            record_friendship_event(self.user1.pk, self.user2.pk, False)
+            self.graph.sync()
+
+        self.assertEqual(self.graph.changed, {})
+        self.assertEqual(self.graph.neighbours(self.user1.pk), [self.user3.pk])
+        self.assertEqual(self.graph.neighbours(self.user2.pk), [])
+        self.assertEqual(self.graph.neighbours(self.user3.pk), [self.user1.pk, self.user4.pk])
+        self.assertEqual(self.graph.neighbours(self.user4.pk), [self.user3.pk])
+
+    def test_logIsReadOutsideLock(self):
+        self.graph.neighbours(self.user1.pk)
+        record_friendship_event(self.user3.pk, self.user4.pk, True)
+        acquired = []
+
+        def try_lock():
+            acquired.append(self.graph.lock.acquire(blocking=False))
+            if acquired[0]:
+                self.graph.lock.release()
+
+        def read_events(*args, **kwargs):
+            # lookups of other threads go on while the log is read
+            thread = threading.Thread(target=try_lock)
+            thread.start()
+            thread.join()
+            return filter_events(*args, **kwargs)
+
+        filter_events = FriendshipEvent.objects.filter
+        with mock.patch.object(FriendshipEvent.objects, 'filter', side_effect=read_events):
+            self.assertTrue(self.graph.is_friend(self.user3.pk, self.user4.pk))
+
+        self.assertEqual(acquired, [True])
+
+    @override_settings(FRIEND_GRAPH_SYNC_INTERVAL=60)
+    def test_logIsReadOncePerInterval(self):
+        self.graph.neighbours(self.user1.pk)
+        FriendshipEvent.objects.create(user1_id=self.user3.pk, user2_id=self.user4.pk, added=True)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(self.graph.is_friend(self.user3.pk, self.user4.pk))
+
+        with mock.patch('social_media.graph.time.monotonic', return_value=time.monotonic() + 60):
+            self.assertTrue(self.graph.is_friend(self.user3.pk, self.user4.pk))
+
+    @override_settings(FRIEND_GRAPH_SYNC_INTERVAL=60)
+    def test_invalidatedGraphReadsLog(self):
+        self.graph.neighbours(self.user1.pk)
+        FriendshipEvent.objects.create(user1_id=self.user3.pk, user2_id=self.user4.pk, added=True)
+
+        self.graph.invalidate()
+
+        self.assertTrue(self.graph.is_friend(self.user3.pk, self.user4.pk))
+
+    @override_settings(FRIENDSHIP_EVENT_RETENTION=3600)
+    def test_graphIsRebuiltWhenEventsMayBePruned(self):
+        self.graph.neighbours(self.user1.pk)
+        UserRelationship.objects.filter(user1=self.user1, user2=self.user3).delete()
+
+        # the event of the removed friendship is pruned before the graph syncs again
+        with mock.patch('social_media.graph.time.monotonic', return_value=time.monotonic() + 3600):
+            FriendshipEvent.objects.all().delete()
+            self.assertEqual(self.graph.neighbours(self.user1.pk), [self.user2.pk])
+
+    @override_settings(FRIENDSHIP_EVENT_RETENTION=3600)
+    def test_oldEventsArePruned(self):
+        old_event = record_friendship_event(self.user3.pk, self.user4.pk, True)
+        FriendshipEvent.objects.filter(pk=old_event.pk).update(
+            date_created=timezone.now() - timedelta(seconds=3601))
+        new_event = record_friendship_event(self.user3.pk, self.user4.pk, False)
+
+        self.assertEqual(prune_friendship_events(), 1)
+        self.assertFalse(FriendshipEvent.objects.filter(pk=old_event.pk).exists())
+        self.assertTrue(FriendshipEvent.objects.filter(pk=new_event.pk).exists())
+
+    def test_pruneCommand(self):
+        record_friendship_event(self.user3.pk, self.user4.pk, True)
+        FriendshipEvent.objects.update(date_created=timezone.now() - timedelta(days=30))
+        count = FriendshipEvent.objects.count()
+        stdout = StringIO()
+
+        call_command('prune_friendship_events', stdout=stdout)
+
+        self.assertFalse(FriendshipEvent.objects.exists())
+        self.assertIn('Deleted {} friendship events'.format(count), stdout.getvalue())
+
+    def test_helpersQueryDatabaseInsideTransaction(self):
+        # test cases run inside a transaction, where the graph is not used
+        self.assertEqual(get_friend_ids(self.user1.pk), [self.user2.pk, self.user3.pk])
+        self.assertTrue(are_friends(self.user3.pk, self.user1.pk))
+        self.assertFalse(are_friends(self.user2.pk, self.user4.pk))
+        self.assertEqual(get_degree(self.user1.pk), 2)
+
+
+class FriendGraphLookupTest(TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        friend_graph.reset()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+
+    def tearDown(self):
+        super().tearDown()
+        friend_graph.reset()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def test_helpersUseGraphOutsideTransaction(self):
+        self.assertEqual(get_friend_ids(self.user1.pk), [self.user2.pk])
+
+        # changes that are not logged are not seen by the graph
+        UserRelationship.objects.update(relation_type='pending_user1_user2')
+
+        self.assertTrue(are_friends(self.user1.pk, self.user2.pk))
+        self.assertEqual(get_degree(self.user2.pk), 1)
+
+    @override_settings(FRIEND_GRAPH_SYNC_INTERVAL=0)
+    def test_lookupReadsOnlyNewEvents(self):
+        get_friend_ids(self.user1.pk)
+
+        with self.assertNumQueries(1):
+            get_friend_ids(self.user1.pk)
+
+    @override_settings(FRIEND_GRAPH_SYNC_INTERVAL=60)
+    def test_ownChangeIsSeenAtOnce(self):
+        user3 = AppUserFactory.create()
+        relationship = UserRelationshipFactory.create(
+            user1=self.user2, user2=user3, relation_type='pending_user1_user2')
+        get_friend_ids(self.user2.pk)
+
+        with self.assertNumQueries(0):
+            get_friend_ids(self.user2.pk)
+
+        relationship.accept_friend_request()
+
+        self.assertEqual(get_friend_ids(self.user2.pk), [self.user1.pk, user3.pk])
@@ -0,0 +1,444 @@
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Template, Context
+from django.test import TestCase, override_settings
+from io import StringIO, BytesIO
+from PIL import Image
+from unittest import mock
+import tempfile
+import base64
+import shutil
+
+from ..model_factories import *
+from ..images import (load_image,
+                      get_derivative_name,
+                      get_derivative_url,
+                      get_image_formats,
+                      get_srcset_name,
+                      get_srcset,
+                      get_image_sizes,
+                      AVATAR_SIZE,
+                      POST_IMAGE_SIZE)
+from ..serializers import FriendListSerializer, PostSerializer
+from ..jobs import process_image_jobs
+
+MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
+
+
+def make_image_file(size, name='image.jpg'):
+    image_io = BytesIO()
+    Image.new('RGB', size, 'red').save(image_io, 'JPEG')
+    return SimpleUploadedFile(name, image_io.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, IMAGE_DERIVATIVE_SIZES=[96, 320, 960])
+class ImageDerivativeTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        Post.objects.all().delete()
+        ImageJob.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def process_image_jobs(self, *instances):
+        # the processed images are stored under new names
+        process_image_jobs()
+        for instance in instances:
+            instance.refresh_from_db()
+
+    def get_derivative_size(self, field_file, size, image_format='jpeg'):
+        name = get_derivative_name(field_file.name, size, image_format)
+        with field_file.storage.open(name) as image_file:
+            return Image.open(image_file).size
+
+    def test_derivativeNameIsNextToOriginal(self):
+        self.assertEqual(get_derivative_name('images/post_images/1/post_image.jpg', 96, 'webp'),
+                         'images/post_images/1/post_image_96.webp')
+
+    def test_uploadedPostImageIsResized(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((1200, 600)))
+        self.process_image_jobs(post)
+
+        for image_format in get_image_formats():
+            self.assertEqual(self.get_derivative_size(post.image, 96, image_format), (96, 48))
+            self.assertEqual(self.get_derivative_size(post.image, 320, image_format), (320, 160))
+            self.assertEqual(self.get_derivative_size(post.image, 960, image_format), (960, 480))
+
+    def test_uploadedProfileImageIsResized(self):
+        self.user1.profile_image = make_image_file((400, 400))
+        self.user1.save()
+        self.process_image_jobs(self.user1)
+
+        self.assertEqual(self.get_derivative_size(self.user1.profile_image, 96), (96, 96))
+
+    def test_imageIsNotUpscaled(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+        self.process_image_jobs(post)
+
+        self.assertFalse(post.image.storage.exists(
+            get_derivative_name(post.image.name, 320)))
+
+    def test_savingWithoutNewImageDoesNotResize(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((400, 400)))
+        self.process_image_jobs(post)
+        post.image.storage.delete(get_derivative_name(post.image.name, 96))
+
+        post.text = 'updated'
+        post.save()
+        self.process_image_jobs(post)
+
+        self.assertFalse(post.image.storage.exists(
+            get_derivative_name(post.image.name, 96)))
+
+    def test_newProfileImageIsStoredUnderNewName(self):
+        self.user1.profile_image = make_image_file((1200, 1200))
+        self.user1.save()
+        self.process_image_jobs(self.user1)
+        old_name = self.user1.profile_image.name
+        self.user1.profile_image = make_image_file((200, 200))
+        self.user1.save()
+        self.process_image_jobs(self.user1)
+
+        self.assertNotEqual(self.user1.profile_image.name, old_name)
+        self.assertFalse(self.user1.profile_image.storage.exists(
+            get_derivative_name(self.user1.profile_image.name, 960)))
+
+    def test_derivativeUrlPicksSmallestCopyThatFits(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((1200, 600)))
+        self.process_image_jobs(post)
+
+        self.assertEqual(get_derivative_url(post.image, 100),
+                         post.image.storage.url(get_derivative_name(post.image.name, 320)))
+
+    def test_derivativeSizesAreRecorded(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((400, 400)))
+        self.user1.profile_image = make_image_file((1200, 1200))
+        self.user1.save()
+        self.process_image_jobs(post, self.user1)
+
+        self.assertEqual(post.image_derivative_sizes, '96,320')
+        self.assertEqual(self.user1.profile_image_derivative_sizes, '96,320,960')
+
+    def test_derivativeUrlDoesNotQueryStorage(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((1200, 600)))
+        self.process_image_jobs(post)
+
+        with mock.patch.object(post.image.storage, 'exists', side_effect=AssertionError('storage queried')):
+            self.assertEqual(get_derivative_url(post.image, 100),
+                             post.image.storage.url(get_derivative_name(post.image.name, 320)))
+
+    def test_newImageHasNoDerivativeSizes(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((400, 400)))
+        self.process_image_jobs(post)
+
+        post.image = make_image_file((400, 400), 'new.jpg')
+        post.save()
+
+        self.assertEqual(post.image_derivative_sizes, '')
+        self.assertEqual(get_derivative_url(post.image, 96), post.image.url)
+
+    def test_derivativeUrlFallsBackToOriginal(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+        self.process_image_jobs(post)
+
+        self.assertEqual(get_derivative_url(post.image, POST_IMAGE_SIZE), post.image.url)
+        self.assertIsNone(get_derivative_url(post.image, POST_IMAGE_SIZE, 'webp'))
+
+    def test_derivativeUrlOfEmptyImageIsNone(self):
+        post = PostFactory.create(owner=self.user1, image=None)
+
+        self.assertIsNone(get_derivative_url(post.image, POST_IMAGE_SIZE))
+
+    def test_pictureTagPrefersWebp(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((400, 400)))
+        self.process_image_jobs(post)
+
+        html = Template('{% load image_tags %}{% picture image 96 "avatar" %}').render(
+            Context({'image': post.image}))
+
+        self.assertIn(get_derivative_url(post.image, 96), html)
+        if 'webp' in get_image_formats():
+            self.assertIn(get_derivative_url(post.image, 96, 'webp'), html)
+
+    def test_serializersUseDerivatives(self):
+        self.user1.profile_image = make_image_file((400, 400))
+        self.user1.save()
+        post = PostFactory.create(owner=self.user1, image=make_image_file((1200, 600)))
+        self.process_image_jobs(post, self.user1)
+
+        self.assertEqual(FriendListSerializer(instance=self.user1).data['profile_image'],
+                         get_derivative_url(self.user1.profile_image, AVATAR_SIZE))
+        self.assertEqual(PostSerializer(instance=post).data['image'],
+                         get_derivative_url(post.image, POST_IMAGE_SIZE))
+
+    def test_commandGeneratesMissingCopies(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((400, 400)))
+        self.process_image_jobs(post)
+        post.image.storage.delete(get_derivative_name(post.image.name, 96))
+
+        call_command('generate_image_derivatives', stdout=StringIO(), stderr=StringIO())
+
+        self.assertTrue(post.image.storage.exists(
+            get_derivative_name(post.image.name, 96)))
+
+    def test_commandRecordsDerivativeSizes(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((400, 400)))
+        self.process_image_jobs(post)
+        Post.objects.update(image_derivative_sizes='')
+
+        call_command('generate_image_derivatives', stdout=StringIO(), stderr=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_derivative_sizes, '96,320')
+
+    def test_commandSkipsTooLargeImage(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((400, 400)))
+        self.process_image_jobs(post)
+        Post.objects.update(image_derivative_sizes='')
+        stderr = StringIO()
+
+        with self.settings(IMAGE_MAX_PIXELS=100):
+            call_command('generate_image_derivatives', stdout=StringIO(), stderr=stderr)
+
+        self.assertIn('Failed to resize {}'.format(post.image.name), stderr.getvalue())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, IMAGE_DERIVATIVE_SIZES=[96],
+                   IMAGE_MAX_SIZE=500)
+class ImageJobTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        Post.objects.all().delete()
+        ImageJob.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_uploadQueuesJob(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+
+        self.assertEqual(post.image_state, 'pending')
+        self.assertEqual(ImageJob.objects.get().name, post.image.name)
+        self.assertFalse(post.image.storage.exists(
+            get_derivative_name(post.image.name, 96)))
+
+    def test_postWithoutImageIsReady(self):
+        post = PostFactory.create(owner=self.user1, image=None)
+
+        self.assertEqual(post.image_state, 'ready')
+        self.assertFalse(ImageJob.objects.exists())
+
+    def test_processedPostIsReady(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+
+        self.assertEqual(process_image_jobs(), 1)
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_state, 'ready')
+        self.assertEqual(ImageJob.objects.get().state, 'done')
+
+    def test_uploadStoresSizeOnly(self):
+        with mock.patch('social_media.images.load_image') as load:
+            post = PostFactory.create(owner=self.user1, image=make_image_file((400, 300)))
+
+        # the image is not decoded in the request
+        self.assertFalse(load.called)
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (400, 300))
+        self.assertEqual((post.image_color, post.image_placeholder), ('', ''))
+
+    def test_imageJobStoresPreview(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((400, 300)))
+
+        process_image_jobs()
+
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (400, 300))
+        self.assertRegex(post.image_color, r'^#[0-9a-f]{6}$')
+        prefix = 'data:image/png;base64,'
+        self.assertTrue(post.image_placeholder.startswith(prefix))
+        preview = Image.open(BytesIO(base64.b64decode(post.image_placeholder[len(prefix):])))
+        self.assertEqual(preview.size, (8, 6))
+
+    def test_processingUpdatesImageSize(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((1000, 800)))
+
+        process_image_jobs()
+
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (500, 400))
+
+    def test_processingShrinksLargeImage(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((1000, 800)))
+
+        process_image_jobs()
+        post.refresh_from_db()
+
+        with post.image.storage.open(post.image.name) as image_file:
+            self.assertEqual(Image.open(image_file).size, (500, 400))
+
+    @override_settings(IMAGE_MAX_PIXELS=100 * 100)
+    def test_imageOverPixelLimitIsNotDecoded(self):
+        PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+
+        process_image_jobs()
+
+        self.assertIn('megapixels', ImageJob.objects.get().error)
+
+    def test_largeJpegIsDecodedAtReducedResolution(self):
+        image_file = File(make_image_file((4000, 3000)))
+
+        self.assertEqual(load_image(image_file, 960).size, (1000, 750))
+
+    def test_failedJobIsRetried(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+        post.image.storage.delete(post.image.name)
+
+        process_image_jobs()
+
+        job = ImageJob.objects.get()
+        self.assertEqual(job.state, 'pending')
+        self.assertEqual(job.attempts, 1)
+        self.assertNotEqual(job.error, '')
+
+    @override_settings(IMAGE_JOB_MAX_ATTEMPTS=2)
+    def test_jobFailsAfterMaxAttempts(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+        post.image.storage.delete(post.image.name)
+
+        process_image_jobs()
+        process_image_jobs()
+
+        post.refresh_from_db()
+        self.assertEqual(ImageJob.objects.get().state, 'failed')
+        self.assertEqual(post.image_state, 'failed')
+
+    def test_runningJobIsNotClaimedTwice(self):
+        PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+        ImageJob.objects.update(state='running')
+
+        self.assertEqual(process_image_jobs(), 0)
+
+    @override_settings(IMAGE_JOB_TIMEOUT=0)
+    def test_abandonedJobIsClaimedAgain(self):
+        PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+        ImageJob.objects.update(state='running')
+
+        self.assertEqual(process_image_jobs(), 1)
+
+    def test_commandProcessesJobsInWorkerProcesses(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 200)))
+
+        call_command('process_image_jobs', '--once', '--workers', '1', stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_state, 'ready')
+        self.assertTrue(post.image.storage.exists(
+            get_derivative_name(post.image.name, 96)))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, IMAGE_DERIVATIVE_SIZES=[96],
+                   IMAGE_SRCSET_WIDTHS=[160, 320, 640], IMAGE_MAX_SIZE=500)
+class ImageSrcsetTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        Post.objects.all().delete()
+        ImageJob.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def create_processed_post(self, size):
+        post = PostFactory.create(owner=self.user1, image=make_image_file(size))
+        process_image_jobs()
+        post.refresh_from_db()
+        return post
+
+    def test_processingGeneratesWidthLadder(self):
+        post = self.create_processed_post((1000, 800))
+
+        # the ladder is clamped to the 500px wide processed image
+        self.assertEqual(post.image_srcset_widths, '160,320,500')
+        for width, height in [(160, 128), (320, 256), (500, 400)]:
+            for image_format in get_image_formats():
+                with post.image.storage.open(get_srcset_name(post.image.name, width, image_format)) as image_file:
+                    self.assertEqual(Image.open(image_file).size, (width, height))
+
+    def test_srcsetListsCopiesByWidth(self):
+        post = self.create_processed_post((200, 100))
+
+        storage = post.image.storage
+        self.assertEqual(get_srcset(post.image, post.image_srcset_widths), '{} 160w, {} 200w'.format(
+            storage.url(get_srcset_name(post.image.name, 160)),
+            storage.url(get_srcset_name(post.image.name, 200))))
+
+    def test_pendingPostHasNoSrcset(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 100)))
+
+        self.assertEqual(get_srcset(post.image, post.image_srcset_widths), '')
+
+    def test_newUploadClearsSrcset(self):
+        post = self.create_processed_post((200, 100))
+
+        post.image = make_image_file((300, 100), 'other.jpg')
+        post.save()
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_srcset_widths, '')
+
+    def test_sizesMatchDisplayedWidth(self):
+        self.assertEqual(get_image_sizes(400, 300), '(max-width: 384px) 100vw, 384px')
+        self.assertEqual(get_image_sizes(None, None), '100vw')
+
+    def test_postSerializerHasSrcset(self):
+        post = self.create_processed_post((200, 100))
+
+        data = PostSerializer(instance=post).data
+
+        self.assertEqual(data['image_srcset'], get_srcset(post.image, post.image_srcset_widths))
+        self.assertEqual(data['image_sizes'], get_image_sizes(200, 100))
+
+    def test_commandBackfillsExistingPosts(self):
+        post = self.create_processed_post((200, 100))
+        Post.objects.update(image_srcset_widths='', image_width=None, image_height=None)
+
+        call_command('generate_post_srcsets', stdout=StringIO(), stderr=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_srcset_widths, '160,200')
+        self.assertEqual((post.image_width, post.image_height), (200, 100))
+
+    def test_commandSkipsPendingPosts(self):
+        post = PostFactory.create(owner=self.user1, image=make_image_file((200, 100)))
+
+        call_command('generate_post_srcsets', stdout=StringIO(), stderr=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.image_srcset_widths, '')
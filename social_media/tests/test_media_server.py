@@ -0,0 +1,191 @@
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.utils.http import http_date
+import tempfile
+import shutil
+import gzip
+import os
+
+from ..media_server import StaticFilesApp, parse_range, RangeNotSatisfiable
+
+MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
+STATIC_ROOT = tempfile.mkdtemp()
+
+
+async def fallback_application(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 418, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class ParseRangeTest(SimpleTestCase):
+    def test_closedRange(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+
+    def test_openRange(self):
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+
+    def test_suffixRange(self):
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+
+    def test_rangePastEndIsShortened(self):
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+
+    def test_rangeStartingPastEndIsNotSatisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range('bytes=100-', 100)
+
+    def test_invalidOrMultipleRangesAreIgnored(self):
+        self.assertIsNone(parse_range('bytes=a-b', 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, STATIC_ROOT=STATIC_ROOT)
+class StaticFilesAppTest(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.application = StaticFilesApp(fallback_application)
+        self.content = bytes(range(256)) * 4
+        self.write_file(MEDIA_ROOT, 'images/cas/ab/ab12.jpg', self.content)
+        self.write_file(STATIC_ROOT, 'css/style.css', b'body {}' * 100)
+        self.write_file(STATIC_ROOT, 'css/style.css.gz', gzip.compress(b'body {}' * 100))
+        os.utime(os.path.join(STATIC_ROOT, 'css/style.css.gz'),
+                 ns=(os.stat(os.path.join(STATIC_ROOT, 'css/style.css')).st_mtime_ns,) * 2)
+
+    def tearDown(self):
+        super().tearDown()
+
+        # remove test temp folders
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+        shutil.rmtree(STATIC_ROOT, ignore_errors=True)
+
+    def write_file(self, root, name, content):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as output_file:
+            output_file.write(content)
+
+    def request(self, path, headers=None, method='GET', extensions=None):
+        scope = {
+            'type': 'http',
+            'method': method,
+            'path': path,
+            'headers': [(name.encode(), value.encode()) for name, value in (headers or {}).items()],
+        }
+        if extensions is not None:
+            scope['extensions'] = extensions
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request'}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(self.application)(scope, receive, send)
+
+        response_headers = {name.decode(): value.decode()
+                            for name, value in messages[0]['headers']}
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return messages[0]['status'], response_headers, body, messages
+
+    def test_fileIsServed(self):
+        status, headers, body, _ = self.request(settings.MEDIA_URL + 'images/cas/ab/ab12.jpg')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(headers['content-type'], 'image/jpeg')
+        self.assertEqual(headers['content-length'], str(len(self.content)))
+        self.assertEqual(headers['accept-ranges'], 'bytes')
+        self.assertIn('immutable', headers['cache-control'])
+        self.assertIn('etag', headers)
+
+    def test_headRequestHasNoBody(self):
+        status, headers, body, _ = self.request(
+            settings.MEDIA_URL + 'images/cas/ab/ab12.jpg', method='HEAD')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-length'], str(len(self.content)))
+        self.assertEqual(body, b'')
+
+    def test_rangeRequestReturnPartialContent(self):
+        status, headers, body, _ = self.request(
+            settings.MEDIA_URL + 'images/cas/ab/ab12.jpg', {'range': 'bytes=10-19'})
+
+        self.assertEqual(status, 206)
+        self.assertEqual(body, self.content[10:20])
+        self.assertEqual(headers['content-range'], 'bytes 10-19/{}'.format(len(self.content)))
+
+    def test_unsatisfiableRangeReturn416(self):
+        status, headers, _, _ = self.request(
+            settings.MEDIA_URL + 'images/cas/ab/ab12.jpg', {'range': 'bytes=5000-'})
+
+        self.assertEqual(status, 416)
+        self.assertEqual(headers['content-range'], 'bytes */{}'.format(len(self.content)))
+
+    def test_staleIfRangeReturnWholeFile(self):
+        status, _, body, _ = self.request(settings.MEDIA_URL + 'images/cas/ab/ab12.jpg',
+                                          {'range': 'bytes=10-19', 'if-range': '"old"'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.content)
+
+    def test_matchingEtagReturn304(self):
+        _, headers, _, _ = self.request(settings.MEDIA_URL + 'images/cas/ab/ab12.jpg')
+
+        status, _, body, _ = self.request(settings.MEDIA_URL + 'images/cas/ab/ab12.jpg',
+                                          {'if-none-match': headers['etag']})
+
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+    def test_unmodifiedSinceReturn304(self):
+        status, _, _, _ = self.request(settings.MEDIA_URL + 'images/cas/ab/ab12.jpg',
+                                       {'if-modified-since': http_date()})
+
+        self.assertEqual(status, 304)
+
+    def test_precompressedCopyIsServedWhenAccepted(self):
+        status, headers, body, _ = self.request(
+            settings.STATIC_URL + 'css/style.css', {'accept-encoding': 'gzip, deflate'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertEqual(headers['content-type'], 'text/css')
+        self.assertEqual(headers['vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(body), b'body {}' * 100)
+
+    def test_plainFileIsServedWhenCompressionIsNotAccepted(self):
+        _, headers, body, _ = self.request(settings.STATIC_URL + 'css/style.css')
+
+        self.assertNotIn('content-encoding', headers)
+        self.assertEqual(headers['vary'], 'Accept-Encoding')
+        self.assertEqual(body, b'body {}' * 100)
+
+    def test_zeroCopySendIsUsedWhenSupported(self):
+        status, _, _, messages = self.request(
+            settings.MEDIA_URL + 'images/cas/ab/ab12.jpg', {'range': 'bytes=10-19'},
+            extensions={'http.response.zerocopysend': {}})
+
+        self.assertEqual(status, 206)
+        self.assertEqual(messages[1]['type'], 'http.response.zerocopysend')
+        self.assertEqual((messages[1]['offset'], messages[1]['count']), (10, 10))
+
+    def test_missingFileIsPassedOn(self):
+        status, _, _, _ = self.request(settings.MEDIA_URL + 'images/cas/ab/missing.jpg')
+
+        self.assertEqual(status, 418)
+
+    def test_pathOutsideRootIsPassedOn(self):
+        status, _, _, _ = self.request(settings.MEDIA_URL + '../' + os.path.basename(STATIC_ROOT) + '/css/style.css')
+
+        self.assertEqual(status, 418)
+
+    def test_otherMethodIsPassedOn(self):
+        status, _, _, _ = self.request(
+            settings.MEDIA_URL + 'images/cas/ab/ab12.jpg', method='POST')
+
+        self.assertEqual(status, 418)
@@ -0,0 +1,212 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from unittest import skipUnless
+import re
+
+from ..model_factories import *
+from ..feed import (update_friend_count,
+                    push_posts,
+                    get_high_degree_friend_ids,
+                    get_feed_page,
+                    TimelineFeedEngine,
+                    MergeFeedEngine)
+from ..graph import get_friend_ids, get_degree
+from ..relationships import get_relationship_statuses, get_friend_page, get_friend_initials
+
+USER_PASSWORD = 'Asdf1234'
+
+
+class QueryPlanTestMixin:
+    '''
+    Capture the SQLite query plans of the queries made by the code of a hot path,
+    so a missing index fails the tests instead of slowing the pages down
+    '''
+
+    def get_query_plans(self, func, model):
+        '''
+        Run func and return the SQL and the plan of every SELECT it makes from the table of the model,
+        tables that are only joined to the table of another model are left to the tests of that model
+        '''
+        table = model._meta.db_table
+        with CaptureQueriesContext(connection) as context:
+            func()
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if query['sql'].startswith('SELECT') and 'FROM "{}"'.format(table) in query['sql']:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.append((query['sql'], [row[3] for row in cursor.fetchall()]))
+
+        self.assertTrue(plans, 'No query was made from {}'.format(table))
+        return plans
+
+    def assertQueryPlan(self, func, model, index_name, allow_sort=False):
+        '''
+        Fail if a query of func reads the whole table of the model, does not search it through
+        an index whose name starts with index_name, or sorts its rows when allow_sort is False
+        '''
+        table = model._meta.db_table
+        for sql, details in self.get_query_plans(func, model):
+            # subqueries read the table under an alias
+            names = {table} | set(re.findall(r'"{}" (U\d+)'.format(table), sql))
+            message = '{}\n{}'.format(sql, '\n'.join(details))
+            for detail in details:
+                words = detail.split()
+                # 'SCAN table' and 'SCAN table USING INDEX' both read every row of the table
+                self.assertFalse(words[0] == 'SCAN' and words[1] in names, 'Full scan\n' + message)
+                if not allow_sort:
+                    self.assertNotIn('USE TEMP B-TREE', detail, 'Rows are sorted\n' + message)
+
+            self.assertTrue(any(detail.split()[:2] in (['SEARCH', name] for name in names) and
+                                ' INDEX {}'.format(index_name) in detail for detail in details),
+                            'Index {} is not used\n{}'.format(index_name, message))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the query plans are those of SQLite')
+class RelationshipQueryPlanTest(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user3, relation_type='pending_user2_user1')
+        UserRelationshipFactory.create(
+            user1=self.user2, user2=self.user3, relation_type='pending_user1_user2')
+
+        # log user3 in
+        self.client.login(email=self.user3.email, password=USER_PASSWORD)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def test_friendRequestListUsesTypeIndex(self):
+        # the requests are read from both sides of the relationship, so they are sorted after being merged
+        self.assertQueryPlan(lambda: self.client.get(reverse('friend_requests')), UserRelationship,
+                             'relationship_user2_type_idx', allow_sort=True)
+
+    def test_friendIdsUseTypeIndex(self):
+        self.assertQueryPlan(lambda: get_friend_ids(self.user1.pk), UserRelationship,
+                             'relationship_user1_type_idx')
+
+    def test_friendCountUsesTypeIndex(self):
+        self.assertQueryPlan(lambda: get_degree(self.user2.pk), UserRelationship,
+                             'relationship_user2_type_idx')
+        self.assertQueryPlan(lambda: update_friend_count(self.user2.pk), UserRelationship,
+                             'relationship_user2_type_idx')
+
+    def test_friendPageUsesTypeIndexes(self):
+        # the friends are sorted by username, which only needs the friends of the user to be read
+        self.assertQueryPlan(lambda: get_friend_page(self.user2.pk, cursor=self.user1.username),
+                             UserRelationship, 'relationship_user1_type_idx', allow_sort=True)
+        self.assertQueryPlan(lambda: get_friend_page(self.user2.pk), UserRelationship,
+                             'relationship_user2_type_idx', allow_sort=True)
+        self.assertQueryPlan(lambda: get_friend_initials(self.user2.pk), UserRelationship,
+                             'relationship_user2_type_idx', allow_sort=True)
+
+    def test_highDegreeFriendsUseFriendCountIndex(self):
+        # the name of the index of a field ends with a hash
+        self.assertQueryPlan(lambda: get_high_degree_friend_ids(self.user1.pk), AppUser,
+                             'social_media_appuser_friend_count_')
+        self.assertQueryPlan(lambda: get_high_degree_friend_ids(self.user1.pk), UserRelationship,
+                             'social_media_userrelationship_user1_id_user2_id_')
+
+    def test_relationshipStatusesUseUniqueIndex(self):
+        # the name of the index of unique_together ends with a hash
+        self.assertQueryPlan(lambda: get_relationship_statuses(
+            self.user2.pk, [self.user1.pk, self.user3.pk]), UserRelationship,
+            'social_media_userrelationship_user1_id_user2_id_')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the query plans are those of SQLite')
+class PostQueryPlanTest(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        PostFactory.create_batch(3, owner=self.user1, image=None)
+
+        # log user2 in
+        self.client.login(email=self.user2.email, password=USER_PASSWORD)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+    def test_userPostListIsReadInIndexOrder(self):
+        url = reverse('user_posts', kwargs={'username': self.user1.username})
+
+        self.assertQueryPlan(lambda: self.client.get(url), Post, 'post_owner_date_idx')
+
+    @override_settings(POST_LIST_PAGE_SIZE=1)
+    def test_nextUserPostPageIsReadInIndexOrder(self):
+        url = reverse('user_posts', kwargs={'username': self.user1.username})
+        next_url = self.client.get(url)['Link'][1:-len('>; rel="next"')]
+
+        self.assertQueryPlan(lambda: self.client.get(next_url), Post, 'post_owner_date_idx')
+
+    def test_pushPostsUsesOwnerIndex(self):
+        self.assertQueryPlan(lambda: push_posts(self.user1.pk, [self.user2.pk]), Post, 'post_owner_date_idx')
+
+    def test_mergeFeedReadsAuthorWindowsInIndexOrder(self):
+        first_post = Post.objects.order_by('-date_created', '-pk').first()
+        position = (first_post.date_created, first_post.pk)
+
+        self.assertQueryPlan(lambda: MergeFeedEngine().get_posts(self.user1, None, 2), Post, 'post_owner_date_idx')
+        self.assertQueryPlan(lambda: MergeFeedEngine().get_posts(self.user1, position, 2), Post,
+                             'post_owner_date_idx')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the query plans are those of SQLite')
+class FeedQueryPlanTest(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+        PostFactory.create_batch(3, owner=self.user1, image=None)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+    def test_timelineIsReadInIndexOrder(self):
+        _, next_cursor = get_feed_page(self.user2, page_size=1)
+
+        self.assertQueryPlan(lambda: get_feed_page(self.user2, page_size=1), TimelineEntry,
+                             'timeline_viewer_date_idx')
+        self.assertQueryPlan(lambda: get_feed_page(self.user2, next_cursor, page_size=1), TimelineEntry,
+                             'timeline_viewer_date_idx')
+
+    @override_settings(FEED_HIGH_DEGREE_THRESHOLD=0)
+    def test_highDegreePostsAreReadFromOwnerIndex(self):
+        update_friend_count(self.user1.pk)
+        first_post = Post.objects.order_by('-date_created', '-pk').first()
+        position = (first_post.date_created, first_post.pk)
+
+        # the posts of a single high degree friend are read in index order
+        self.assertQueryPlan(lambda: TimelineFeedEngine().get_posts(self.user2, None, 2), Post,
+                             'post_owner_date_idx')
+        self.assertQueryPlan(lambda: TimelineFeedEngine().get_posts(self.user2, position, 2), Post,
+                             'post_owner_date_idx')
@@ -0,0 +1,134 @@
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from io import StringIO
+import datetime
+import json
+
+from ..model_factories import *
+from ..recommendations import update_recommendations, get_recommendations
+
+USER_PASSWORD = 'Asdf1234'
+
+
+class FriendRecommendationTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = AppUserFactory.create_batch(6)
+        user0, user1, user2, user3, user4, _ = self.users
+
+        # user3 is a friend of both friends of user0, user4 of one of them
+        for user_a, user_b in ((user0, user1), (user0, user2), (user1, user3), (user2, user3), (user1, user4)):
+            UserRelationshipFactory.create(user1=user_a, user2=user_b, relation_type='friends')
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        FriendRecommendation.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def update_recommendations(self):
+        return update_recommendations([user.pk for user in self.users])
+
+    def get_recommended_users(self, user):
+        return [(recommendation.recommended_user, recommendation.mutual_friend_count)
+                for recommendation in get_recommendations(user)]
+
+    def test_friendsOfFriendsAreRankedByMutualFriends(self):
+        self.update_recommendations()
+
+        self.assertEqual(self.get_recommended_users(self.users[0]),
+                         [(self.users[3], 2), (self.users[4], 1)])
+
+    def test_friendsAreNotRecommended(self):
+        self.update_recommendations()
+
+        self.assertEqual(self.get_recommended_users(self.users[1]), [(self.users[2], 2)])
+
+    def test_pendingRequestIsNotRecommended(self):
+        UserRelationshipFactory.create(
+            user1=self.users[0], user2=self.users[4], relation_type='pending_user1_user2')
+
+        self.update_recommendations()
+
+        self.assertEqual(self.get_recommended_users(self.users[0]), [(self.users[3], 2)])
+
+    def test_recentFriendshipScoresHigher(self):
+        user5 = self.users[5]
+        UserRelationshipFactory.create(user1=self.users[2], user2=user5, relation_type='friends')
+        # user4 became friends with the mutual friend a year ago, user5 just now
+        UserRelationship.objects.filter(user2=self.users[4]).update(
+            date_modified=timezone.now() - datetime.timedelta(days=365))
+
+        self.update_recommendations()
+
+        self.assertEqual([user for user, _ in self.get_recommended_users(self.users[0])],
+                         [self.users[3], user5, self.users[4]])
+
+    @override_settings(FRIEND_RECOMMENDATION_COUNT=1)
+    def test_onlyBestRecommendationsAreStored(self):
+        self.update_recommendations()
+
+        self.assertEqual(FriendRecommendation.objects.filter(user=self.users[0]).count(), 1)
+
+    def test_updateReplacesRecommendations(self):
+        self.update_recommendations()
+        UserRelationship.objects.filter(user2=self.users[4]).delete()
+
+        self.update_recommendations()
+
+        self.assertEqual(self.get_recommended_users(self.users[0]), [(self.users[3], 2)])
+
+    def test_newRelationshipRemovesRecommendation(self):
+        self.update_recommendations()
+
+        UserRelationshipFactory.create(
+            user1=self.users[0], user2=self.users[3], relation_type='pending_user1_user2')
+
+        self.assertEqual(self.get_recommended_users(self.users[0]), [(self.users[4], 1)])
+        self.assertFalse(FriendRecommendation.objects.filter(
+            user=self.users[3], recommended_user=self.users[0]).exists())
+
+    def test_commandComputesInWorkerProcesses(self):
+        call_command('compute_friend_recommendations', '--workers', '1', '--batch-size', '2',
+                     stdout=StringIO())
+
+        self.assertEqual(self.get_recommended_users(self.users[0]),
+                         [(self.users[3], 2), (self.users[4], 1)])
+
+    def test_apiReturnsRecommendations(self):
+        self.update_recommendations()
+        self.client.login(email=self.users[0].email, password=USER_PASSWORD)
+
+        response = self.client.get(reverse('friend_recommendations'))
+        data = json.loads(response.content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(user['id'], user['mutual_friend_count']) for user in data['data']],
+                         [(self.users[3].pk, 2), (self.users[4].pk, 1)])
+
+    def test_apiUnauthenticatedRequestReturn403(self):
+        response = self.client.get(reverse('friend_recommendations'))
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_homePageShowsRecommendations(self):
+        self.update_recommendations()
+        self.client.login(email=self.users[0].email, password=USER_PASSWORD)
+
+        response = self.client.get(reverse('index'))
+
+        self.assertEqual([user['username'] for user in response.context['recommendations']],
+                         [self.users[3].username, self.users[4].username])
+        self.assertContains(response, 'People you may know')
+
+    def test_ownProfileShowsRecommendations(self):
+        self.update_recommendations()
+        self.client.login(email=self.users[0].email, password=USER_PASSWORD)
+
+        response = self.client.get(reverse('profile', kwargs={'username': self.users[0].username}))
+
+        self.assertEqual(len(response.context['recommendations']), 2)
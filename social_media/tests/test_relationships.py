@@ -0,0 +1,246 @@
+from django.test import TestCase, override_settings
+import tempfile
+import shutil
+
+from ..model_factories import *
+from ..relationships import (send_friend_request,
+                             cancel_friend_request,
+                             accept_friend_request,
+                             decline_friend_request,
+                             remove_friend,
+                             get_relationship_statuses,
+                             get_friend_page,
+                             get_friend_initials)
+
+MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
+class RelationshipTransitionTest(TestCase):
+    '''
+    Every transition is a single statement, so two concurrent clicks can only run one after
+    the other. The races are tested by running the competing transitions in both orders.
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        FriendshipEvent.objects.all().delete()
+        Post.objects.all().delete()
+        TimelineEntry.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def get_relation_types(self):
+        return list(UserRelationship.objects.values_list('relation_type', flat=True))
+
+    def test_sendCreatesPendingRequest(self):
+        self.assertTrue(send_friend_request(self.user2.pk, self.user1.pk))
+
+        relationship = UserRelationship.objects.get()
+        self.assertEqual((relationship.user1, relationship.user2), (self.user1, self.user2))
+        self.assertEqual(relationship.relation_type, 'pending_user2_user1')
+        self.assertIsNotNone(relationship.date_modified)
+
+    def test_sendToUnknownUserFails(self):
+        self.assertFalse(send_friend_request(self.user1.pk, self.user2.pk + 100))
+        self.assertFalse(send_friend_request(self.user1.pk, self.user1.pk))
+
+        self.assertFalse(UserRelationship.objects.exists())
+
+    def test_requestsSentToEachOtherCreateOneRelationship(self):
+        self.assertTrue(send_friend_request(self.user1.pk, self.user2.pk))
+        self.assertFalse(send_friend_request(self.user2.pk, self.user1.pk))
+
+        self.assertEqual(self.get_relation_types(), ['pending_user1_user2'])
+
+    def test_sendToFriendFails(self):
+        UserRelationshipFactory.create(user1=self.user1, user2=self.user2, relation_type='friends')
+
+        self.assertFalse(send_friend_request(self.user1.pk, self.user2.pk))
+        self.assertEqual(self.get_relation_types(), ['friends'])
+
+    def test_transitionIsOneStatement(self):
+        send_friend_request(self.user1.pk, self.user2.pk)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(cancel_friend_request(self.user1.pk, self.user2.pk))
+
+    def test_acceptMakesFriendsOnce(self):
+        PostFactory.create(owner=self.user1)
+        send_friend_request(self.user1.pk, self.user2.pk)
+
+        self.assertTrue(accept_friend_request(self.user2.pk, self.user1.pk))
+        self.assertFalse(accept_friend_request(self.user2.pk, self.user1.pk))
+
+        self.assertEqual(self.get_relation_types(), ['friends'])
+        self.assertEqual(FriendshipEvent.objects.filter(added=True).count(), 1)
+        self.assertEqual(AppUser.objects.get(pk=self.user1.pk).friend_count, 1)
+        # the friend's existing posts are added to the timeline
+        self.assertEqual(TimelineEntry.objects.filter(viewer=self.user2).count(), 1)
+
+    def test_senderCannotAcceptOwnRequest(self):
+        send_friend_request(self.user1.pk, self.user2.pk)
+
+        self.assertFalse(accept_friend_request(self.user1.pk, self.user2.pk))
+        self.assertFalse(decline_friend_request(self.user1.pk, self.user2.pk))
+        self.assertEqual(self.get_relation_types(), ['pending_user1_user2'])
+
+    def test_cancelAfterAcceptFails(self):
+        send_friend_request(self.user1.pk, self.user2.pk)
+
+        self.assertTrue(accept_friend_request(self.user2.pk, self.user1.pk))
+        self.assertFalse(cancel_friend_request(self.user1.pk, self.user2.pk))
+
+        self.assertEqual(self.get_relation_types(), ['friends'])
+
+    def test_acceptAfterCancelFails(self):
+        send_friend_request(self.user1.pk, self.user2.pk)
+
+        self.assertTrue(cancel_friend_request(self.user1.pk, self.user2.pk))
+        self.assertFalse(accept_friend_request(self.user2.pk, self.user1.pk))
+
+        self.assertEqual(self.get_relation_types(), [])
+        self.assertFalse(FriendshipEvent.objects.exists())
+
+    def test_declineAfterAcceptFails(self):
+        send_friend_request(self.user1.pk, self.user2.pk)
+
+        self.assertTrue(accept_friend_request(self.user2.pk, self.user1.pk))
+        self.assertFalse(decline_friend_request(self.user2.pk, self.user1.pk))
+
+        self.assertEqual(self.get_relation_types(), ['friends'])
+
+    def test_removeEndsFriendshipOnce(self):
+        send_friend_request(self.user1.pk, self.user2.pk)
+        accept_friend_request(self.user2.pk, self.user1.pk)
+        PostFactory.create(owner=self.user1)
+
+        self.assertTrue(remove_friend(self.user2.pk, self.user1.pk))
+        self.assertFalse(remove_friend(self.user1.pk, self.user2.pk))
+
+        self.assertEqual(self.get_relation_types(), [])
+        self.assertEqual(FriendshipEvent.objects.filter(added=False).count(), 1)
+        self.assertEqual(AppUser.objects.get(pk=self.user2.pk).friend_count, 0)
+        self.assertFalse(TimelineEntry.objects.filter(viewer=self.user2).exists())
+
+    def test_removePendingRequestFails(self):
+        send_friend_request(self.user1.pk, self.user2.pk)
+
+        self.assertFalse(remove_friend(self.user1.pk, self.user2.pk))
+        self.assertEqual(self.get_relation_types(), ['pending_user1_user2'])
+
+
+class RelationshipStatusTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.user2 = AppUserFactory.create()
+        self.user3 = AppUserFactory.create()
+        self.user4 = AppUserFactory.create()
+        self.user5 = AppUserFactory.create()
+
+        # user2 sent user3 a friend request, user4 sent user2 one, user1 and user2 are friends
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=self.user2, relation_type='friends')
+        UserRelationshipFactory.create(
+            user1=self.user2, user2=self.user3, relation_type='pending_user1_user2')
+        UserRelationshipFactory.create(
+            user1=self.user2, user2=self.user4, relation_type='pending_user2_user1')
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def test_statusesAreReadInOneQuery(self):
+        with self.assertNumQueries(1):
+            statuses = get_relationship_statuses(
+                self.user2.pk, [self.user1.pk, self.user3.pk, self.user4.pk, self.user5.pk])
+
+        self.assertEqual(statuses, {
+            self.user1.pk: 'friends',
+            self.user3.pk: 'sender',
+            self.user4.pk: 'receiver',
+            self.user5.pk: 'not_friend',
+        })
+
+    def test_statusesAreFromTheUsersSide(self):
+        self.assertEqual(get_relationship_statuses(self.user3.pk, [self.user2.pk]), {self.user2.pk: 'receiver'})
+        self.assertEqual(get_relationship_statuses(self.user4.pk, [self.user2.pk]), {self.user2.pk: 'sender'})
+        self.assertEqual(get_relationship_statuses(self.user1.pk, [self.user2.pk]), {self.user2.pk: 'friends'})
+
+    def test_relationshipsWithOtherUsersAreIgnored(self):
+        self.assertEqual(get_relationship_statuses(self.user1.pk, [self.user3.pk, self.user4.pk]), {
+            self.user3.pk: 'not_friend',
+            self.user4.pk: 'not_friend',
+        })
+
+
+class FriendPageTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = AppUserFactory.create(username='user')
+        # friends on both sides of their relationship with the user, created out of username order
+        self.friends = []
+        for username in ('carol', 'alice', 'bob', 'Dave', 'anna'):
+            self.friends.append(AppUserFactory.create(username=username))
+        for friend in self.friends:
+            user1, user2 = sorted((self.user, friend), key=lambda user: user.pk)
+            UserRelationshipFactory.create(user1=user1, user2=user2, relation_type='friends')
+
+        # a pending request and a friendship between other users are not listed
+        self.other = AppUserFactory.create(username='aaron')
+        UserRelationshipFactory.create(
+            user1=self.user, user2=self.other, relation_type='pending_user1_user2')
+        UserRelationshipFactory.create(
+            user1=self.friends[0], user2=self.other, relation_type='friends')
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        UserRelationship.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        UserRelationshipFactory.reset_sequence(0)
+
+    def test_pageIsReadInOneQuery(self):
+        with self.assertNumQueries(1):
+            friends, next_cursor = get_friend_page(self.user.pk, page_size=10)
+
+        # usernames are compared by their bytes, so upper case comes first
+        self.assertEqual([friend.username for friend in friends], ['Dave', 'alice', 'anna', 'bob', 'carol'])
+        self.assertIsNone(next_cursor)
+
+    def test_cursorReturnNextPage(self):
+        friends, next_cursor = get_friend_page(self.user.pk, page_size=2)
+
+        self.assertEqual([friend.username for friend in friends], ['Dave', 'alice'])
+        self.assertEqual(next_cursor, 'alice')
+
+        friends, next_cursor = get_friend_page(self.user.pk, cursor=next_cursor, page_size=2)
+
+        self.assertEqual([friend.username for friend in friends], ['anna', 'bob'])
+        self.assertEqual(next_cursor, 'bob')
+
+    def test_startJumpsToInitial(self):
+        friends, next_cursor = get_friend_page(self.user.pk, start='b', page_size=2)
+
+        self.assertEqual([friend.username for friend in friends], ['bob', 'carol'])
+        self.assertIsNone(next_cursor)
+
+    def test_initialsCountFriends(self):
+        self.assertEqual(get_friend_initials(self.user.pk), [('D', 1), ('a', 2), ('b', 1), ('c', 1)])
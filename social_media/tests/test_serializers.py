@@ -6,6 +6,7 @@ from ..model_factories import *
 from ..serializers import *
 
 MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
 
 
 class AppUserSerializerTest(TestCase):
@@ -76,7 +77,7 @@ class FriendListSerializerTest(TestCase):
         self.assertEqual(self.serializer_data['username'], self.user1.username)
 
 
-@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
 class PostSerializerTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -96,10 +97,19 @@ class PostSerializerTest(TestCase):
 
         # remove test image temp folder
         shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
 
     def test_postSerializerHasCorrectKeys(self):
         self.assertEqual(set(self.serializer_data.keys()), set([
             'image',
+            'image_state',
+            'image_width',
+            'image_height',
+            'image_color',
+            'image_placeholder',
+            'image_srcset',
+            'image_webp_srcset',
+            'image_sizes',
             'text',
             'date_created',
         ]))
@@ -114,3 +124,30 @@ class PostSerializerTest(TestCase):
         formatted_date = self.post1.date_created.strftime(
             "%Y-%m-%dT%H:%M:%S.%fZ")
         self.assertEqual(self.serializer_data['date_created'], formatted_date)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
+class UserPostSerializerTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user1 = AppUserFactory.create()
+        cls.post1 = PostFactory.create(owner=cls.user1)
+        cls.serializer = UserPostSerializer(instance=cls.post1)
+        cls.serializer_data = cls.serializer.data
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        AppUser.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        Post.objects.all().delete()
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_dateCreatedHasCorrectValue(self):
+        formatted_date = self.post1.date_created.strftime("%Y-%m-%d %H:%M")
+        self.assertEqual(self.serializer_data['date_created'], formatted_date)
@@ -0,0 +1,312 @@
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers, TemporaryFileUploadHandler
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from unittest import mock
+from io import StringIO, BytesIO
+from PIL import Image
+import tempfile
+import errno
+import hashlib
+import shutil
+import os
+
+from ..model_factories import *
+from ..images import get_derivative_name
+from ..storage import ContentAddressedStorage, get_content_name
+from ..uploads import HashingFileUploadHandler
+
+MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
+
+real_replace = os.replace
+
+
+def replace_across_file_systems(source, destination):
+    # MEDIA_TEMP_ROOT behaves as if it was on another file system than MEDIA_ROOT
+    if os.path.dirname(source) == MEDIA_TEMP_ROOT:
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+    real_replace(source, destination)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage()
+        self.content = b'image content'
+        self.digest = hashlib.sha256(self.content).hexdigest()
+
+    def tearDown(self):
+        super().tearDown()
+
+        # remove test image temp folders
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_fileIsNamedByContentHash(self):
+        name = self.storage.save('images/post_images/1/post_image.jpg', ContentFile(self.content))
+
+        self.assertEqual(name, 'images/cas/{}/{}.jpg'.format(self.digest[:2], self.digest))
+        with self.storage.open(name) as stored_file:
+            self.assertEqual(stored_file.read(), self.content)
+
+    def test_identicalFilesAreStoredOnce(self):
+        name1 = self.storage.save('a.jpg', ContentFile(self.content))
+        name2 = self.storage.save('b.jpg', ContentFile(self.content))
+
+        self.assertEqual(name1, name2)
+        self.assertEqual(len(os.listdir(os.path.dirname(self.storage.path(name1)))), 1)
+
+    def test_noTemporaryFileIsLeft(self):
+        self.storage.save('a.jpg', ContentFile(self.content))
+        self.storage.save('b.jpg', ContentFile(self.content))
+
+        for root in (MEDIA_ROOT, MEDIA_TEMP_ROOT):
+            self.assertEqual([name for _, _, names in os.walk(root)
+                              for name in names if name.startswith('.tmp-')], [])
+
+    def test_fileIsCopiedAcrossFileSystems(self):
+        with mock.patch('social_media.storage.os.replace', side_effect=replace_across_file_systems):
+            name = self.storage.save('a.jpg', ContentFile(self.content))
+
+        with self.storage.open(name) as stored_file:
+            self.assertEqual(stored_file.read(), self.content)
+        self.assertEqual(os.listdir(MEDIA_TEMP_ROOT), [])
+
+    def test_importFileWithLinkSharesTheFile(self):
+        os.makedirs(MEDIA_ROOT, exist_ok=True)
+        source_path = os.path.join(MEDIA_ROOT, 'source.jpg')
+        with open(source_path, 'wb') as source_file:
+            source_file.write(self.content)
+
+        name = self.storage.import_file(source_path, link=True)
+
+        self.assertEqual(name, get_content_name(self.digest, '.jpg'))
+        self.assertTrue(os.path.samefile(source_path, self.storage.path(name)))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, IMAGE_DERIVATIVE_SIZES=[96])
+class RehashMediaTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user1 = AppUserFactory.create()
+        self.post1 = PostFactory.create(owner=self.user1, image=None)
+        self.post2 = PostFactory.create(owner=self.user1, image=None)
+
+        # images stored at the fixed paths used before the content addressed storage
+        self.content = b'image content'
+        self.old_names = ['images/post_images/1/{}/post_image.jpg'.format(post.pk)
+                          for post in (self.post1, self.post2)]
+        for post, name in zip((self.post1, self.post2), self.old_names):
+            self.write_file(name, self.content)
+            self.write_file(get_derivative_name(name, 96), b'resized content')
+            Post.objects.filter(pk=post.pk).update(image=name)
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        Post.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+        PostFactory.reset_sequence(0)
+
+        # remove test image temp folders
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def write_file(self, name, content):
+        path = os.path.join(MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as output_file:
+            output_file.write(content)
+
+    def rehash_media(self, *args):
+        call_command('rehash_media', *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_rowsPointToContentNames(self):
+        self.rehash_media()
+
+        content_name = get_content_name(hashlib.sha256(self.content).hexdigest(), '.jpg')
+        self.assertEqual(list(Post.objects.values_list('image', flat=True).distinct()), [content_name])
+        self.assertTrue(os.path.samefile(
+            os.path.join(MEDIA_ROOT, self.old_names[0]), os.path.join(MEDIA_ROOT, content_name)))
+
+    def test_resizedCopiesAreLinked(self):
+        self.rehash_media()
+
+        post = Post.objects.get(pk=self.post1.pk)
+        self.assertTrue(post.image.storage.exists(get_derivative_name(post.image.name, 96)))
+
+    def test_defaultProfileImageIsKept(self):
+        self.rehash_media()
+
+        self.assertEqual(AppUser.objects.get(pk=self.user1.pk).profile_image.name,
+                         DEFAULT_PROFILE_IMAGE_PATH)
+
+    def test_deleteOriginals(self):
+        self.rehash_media('--delete-originals')
+
+        for name in self.old_names:
+            self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, name)))
+            self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, get_derivative_name(name, 96))))
+
+    def test_pendingJobFollowsTheImage(self):
+        ImageJob.objects.create(kind='post_image', object_id=self.post1.pk, name=self.old_names[0])
+
+        self.rehash_media()
+
+        self.assertEqual(ImageJob.objects.get().name, Post.objects.get(pk=self.post1.pk).image.name)
+
+    def test_pruneRemovesUnusedFiles(self):
+        self.rehash_media()
+        unused_name = ContentAddressedStorage().save('unused.jpg', ContentFile(b'unused'))
+
+        with mock.patch('social_media.management.commands.rehash_media.PRUNE_MIN_AGE', -60):
+            self.rehash_media('--prune')
+
+        post = Post.objects.get(pk=self.post1.pk)
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, unused_name)))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+        self.assertTrue(post.image.storage.exists(get_derivative_name(post.image.name, 96)))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
+class HashingFileUploadHandlerTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = b'image content' * 1000
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        Post.objects.all().delete()
+        ImageJob.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+
+        # remove test image temp folders
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def upload(self):
+        handler = HashingFileUploadHandler()
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file('image', 'image.jpg', 'image/jpeg', len(self.content))
+        for start in range(0, len(self.content), 4096):
+            handler.receive_data_chunk(self.content[start:start + 4096], start)
+        return handler.file_complete(len(self.content))
+
+    def get_temp_files(self, root=MEDIA_TEMP_ROOT):
+        return [name for _, _, names in os.walk(root) for name in names if name.startswith('.tmp-')]
+
+    def get_image(self):
+        image_io = BytesIO()
+        Image.new('RGB', (50, 50)).save(image_io, 'JPEG')
+        return image_io.getvalue()
+
+    def test_uploadIsHashedWhileReceived(self):
+        uploaded_file = self.upload()
+
+        # the file is received out of the served folder
+        self.assertEqual(len(self.get_temp_files()), 1)
+        self.assertEqual(self.get_temp_files(MEDIA_ROOT), [])
+
+        self.assertEqual(uploaded_file.sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(uploaded_file.read(), self.content)
+        uploaded_file.close()
+
+    def test_uploadIsRenamedIntoPlace(self):
+        uploaded_file = self.upload()
+        inode = os.stat(uploaded_file.temporary_file_path()).st_ino
+        storage = ContentAddressedStorage()
+
+        name = storage.save('image.jpg', uploaded_file)
+        uploaded_file.close()
+
+        self.assertEqual(name, get_content_name(uploaded_file.sha256, '.jpg'))
+        self.assertEqual(os.stat(storage.path(name)).st_ino, inode)
+        self.assertEqual(self.get_temp_files(), [])
+
+    def test_uploadIsCopiedAcrossFileSystems(self):
+        uploaded_file = self.upload()
+        storage = ContentAddressedStorage()
+
+        with mock.patch('social_media.storage.os.replace', side_effect=replace_across_file_systems):
+            name = storage.save('image.jpg', uploaded_file)
+        uploaded_file.close()
+
+        with storage.open(name) as stored_file:
+            self.assertEqual(stored_file.read(), self.content)
+        self.assertEqual(self.get_temp_files(), [])
+        self.assertEqual(self.get_temp_files(MEDIA_ROOT), [])
+
+    def test_duplicateUploadIsDropped(self):
+        storage = ContentAddressedStorage()
+        first_file = self.upload()
+        name = storage.save('image.jpg', first_file)
+        first_file.close()
+
+        second_file = self.upload()
+        self.assertEqual(storage.save('image.jpg', second_file), name)
+        second_file.close()
+
+        self.assertEqual(self.get_temp_files(), [])
+
+    def test_handlerIsNotInstalledForEveryView(self):
+        self.assertNotIn('social_media.uploads.HashingFileUploadHandler', settings.FILE_UPLOAD_HANDLERS)
+
+    def test_postImageUploadLeavesNoTemporaryFile(self):
+        user = AppUserFactory.create()
+        self.client.login(email=user.email, password='Asdf1234')
+        content = self.get_image()
+
+        with mock.patch.object(HashingFileUploadHandler, 'file_complete',
+                               autospec=True, side_effect=HashingFileUploadHandler.file_complete) as file_complete:
+            response = self.client.post(reverse('create_post'), {
+                'image': SimpleUploadedFile('image.jpg', content, content_type='image/jpeg')})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(file_complete.called)
+        post = Post.objects.get()
+        self.assertEqual(post.image.name, get_content_name(hashlib.sha256(content).hexdigest(), '.jpg'))
+        self.assertEqual(self.get_temp_files(), [])
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_defaultHandlersDoNotReceiveUpload(self):
+        user = AppUserFactory.create()
+        self.client.login(email=user.email, password='Asdf1234')
+
+        with mock.patch.object(TemporaryFileUploadHandler, 'new_file') as new_file:
+            response = self.client.post(reverse('create_post'), {
+                'image': SimpleUploadedFile('image.jpg', self.get_image(), content_type='image/jpeg')})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(new_file.called)
+
+    def test_profileImageUploadIsHashed(self):
+        user = AppUserFactory.create()
+        self.client.login(email=user.email, password='Asdf1234')
+        content = self.get_image()
+
+        with mock.patch.object(HashingFileUploadHandler, 'file_complete',
+                               autospec=True, side_effect=HashingFileUploadHandler.file_complete) as file_complete:
+            self.client.post(reverse('profile_update'), {
+                'email': user.email, 'username': user.username,
+                'profile_image': SimpleUploadedFile('image.jpg', content, content_type='image/jpeg')})
+
+        self.assertTrue(file_complete.called)
+        user.refresh_from_db()
+        self.assertEqual(user.profile_image.name, get_content_name(hashlib.sha256(content).hexdigest(), '.jpg'))
+        self.assertEqual(self.get_temp_files(), [])
+
+    def test_profileUpdateIsStillCsrfProtected(self):
+        user = AppUserFactory.create()
+        client = self.client_class(enforce_csrf_checks=True)
+        client.login(email=user.email, password='Asdf1234')
+
+        response = client.post(reverse('profile_update'), {
+            'profile_image': SimpleUploadedFile('image.jpg', self.get_image(), content_type='image/jpeg')})
+
+        self.assertEqual(response.status_code, 403)
@@ -1,16 +1,22 @@
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
 from django.test import TestCase, override_settings
 from django.urls import reverse
 import tempfile
 import shutil
 
 from ..model_factories import *
+from ..storage import ContentAddressedStorage
+from ..images import get_image_sizes
 
 USER_PASSWORD = 'Asdf1234'
 MEDIA_ROOT = tempfile.mkdtemp()
+MEDIA_TEMP_ROOT = tempfile.mkdtemp()
 TEST_SERVER_DOMAIN = 'http://testserver'
 
 
-@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT)
 class IndexViewTest(TestCase):
     def setUp(self):
         super().setUp()
@@ -40,6 +46,7 @@ class IndexViewTest(TestCase):
 
         # remove test image temp folder
         shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
 
     def test_redirectIfNotLoggedIn(self):
         # log user1 out
@@ -73,9 +80,25 @@ class IndexViewTest(TestCase):
             'owner_profile_image_path': self.post1.owner.profile_image.url,
             'post_text': self.post1.text,
             'post_image_path': self.post1.image.url,
+            'post_image_width': self.post1.image_width,
+            'post_image_height': self.post1.image_height,
+            'post_image_color': self.post1.image_color,
+            'post_image_placeholder': self.post1.image_placeholder,
+            'post_image_srcset': '',
+            'post_image_webp_srcset': '',
+            'post_image_sizes': get_image_sizes(self.post1.image_width, self.post1.image_height),
             'post_date_created': self.post1.date_created
         }])
 
+    @override_settings(FEED_PAGE_SIZE=2)
+    def test_loggedInReturnFirstPageOfPosts(self):
+        PostFactory.create_batch(2, owner=self.user1)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(len(response.context['posts']), 2)
+        self.assertIsNotNone(response.context['next_cursor'])
+
 
 class UserLoginViewTest(TestCase):
     def setUp(self):
@@ -327,6 +350,17 @@ class ProfileViewTest(TestCase):
         self.assertEqual(response.context['is_own_profile'], False)
         self.assertEqual(response.context['is_authenticated'], False)
 
+    def test_loggedInReturnMutualFriendCount(self):
+        user3 = AppUserFactory.create()
+        UserRelationshipFactory.create(user1=self.user1, user2=user3, relation_type='friends')
+        UserRelationshipFactory.create(user1=self.user2, user2=user3, relation_type='friends')
+        self.client.login(email=self.user1.email, password=USER_PASSWORD)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.context['mutual_friend_count'], 1)
+        self.assertContains(response, '1 mutual friend<')
+
 
 class SearchUserViewTest(TestCase):
     def setUp(self):
@@ -387,6 +421,34 @@ class SearchUserViewTest(TestCase):
         # 7 users - self - 5 = 1 left
         self.assertEqual(len(response.context['paginated_results']), 1)
 
+    def test_resultsHaveMutualFriendCount(self):
+        # user1 is logged in
+        user0, user1, user2 = AppUser.objects.order_by('pk')[:3]
+        UserRelationshipFactory.create(user1=user0, user2=user1, relation_type='friends')
+        UserRelationshipFactory.create(user1=user0, user2=user2, relation_type='friends')
+
+        response = self.client.get(self.url + '?query=user')
+
+        counts = {result['username']: result['mutual_friend_count']
+                  for result in response.context['paginated_results']}
+        self.assertEqual(counts[user2.username], 1)
+        self.assertEqual(counts[user0.username], 0)
+
+    def test_resultsHaveRelationType(self):
+        # user1 is logged in
+        user0, user1, user2, user3 = AppUser.objects.order_by('pk')[:4]
+        UserRelationshipFactory.create(user1=user0, user2=user1, relation_type='friends')
+        UserRelationshipFactory.create(user1=user1, user2=user2, relation_type='pending_user2_user1')
+
+        response = self.client.get(self.url + '?query=user')
+
+        relation_types = {result['username']: result['relation_type']
+                          for result in response.context['paginated_results']}
+        self.assertEqual(relation_types[user0.username], 'friends')
+        self.assertEqual(relation_types[user2.username], 'receiver')
+        self.assertEqual(relation_types[user3.username], 'not_friend')
+        self.assertContains(response, 'acceptFriendRequest(\'{}\')'.format(user2.pk))
+
 
 class ProfileUpdateViewTest(TestCase):
     def setUp(self):
@@ -528,6 +590,25 @@ class FriendListViewTest(TestCase):
             'profile_image_url': self.user2.profile_image.url,
             'username': self.user2.username,
         }])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(response.context['initials'], [(self.user2.username[0], 1)])
+
+    @override_settings(FRIEND_LIST_PAGE_SIZE=1)
+    def test_cursorReturnNextPage(self):
+        user3 = AppUserFactory.create()
+        UserRelationshipFactory.create(
+            user1=self.user1, user2=user3, relation_type='friends')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual([friend['id'] for friend in response.context['friends']], [self.user2.pk])
+        self.assertEqual(response.context['next_cursor'], self.user2.username)
+        self.assertEqual(response.context['initials'], [(self.user2.username[0], 2)])
+
+        response = self.client.get(self.url, {'cursor': response.context['next_cursor']})
+
+        self.assertEqual([friend['id'] for friend in response.context['friends']], [user3.pk])
+        self.assertIsNone(response.context['next_cursor'])
 
 
 class FriendRequestsListViewTest(TestCase):
@@ -585,3 +666,61 @@ class FriendRequestsListViewTest(TestCase):
             'profile_image_url': self.user2.profile_image.url,
             'username': self.user2.username,
         }])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_TEMP_ROOT=MEDIA_TEMP_ROOT, ROOT_URLCONF='social_media.tests.urls')
+class ServeMediaViewTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = ContentAddressedStorage()
+        self.content_name = self.storage.save(
+            'image.jpg', ContentFile(b'image content'))
+        FileSystemStorage().save(
+            'images/default_images/default.png', ContentFile(b'default content'))
+
+    def tearDown(self):
+        super().tearDown()
+        AppUser.objects.all().delete()
+        ImageJob.objects.all().delete()
+        AppUserFactory.reset_sequence(0)
+
+        # remove test image temp folder
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(MEDIA_TEMP_ROOT, ignore_errors=True)
+
+    def test_contentAddressedFileIsCachedForGood(self):
+        response = self.client.get(settings.MEDIA_URL + self.content_name)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'image content')
+        self.assertEqual(response['Cache-Control'], 'public, max-age={}, immutable'.format(
+            settings.MEDIA_CACHE_MAX_AGE))
+
+    def test_otherFileIsRevalidated(self):
+        response = self.client.get(
+            settings.MEDIA_URL + 'images/default_images/default.png')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+    @override_settings(ROOT_URLCONF='endterm_application.urls')
+    def test_mediaIsNotServedWithoutDebug(self):
+        # the tests run with DEBUG off
+        response = self.client.get(settings.MEDIA_URL + self.content_name)
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_missingFileReturn404(self):
+        response = self.client.get(settings.MEDIA_URL + 'images/cas/00/missing.jpg')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_profileImageUrlChangesWithTheImage(self):
+        user = AppUserFactory.create()
+        user.profile_image = ContentFile(b'first image', name='profile_image.jpg')
+        user.save()
+        first_url = user.profile_image.url
+        user.profile_image = ContentFile(b'second image', name='profile_image.jpg')
+        user.save()
+
+        self.assertNotEqual(user.profile_image.url, first_url)
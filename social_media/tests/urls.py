@@ -0,0 +1,4 @@
+from endterm_application.urls import urlpatterns as project_urlpatterns, media_urlpatterns
+
+# the project urls with the media route, which is only added when DEBUG is on
+urlpatterns = project_urlpatterns + media_urlpatterns
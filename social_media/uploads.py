@@ -0,0 +1,90 @@
+import hashlib
+import os
+import tempfile
+from functools import wraps
+
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .storage import ContentAddressedStorage
+
+
+class HashedUploadedFile(UploadedFile):
+    '''
+    Uploaded file written next to the stored files, with the SHA-256 hash of its content
+    '''
+
+    def __init__(self, file, name, content_type, size, charset, content_type_extra, sha256):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        finally:
+            # the file is gone already when the storage has renamed it into place
+            try:
+                os.remove(self.file.name)
+            except FileNotFoundError:
+                pass
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    '''
+    Upload handler that streams the uploaded files to the temporary folder of ContentAddressedStorage
+    and hashes them on the fly, so saving them is a rename instead of a second copy.
+    It is only installed by the views that receive images, with hashing_uploads.
+    '''
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.file = tempfile.NamedTemporaryFile(
+            dir=ContentAddressedStorage().get_temp_directory(), prefix='.tmp-', delete=False)
+        # the default handlers would write a second, unused copy of the file
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        return HashedUploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=self.digest.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
+            try:
+                os.remove(self.file.name)
+            except FileNotFoundError:
+                pass
+
+
+def hashing_uploads(view):
+    '''
+    Decorator of a view that receives images stored by ContentAddressedStorage, so its uploads
+    go through HashingFileUploadHandler. The CSRF check reads the request body, so it is run
+    after the handler is installed.
+    '''
+    protected_view = csrf_protect(view)
+
+    @wraps(view)
+    @csrf_exempt
+    def wrapped_view(request, *args, **kwargs):
+        request.upload_handlers.insert(0, HashingFileUploadHandler(request))
+        return protected_view(request, *args, **kwargs)
+
+    return wrapped_view
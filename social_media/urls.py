@@ -19,6 +19,11 @@ from .apis import (FriendList,
                    RemoveFriend,
                    CreatePost,
                    UserPostList,
+                   MutualFriendList,
+                   FriendRecommendationList,
+                   RelationshipStatusList,
+                   FeedList,
+                   NewFeedPostList,
                    UserDetail)
 
 urlpatterns = [
@@ -47,6 +52,14 @@ urlpatterns = [
     path('api/post/create/', CreatePost.as_view(), name='create_post'),
     path('api/user/<str:username>/posts/',
          UserPostList.as_view(), name='user_posts'),
+    path('api/user/<str:username>/mutual_friends/',
+         MutualFriendList.as_view(), name='mutual_friends'),
+    path('api/recommendations/', FriendRecommendationList.as_view(),
+         name='friend_recommendations'),
+    path('api/relationships/', RelationshipStatusList.as_view(),
+         name='relationship_statuses'),
+    path('api/feed/', FeedList.as_view(), name='feed'),
+    path('api/feed/new/', NewFeedPostList.as_view(), name='new_feed_posts'),
 
     ###### NOT USED #########
     path('api/user/<str:username>/friends/',
@@ -1,14 +1,23 @@
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.shortcuts import render, redirect
 from django.http import Http404
+from django.conf import settings
+from django.views.static import serve
 from django.contrib.auth import login, authenticate, logout, update_session_auth_hash
 from django.views.decorators.cache import never_cache
 from django.db.models import Q
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth.decorators import login_required
 
-from .models import AppUser, UserRelationship, Post
+from .models import AppUser, UserRelationship
 from .forms import RegistrationForm, LoginForm, ProfileUpdateForm
+from .feed import get_feed_page, get_post_data, get_latest_cursor
+from .graph import get_mutual_friend_ids, get_mutual_friend_ids_by_user
+from .images import get_derivative_url, AVATAR_SIZE, AVATAR_BIG_SIZE
+from .recommendations import get_recommendations, get_recommendation_data, WIDGET_SIZE
+from .relationships import get_relationship_status, get_relationship_statuses, get_friend_page, get_friend_initials
+from .media_server import get_cache_control
+from .uploads import hashing_uploads
 
 
 @login_required(login_url='/login/')
@@ -18,31 +27,18 @@ def index(request):
     '''
     app_user = request.user
 
-    # get all friends relationships with the app_user
-    relationships = UserRelationship.objects.filter(
-        Q(user1=app_user) | Q(user2=app_user), relation_type='friends')
-
-    # get a list of users where their post will be displayed
-    post_users = [app_user]
-    for relationship in relationships:
-        if relationship.user1.pk == app_user.pk:
-            post_users.append(relationship.user2)
-        else:
-            post_users.append(relationship.user1)
-
-    # retrieve a list of posts
-    posts = Post.objects.filter(owner__in=post_users).order_by('-date_created')
-    post_list = []
-    for post in posts:
-        post_list.append({
-            'owner_username': post.owner.username,
-            'owner_profile_image_path': post.owner.profile_image.url,
-            'post_text': post.text,
-            'post_image_path': None if post.image == '' else post.image.url,
-            'post_date_created': post.date_created
-        })
-
-    return render(request, 'social_media/index.html', {'posts': post_list})
+    # read the first page of posts from the app user's materialized timeline
+    posts, next_cursor = get_feed_page(app_user)
+    post_list = [get_post_data(post) for post in posts]
+
+    return render(request, 'social_media/index.html', {
+        'posts': post_list,
+        'next_cursor': next_cursor,
+        'latest_cursor': get_latest_cursor(posts),
+        # precomputed by the compute_friend_recommendations command
+        'recommendations': [get_recommendation_data(recommendation)
+                            for recommendation in get_recommendations(app_user, WIDGET_SIZE)]
+    })
 
 
 @never_cache
@@ -163,7 +159,8 @@ def profile(request, username):
     context['id'] = requested_user.pk
     context['username'] = requested_user.username
     context['email'] = requested_user.email
-    context['profile_image_url'] = requested_user.profile_image.url
+    context['profile_image_url'] = get_derivative_url(
+        requested_user.profile_image, AVATAR_BIG_SIZE)
     context['is_own_profile'] = False
     context['is_authenticated'] = False
 
@@ -174,28 +171,15 @@ def profile(request, username):
         context['is_own_profile'] = app_user.pk == requested_user.pk
 
         # get the relationship between the logged in user and the requested user
-        try:
-            relationship = None
-            # make sure user1 id is less then user2 id before query
-            if app_user.pk < requested_user.pk:
-                relationship = UserRelationship.objects.get(
-                    user1=app_user.pk, user2=requested_user.pk)
-                context['relation_type'] = 'sender' if relationship.relation_type == 'pending_user1_user2' else 'receiver'
-            else:
-                relationship = UserRelationship.objects.get(
-                    user1=requested_user.pk, user2=app_user.pk)
-                context['relation_type'] = 'sender' if relationship.relation_type == 'pending_user2_user1' else 'receiver'
-
-            context['is_friend'] = relationship.relation_type == 'friends'
-
-            # overwrite relation_type to 'friends' if they are friends
-            if context['is_friend']:
-                context['relation_type'] = 'friends'
-
-        except UserRelationship.DoesNotExist:
-            # if no UserRelationship record found, means they are not friend
-            context['is_friend'] = False
-            context['relation_type'] = 'not_friend'
+        context['relation_type'] = get_relationship_status(app_user.pk, requested_user.pk)
+        context['is_friend'] = context['relation_type'] == 'friends'
+
+        if context['is_own_profile']:
+            context['recommendations'] = [get_recommendation_data(recommendation)
+                                          for recommendation in get_recommendations(app_user, WIDGET_SIZE)]
+        else:
+            context['mutual_friend_count'] = len(
+                get_mutual_friend_ids(app_user.pk, requested_user.pk))
 
     return render(request, 'social_media/profile.html', context)
 
@@ -223,7 +207,7 @@ def search_user(request):
             for user in user_results:
                 results.append({
                     'id': user.pk,
-                    'profile_image_url': user.profile_image.url,
+                    'profile_image_url': get_derivative_url(user.profile_image, AVATAR_SIZE),
                     'username': user.username
                 })
 
@@ -239,6 +223,15 @@ def search_user(request):
                 # return the last page if page number is out of range
                 paginated_results = paginator.page(paginator.num_pages)
 
+            # only the users shown on the page get their number of mutual friends and
+            # their relationship with the logged in user, which decides the action buttons
+            page_user_ids = [result['id'] for result in paginated_results]
+            mutual_friend_ids = get_mutual_friend_ids_by_user(app_user.pk, page_user_ids)
+            relation_types = get_relationship_statuses(app_user.pk, page_user_ids)
+            for result in paginated_results:
+                result['mutual_friend_count'] = len(mutual_friend_ids[result['id']])
+                result['relation_type'] = relation_types[result['id']]
+
             context['paginated_results'] = paginated_results
             context['query'] = search_input
         else:
@@ -248,6 +241,7 @@ def search_user(request):
 
 
 @login_required(login_url='/login/')
+@hashing_uploads
 def profile_update(request):
     '''
     Update profile detail page
@@ -286,30 +280,22 @@ def friend_list(request, username):
     except AppUser.DoesNotExist:
         raise Http404
 
-    # get a list of requested user's friends
+    # get a page of requested user's friends, sorted by their username
     context = {}
     friends = []
-    relationships = UserRelationship.objects.filter(
-        Q(user1=requested_user) | Q(user2=requested_user), relation_type='friends')
-
-    for relationship in relationships:
-        if requested_user.pk == relationship.user1.pk:
-            friends.append({
-                'id': relationship.user2.pk,
-                'profile_image_url': relationship.user2.profile_image.url,
-                'username': relationship.user2.username,
-            })
-        else:
-            friends.append({
-                'id': relationship.user1.pk,
-                'profile_image_url': relationship.user1.profile_image.url,
-                'username': relationship.user1.username,
-            })
-
-    # sort the list of friends by their username
-    friends.sort(key=lambda x: x.get('username'))
+    page, next_cursor = get_friend_page(
+        requested_user.pk, cursor=request.GET.get('cursor'), start=request.GET.get('from'))
+    for friend in page:
+        friends.append({
+            'id': friend.pk,
+            'profile_image_url': get_derivative_url(friend.profile_image, AVATAR_SIZE),
+            'username': friend.username,
+        })
 
     context['friends'] = friends
+    context['next_cursor'] = next_cursor
+    # the first characters of the usernames, to jump to the friends whose username starts with one
+    context['initials'] = get_friend_initials(requested_user.pk)
     context['is_own'] = app_user.pk == requested_user.pk
     context['requested_user_username'] = requested_user.username
 
@@ -334,14 +320,25 @@ def friend_requests_list(request):
         if app_user.pk == relationship.user1.pk:
             friend_requests.append({
                 'id': relationship.user2.pk,
-                'profile_image_url': relationship.user2.profile_image.url,
+                'profile_image_url': get_derivative_url(relationship.user2.profile_image, AVATAR_SIZE),
                 'username': relationship.user2.username,
             })
         else:
             friend_requests.append({
                 'id': relationship.user1.pk,
-                'profile_image_url': relationship.user1.profile_image.url,
+                'profile_image_url': get_derivative_url(relationship.user1.profile_image, AVATAR_SIZE),
                 'username': relationship.user1.username,
             })
 
     return render(request, 'social_media/friend_request_list.html', {'friend_requests': friend_requests})
+
+
+def serve_media(request, path):
+    '''
+    Serve an uploaded file with its Cache-Control header during development (DEBUG only),
+    when the requests do not go through StaticFilesApp (e.g. runserver under WSGI)
+    '''
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = get_cache_control(path)
+
+    return response